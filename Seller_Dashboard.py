@@ -1,46 +1,122 @@
 # streamlit_app.py
 import io
+import json
 import os
 import time
-import folium
-from streamlit_folium import st_folium
 from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import TYPE_CHECKING
 from zoneinfo import ZoneInfo
-import json
-import plotly.express as px
 import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
+from pandas.api.types import union_categoricals
 import requests
 import streamlit as st
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT
-from reportlab.graphics.shapes import Drawing
-from reportlab.graphics.charts.barcharts import VerticalBarChart
-from reportlab.graphics.charts.linecharts import HorizontalLineChart
-import tempfile
+import analytics
+import day_cache
+import figures
+import geo_assets
+import live_week
+import metabase_cards
+import perf
+import products
+import query_cache
+import query_metrics
+import region_cube
+import report_cache
+import shared_cache
+import sku_search
+
+# Ciężkie zależności (reportlab, plotly, folium, openpyxl) importowane leniwie w funkcjach, które ich używają —
+# zimny start i import modułu (batch_reports.py) nie płacą za stos PDF / mapy / Excela.
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
 
 # ─────────────────────────────────────────────────────────────
 # 1) Konfiguracja aplikacji
 # ─────────────────────────────────────────────────────────────
-st.set_page_config(page_title="Sprzedaż: WoW TOP — Rozszerzone", layout="wide")
-st.title("🛒 Sprzedaż — Trendy i TOP N")
+# `streamlit run` wykonuje skrypt jako __main__; import modułu (batch_reports.py) pomija część UI
+if __name__ == "__main__":
+    st.set_page_config(page_title="Sprzedaż: WoW TOP — Rozszerzone", layout="wide")
+    st.title("🛒 Sprzedaż — Trendy i TOP N")
 
 TZ = ZoneInfo("Europe/Warsaw")
 
+# Pomiar czasu etapów tego reruna (panel QA / Debug)
+run_timer = perf.begin_run()
+
 # ─────────────────────────────────────────────────────────────
 # 2) Ustawienia Metabase
 # ─────────────────────────────────────────────────────────────
-METABASE_URL = "https://metabase.emamas.ideaerp.pl"
-METABASE_DATABASE_ID = int(st.secrets.get("metabase_database_id", 2))
-METABASE_USER = st.secrets["metabase_user"]
-METABASE_PASSWORD = st.secrets["metabase_password"]
+def _secret(key: str, default=None):
+    """st.secrets, a gdy brak secrets.toml (np. batch poza `streamlit run`) — zmienna środowiskowa KEY."""
+    try:
+        if key in st.secrets:
+            return st.secrets[key]
+    except Exception:
+        pass
+    return os.environ.get(key.upper(), default)
+
+
+METABASE_URL = _secret("metabase_url", "https://metabase.emamas.ideaerp.pl")
+METABASE_DATABASE_ID = int(_secret("metabase_database_id", 2))
+METABASE_USER = _secret("metabase_user")
+METABASE_PASSWORD = _secret("metabase_password")
+
+# Cache raportów kadrowych (PDF) na dysku — wspólny dla procesów/replik z tym samym katalogiem; obiekt raz na
+# proces (st.cache_resource), bo skrypt wykonuje się przy każdym rerunie, a liczniki w panelu QA są per proces
+@st.cache_resource
+def _pdf_cache(directory: str, max_age_s: float, max_bytes: int) -> report_cache.ReportCache:
+    return report_cache.ReportCache(directory, max_age_s=max_age_s, max_bytes=max_bytes)
+
+
+PDF_CACHE = _pdf_cache(
+    _secret("report_cache_dir") or os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "reports"),
+    max_age_s=float(_secret("report_cache_max_age_days") or 30) * 86400,
+    max_bytes=int(float(_secret("report_cache_max_mb") or 256) * 1024 * 1024),
+)
+# Wersja układu raportu w odcisku cache — podbić przy zmianie generate_executive_pdf_report / pdf_tables,
+# inaczej PDF-y starego układu zostają na dysku do max_age_s
+REPORT_VERSION = 1
+
+# Cache wyników zapytań: budżet pamięci procesu (MB), eviction wg rozmiaru, trafień i kosztu pobrania;
+# shared_cache_url (redis://… albo katalog na wspólnym wolumenie) — wyniki i token sesji wspólne dla replik
+# (token jawnym tekstem w backendzie — dostęp tylko dla aplikacji, zob. shared_cache.py)
+# Backend raz na proces: nowy przy każdym rerunie to nowa pula połączeń Redis i licznik zapisów katalogu
+# od zera (prune co 100 zapisów nigdy by nie ruszył)
+@st.cache_resource
+def _shared_backend(url: str | None):
+    return shared_cache.from_url(url)
+
+
+query_cache.configure(
+    max_bytes=int(float(_secret("query_cache_mb") or 512) * 1024 * 1024),
+    shared=_shared_backend(_secret("shared_cache_url")),
+)
+
+# Tryb wykonania: "card" — szablony SQL_* jako zapisane pytania Metabase (cache wyników i planów po stronie
+# Metabase, ID kart zarządzane automatycznie); "dataset" — zapytania ad-hoc jak dotąd. Rejestr raz na proces —
+# lista kart, ID i backoff po błędzie (RETRY_AFTER_S) przeżywają reruny
+@st.cache_resource
+def _card_registry(base_url: str, database_id: int, collection_id: int | None, cache_ttl_h: int | None,
+                   _shared) -> metabase_cards.CardRegistry:
+    return metabase_cards.CardRegistry(base_url, database_id, collection_id=collection_id, shared=_shared,
+                                       cache_ttl_h=cache_ttl_h)
+
+
+CARDS = (_card_registry(
+    METABASE_URL, METABASE_DATABASE_ID,
+    int(_secret("metabase_card_collection_id") or 0) or None,
+    int(_secret("metabase_card_cache_ttl_h") or 0) or None,
+    query_cache.SHARED,
+) if str(_secret("metabase_exec_mode", "dataset")).lower() == "card" else None)
+
+# Metryki zapytań: plik dla node_exporter (textfile collector) i/lub endpoint /metrics na osobnym porcie —
+# endpoint tylko w aplikacji (`streamlit run`), nie przy imporcie z batch_reports.py i jego procesów puli
+query_metrics.configure(
+    textfile=_secret("metrics_textfile"),
+    port=int(_secret("metrics_port") or 0) if __name__ == "__main__" else None,
+)
 
 # ─────────────────────────────────────────────────────────────
 # 3) SQL — snapshoty WoW (po jednym na platformę)
@@ -103,70 +179,44 @@ ZIP_TO_REGION = {
     "76": "Zachodniopomorskie", "77": "Zachodniopomorskie", "78": "Zachodniopomorskie",
 }
 
-SQL_WOW_POLAND_REGION_ONLY = """
-WITH params AS (
-  SELECT
-    {{week_start}}::date AS week_start,
-    ({{week_start}}::date + INTERVAL '7 day') AS week_end
-),
-lines AS (
-  SELECT
-    SUBSTRING(sh.receiver_zip FROM 1 FOR 2) AS zip_prefix,
-    SUM(COALESCE(l.price_total, l.price_subtotal, l.price_unit * COALESCE(l.product_uom_qty,0), 0)) AS revenue
-  FROM sale_order_line l
-  JOIN sale_order s ON s.id = l.order_id
-  JOIN res_currency cur ON cur.id = l.currency_id
-  LEFT JOIN shipping_order sh ON sh.sale_order_id = s.id
-  WHERE s.state IN ('sale','done')
-    AND cur.name = 'PLN'
-    AND s.name ILIKE '%Allegro%'
-    AND s.name LIKE '%-1'
-    AND (s.confirm_date AT TIME ZONE 'Europe/Warsaw') >= (SELECT week_start FROM params)
-    AND (s.confirm_date AT TIME ZONE 'Europe/Warsaw') < (SELECT week_end FROM params)
-    AND sh.receiver_zip IS NOT NULL
-  GROUP BY zip_prefix
-)
-SELECT * FROM lines WHERE revenue > 0 ORDER BY zip_prefix;
-"""
 
-SQL_WOW_POLAND_TOP_PRODUCTS = """
+# Mapa: tydzień × prefiks ZIP × SKU dla `weeks` tygodni kończących się na week_start (pobierane jako CSV)
+SQL_POLAND_ZIP_WEEKS = """
 WITH params AS (
   SELECT
-    {{week_start}}::date AS week_start,
-    ({{week_start}}::date + INTERVAL '7 day') AS week_end
+    ({{week_start}}::date - ({{weeks}} - 1) * INTERVAL '1 week') AS range_start,
+    ({{week_start}}::date + INTERVAL '7 day') AS range_end
 ),
 lines AS (
   SELECT
+    date_trunc('week', s.confirm_date AT TIME ZONE 'Europe/Warsaw')::date AS week_start,
     SUBSTRING(sh.receiver_zip FROM 1 FOR 2) AS zip_prefix,
     COALESCE(pp.default_code, l.product_id::text) AS sku,
-    COALESCE(pt.name, l.name) AS product_name,
-    SUM(COALESCE(l.price_total, l.price_subtotal, l.price_unit * COALESCE(l.product_uom_qty,0), 0)) AS revenue
+    COALESCE(l.price_total, l.price_subtotal,
+             l.price_unit * COALESCE(l.product_uom_qty,0), 0) AS line_total
   FROM sale_order_line l
   JOIN sale_order s ON s.id = l.order_id
   JOIN res_currency cur ON cur.id = l.currency_id
   LEFT JOIN shipping_order sh ON sh.sale_order_id = s.id
   LEFT JOIN product_product pp ON pp.id = l.product_id
-  LEFT JOIN product_template pt ON pt.id = pp.product_tmpl_id
   WHERE s.state IN ('sale','done')
     AND cur.name = 'PLN'
     AND s.name ILIKE '%Allegro%'
     AND s.name LIKE '%-1'
-    AND (s.confirm_date AT TIME ZONE 'Europe/Warsaw') >= (SELECT week_start FROM params)
-    AND (s.confirm_date AT TIME ZONE 'Europe/Warsaw') < (SELECT week_end FROM params)
+    AND (s.confirm_date AT TIME ZONE 'Europe/Warsaw') >= (SELECT range_start FROM params)
+    AND (s.confirm_date AT TIME ZONE 'Europe/Warsaw') < (SELECT range_end FROM params)
     AND sh.receiver_zip IS NOT NULL
-  GROUP BY zip_prefix, sku, product_name
-),
-ranked AS (
-  SELECT 
-    *,
-    ROW_NUMBER() OVER (PARTITION BY zip_prefix ORDER BY revenue DESC) AS rn
-  FROM lines
 )
-SELECT zip_prefix, sku, product_name, revenue
-FROM ranked
-WHERE rn <= 10
-ORDER BY zip_prefix, revenue DESC;
+SELECT
+  week_start,
+  zip_prefix,
+  sku,
+  SUM(line_total) AS revenue
+FROM lines
+GROUP BY week_start, zip_prefix, sku
+ORDER BY week_start, zip_prefix, revenue DESC;
 """
+
 SQL_WOW_ALLEGRO_PLN = """
 WITH params AS (
   SELECT
@@ -179,7 +229,6 @@ lines AS (
   SELECT
     l.product_id,
     COALESCE(pp.default_code, l.product_id::text) AS sku,
-    COALESCE(pt.name, l.name) AS product_name,
     COALESCE(l.product_uom_qty, 0) AS qty,
     COALESCE(l.price_total, l.price_subtotal,
              l.price_unit * COALESCE(l.product_uom_qty,0), 0) AS line_total,
@@ -188,7 +237,6 @@ lines AS (
   JOIN sale_order s           ON s.id = l.order_id
   JOIN res_currency cur       ON cur.id = l.currency_id
   LEFT JOIN product_product  pp ON pp.id = l.product_id
-  LEFT JOIN product_template pt ON pt.id = pp.product_tmpl_id
   WHERE s.state IN ('sale','done')
     AND cur.name = 'PLN'
     AND s.name ILIKE '%Allegro%'
@@ -200,7 +248,6 @@ w AS (
 curr AS (
   SELECT
     l.sku,
-    MAX(l.product_name) AS product_name,
     SUM(l.line_total) AS curr_rev,
     SUM(l.qty)        AS curr_qty
   FROM lines l CROSS JOIN w
@@ -220,7 +267,6 @@ prev AS (
 )
 SELECT
   c.sku,
-  c.product_name,
   COALESCE(c.curr_rev,0) AS curr_rev,
   COALESCE(c.curr_qty,0) AS curr_qty,
   COALESCE(p.prev_rev,0) AS prev_rev,
@@ -248,7 +294,6 @@ lines AS (
   SELECT
     l.product_id,
     COALESCE(pp.default_code, l.product_id::text) AS sku,
-    COALESCE(pt.name, l.name) AS product_name,
     COALESCE(l.product_uom_qty, 0) AS qty,
     COALESCE(l.price_total, l.price_subtotal,
              l.price_unit * COALESCE(l.product_uom_qty,0), 0) AS line_total,
@@ -257,7 +302,6 @@ lines AS (
   JOIN sale_order s           ON s.id = l.order_id
   JOIN res_currency cur       ON cur.id = l.currency_id
   LEFT JOIN product_product  pp ON pp.id = l.product_id
-  LEFT JOIN product_template pt ON pt.id = pp.product_tmpl_id
   WHERE s.state IN ('sale','done')
     AND cur.name = 'EUR'
     AND s.name ILIKE '%eBay%'
@@ -268,7 +312,6 @@ w AS (
 curr AS (
   SELECT
     l.sku,
-    MAX(l.product_name) AS product_name,
     SUM(l.line_total) AS curr_rev,
     SUM(l.qty)        AS curr_qty
   FROM lines l CROSS JOIN w
@@ -288,7 +331,6 @@ prev AS (
 )
 SELECT
   c.sku,
-  c.product_name,
   COALESCE(c.curr_rev,0) AS curr_rev,
   COALESCE(c.curr_qty,0) AS curr_qty,
   COALESCE(p.prev_rev,0) AS prev_rev,
@@ -316,7 +358,6 @@ lines AS (
   SELECT
     l.product_id,
     COALESCE(pp.default_code, l.product_id::text) AS sku,
-    COALESCE(pt.name, l.name) AS product_name,
     COALESCE(l.product_uom_qty, 0) AS qty,
     COALESCE(l.price_total, l.price_subtotal,
              l.price_unit * COALESCE(l.product_uom_qty,0), 0) AS line_total,
@@ -325,7 +366,6 @@ lines AS (
   JOIN sale_order s           ON s.id = l.order_id
   JOIN res_currency cur       ON cur.id = l.currency_id
   LEFT JOIN product_product  pp ON pp.id = l.product_id
-  LEFT JOIN product_template pt ON pt.id = pp.product_tmpl_id
   WHERE s.state IN ('sale','done')
     AND cur.name = 'EUR'
     AND s.name ILIKE '%Kaufland%'
@@ -336,7 +376,6 @@ w AS (
 curr AS (
   SELECT
     l.sku,
-    MAX(l.product_name) AS product_name,
     SUM(l.line_total) AS curr_rev,
     SUM(l.qty)        AS curr_qty
   FROM lines l CROSS JOIN w
@@ -356,7 +395,6 @@ prev AS (
 )
 SELECT
   c.sku,
-  c.product_name,
   COALESCE(c.curr_rev,0) AS curr_rev,
   COALESCE(c.curr_qty,0) AS curr_qty,
   COALESCE(p.prev_rev,0) AS prev_rev,
@@ -457,22 +495,381 @@ SELECT
 FROM orders_raw, params p;
 """
 
+# ─────────────────────────────────────────────────────────────
+# 3b) SQL — linie zamówień bieżącego i poprzedniego tygodnia (tryb na żywo, live_week.py)
+# ─────────────────────────────────────────────────────────────
+# {{since}} = watermark (epoch, czas zmiany write_date w UTC jak w Odoo); 0 = pełne pobranie. Filtr platformy po
+# nazwie zamówienia w WHERE, stan i waluta w `valid` — linie anulowanych zamówień wracają jako valid = false
+# i są usuwane ze stanu zamiast zostać w nim ze starą wartością. Filtr zmian jako OR na gołych kolumnach
+# write_date (nie GREATEST(...)) — planer może użyć indeksów na sale_order_line/sale_order.write_date (BitmapOr)
+# zamiast skanować całą historię platformy przy każdym przyrostowym odświeżeniu.
+SQL_LIVE_LINES_ALLEGRO_PLN = """
+WITH params AS (
+  SELECT
+    {{week_start}}::date AS week_start,
+    ({{week_start}}::date + INTERVAL '7 day') AS week_end,
+    ({{week_start}}::date - INTERVAL '7 day') AS prev_start,
+    to_timestamp({{since}}) AT TIME ZONE 'UTC' AS since
+),
+lines AS (
+  SELECT
+    l.id AS line_id,
+    s.id AS order_id,
+    COALESCE(pp.default_code, l.product_id::text) AS sku,
+    COALESCE(l.product_uom_qty, 0) AS qty,
+    COALESCE(l.price_total, l.price_subtotal,
+             l.price_unit * COALESCE(l.product_uom_qty,0), 0) AS line_total,
+    COALESCE(s.confirm_date, s.date_order, s.create_date) AS order_ts,
+    (s.state IN ('sale','done') AND cur.name = 'PLN') AS valid,
+    GREATEST(l.write_date, s.write_date) AS changed_ts
+  FROM sale_order_line l
+  JOIN sale_order s           ON s.id = l.order_id
+  JOIN res_currency cur       ON cur.id = l.currency_id
+  LEFT JOIN product_product  pp ON pp.id = l.product_id
+  CROSS JOIN params p
+  WHERE s.name ILIKE '%Allegro%'
+    AND s.name LIKE '%-1'
+    AND (l.write_date > p.since OR s.write_date > p.since)
+)
+SELECT
+  l.line_id,
+  l.order_id,
+  l.sku,
+  l.qty,
+  l.line_total,
+  EXTRACT(EPOCH FROM l.order_ts) AS order_epoch,  -- naiwny UTC z Odoo, jak changed_at (porównanie z time.time())
+  (l.order_ts AT TIME ZONE 'Europe/Warsaw') >= p.week_start AS is_curr,
+  l.valid,
+  EXTRACT(EPOCH FROM l.changed_ts) AS changed_at
+FROM lines l CROSS JOIN params p
+WHERE (l.order_ts AT TIME ZONE 'Europe/Warsaw') >= p.prev_start
+  AND (l.order_ts AT TIME ZONE 'Europe/Warsaw') <  p.week_end
+"""
+
+SQL_LIVE_LINES_EBAY_EUR = """
+WITH params AS (
+  SELECT
+    {{week_start}}::date AS week_start,
+    ({{week_start}}::date + INTERVAL '7 day') AS week_end,
+    ({{week_start}}::date - INTERVAL '7 day') AS prev_start,
+    to_timestamp({{since}}) AT TIME ZONE 'UTC' AS since
+),
+lines AS (
+  SELECT
+    l.id AS line_id,
+    s.id AS order_id,
+    COALESCE(pp.default_code, l.product_id::text) AS sku,
+    COALESCE(l.product_uom_qty, 0) AS qty,
+    COALESCE(l.price_total, l.price_subtotal,
+             l.price_unit * COALESCE(l.product_uom_qty,0), 0) AS line_total,
+    COALESCE(s.confirm_date, s.date_order, s.create_date) AS order_ts,
+    (s.state IN ('sale','done') AND cur.name = 'EUR') AS valid,
+    GREATEST(l.write_date, s.write_date) AS changed_ts
+  FROM sale_order_line l
+  JOIN sale_order s           ON s.id = l.order_id
+  JOIN res_currency cur       ON cur.id = l.currency_id
+  LEFT JOIN product_product  pp ON pp.id = l.product_id
+  CROSS JOIN params p
+  WHERE s.name ILIKE '%eBay%'
+    AND (l.write_date > p.since OR s.write_date > p.since)
+)
+SELECT
+  l.line_id,
+  l.order_id,
+  l.sku,
+  l.qty,
+  l.line_total,
+  EXTRACT(EPOCH FROM l.order_ts) AS order_epoch,  -- naiwny UTC z Odoo, jak changed_at (porównanie z time.time())
+  (l.order_ts AT TIME ZONE 'Europe/Warsaw') >= p.week_start AS is_curr,
+  l.valid,
+  EXTRACT(EPOCH FROM l.changed_ts) AS changed_at
+FROM lines l CROSS JOIN params p
+WHERE (l.order_ts AT TIME ZONE 'Europe/Warsaw') >= p.prev_start
+  AND (l.order_ts AT TIME ZONE 'Europe/Warsaw') <  p.week_end
+"""
+
+SQL_LIVE_LINES_KAUFLAND_EUR = """
+WITH params AS (
+  SELECT
+    {{week_start}}::date AS week_start,
+    ({{week_start}}::date + INTERVAL '7 day') AS week_end,
+    ({{week_start}}::date - INTERVAL '7 day') AS prev_start,
+    to_timestamp({{since}}) AT TIME ZONE 'UTC' AS since
+),
+lines AS (
+  SELECT
+    l.id AS line_id,
+    s.id AS order_id,
+    COALESCE(pp.default_code, l.product_id::text) AS sku,
+    COALESCE(l.product_uom_qty, 0) AS qty,
+    COALESCE(l.price_total, l.price_subtotal,
+             l.price_unit * COALESCE(l.product_uom_qty,0), 0) AS line_total,
+    COALESCE(s.confirm_date, s.date_order, s.create_date) AS order_ts,
+    (s.state IN ('sale','done') AND cur.name = 'EUR') AS valid,
+    GREATEST(l.write_date, s.write_date) AS changed_ts
+  FROM sale_order_line l
+  JOIN sale_order s           ON s.id = l.order_id
+  JOIN res_currency cur       ON cur.id = l.currency_id
+  LEFT JOIN product_product  pp ON pp.id = l.product_id
+  CROSS JOIN params p
+  WHERE s.name ILIKE '%Kaufland%'
+    AND (l.write_date > p.since OR s.write_date > p.since)
+)
+SELECT
+  l.line_id,
+  l.order_id,
+  l.sku,
+  l.qty,
+  l.line_total,
+  EXTRACT(EPOCH FROM l.order_ts) AS order_epoch,  -- naiwny UTC z Odoo, jak changed_at (porównanie z time.time())
+  (l.order_ts AT TIME ZONE 'Europe/Warsaw') >= p.week_start AS is_curr,
+  l.valid,
+  EXTRACT(EPOCH FROM l.changed_ts) AS changed_at
+FROM lines l CROSS JOIN params p
+WHERE (l.order_ts AT TIME ZONE 'Europe/Warsaw') >= p.prev_start
+  AND (l.order_ts AT TIME ZONE 'Europe/Warsaw') <  p.week_end
+"""
+
+
+# ─────────────────────────────────────────────────────────────
+# 3c) SQL — agregaty dzienne dla dowolnych zakresów dat (day_cache.py)
+# ─────────────────────────────────────────────────────────────
+# Dzień × SKU oraz suma dnia (is_total; sku = NULL także dla linii bez produktu) z liczbą zamówień;
+# [range_start, range_end) — koniec wyłącznie.
+SQL_DAILY_ALLEGRO_PLN = """
+WITH lines AS (
+  SELECT
+    s.id AS order_id,
+    COALESCE(pp.default_code, l.product_id::text) AS sku,
+    COALESCE(l.product_uom_qty, 0) AS qty,
+    COALESCE(l.price_total, l.price_subtotal,
+             l.price_unit * COALESCE(l.product_uom_qty,0), 0) AS line_total,
+    (COALESCE(s.confirm_date, s.date_order, s.create_date) AT TIME ZONE 'Europe/Warsaw') AS order_ts
+  FROM sale_order_line l
+  JOIN sale_order s           ON s.id = l.order_id
+  JOIN res_currency cur       ON cur.id = l.currency_id
+  LEFT JOIN product_product  pp ON pp.id = l.product_id
+  WHERE s.state IN ('sale','done')
+    AND cur.name = 'PLN'
+    AND s.name ILIKE '%Allegro%'
+    AND s.name LIKE '%-1'
+)
+SELECT
+  order_ts::date AS day,
+  sku,
+  SUM(line_total) AS revenue,
+  SUM(qty) AS qty,
+  COUNT(DISTINCT order_id) AS orders,
+  GROUPING(sku) = 1 AS is_total
+FROM lines
+WHERE order_ts >= {{range_start}}::date
+  AND order_ts <  {{range_end}}::date
+GROUP BY GROUPING SETS ((order_ts::date, sku), (order_ts::date))
+ORDER BY day, revenue DESC
+"""
+
+SQL_DAILY_EBAY_EUR = """
+WITH lines AS (
+  SELECT
+    s.id AS order_id,
+    COALESCE(pp.default_code, l.product_id::text) AS sku,
+    COALESCE(l.product_uom_qty, 0) AS qty,
+    COALESCE(l.price_total, l.price_subtotal,
+             l.price_unit * COALESCE(l.product_uom_qty,0), 0) AS line_total,
+    (COALESCE(s.confirm_date, s.date_order, s.create_date) AT TIME ZONE 'Europe/Warsaw') AS order_ts
+  FROM sale_order_line l
+  JOIN sale_order s           ON s.id = l.order_id
+  JOIN res_currency cur       ON cur.id = l.currency_id
+  LEFT JOIN product_product  pp ON pp.id = l.product_id
+  WHERE s.state IN ('sale','done')
+    AND cur.name = 'EUR'
+    AND s.name ILIKE '%eBay%'
+)
+SELECT
+  order_ts::date AS day,
+  sku,
+  SUM(line_total) AS revenue,
+  SUM(qty) AS qty,
+  COUNT(DISTINCT order_id) AS orders,
+  GROUPING(sku) = 1 AS is_total
+FROM lines
+WHERE order_ts >= {{range_start}}::date
+  AND order_ts <  {{range_end}}::date
+GROUP BY GROUPING SETS ((order_ts::date, sku), (order_ts::date))
+ORDER BY day, revenue DESC
+"""
+
+SQL_DAILY_KAUFLAND_EUR = """
+WITH lines AS (
+  SELECT
+    s.id AS order_id,
+    COALESCE(pp.default_code, l.product_id::text) AS sku,
+    COALESCE(l.product_uom_qty, 0) AS qty,
+    COALESCE(l.price_total, l.price_subtotal,
+             l.price_unit * COALESCE(l.product_uom_qty,0), 0) AS line_total,
+    (COALESCE(s.confirm_date, s.date_order, s.create_date) AT TIME ZONE 'Europe/Warsaw') AS order_ts
+  FROM sale_order_line l
+  JOIN sale_order s           ON s.id = l.order_id
+  JOIN res_currency cur       ON cur.id = l.currency_id
+  LEFT JOIN product_product  pp ON pp.id = l.product_id
+  WHERE s.state IN ('sale','done')
+    AND cur.name = 'EUR'
+    AND s.name ILIKE '%Kaufland%'
+)
+SELECT
+  order_ts::date AS day,
+  sku,
+  SUM(line_total) AS revenue,
+  SUM(qty) AS qty,
+  COUNT(DISTINCT order_id) AS orders,
+  GROUPING(sku) = 1 AS is_total
+FROM lines
+WHERE order_ts >= {{range_start}}::date
+  AND order_ts <  {{range_end}}::date
+GROUP BY GROUPING SETS ((order_ts::date, sku), (order_ts::date))
+ORDER BY day, revenue DESC
+"""
+
+
+# ─────────────────────────────────────────────────────────────
+# 3d) SQL — wymiar produktów (products.py)
+# ─────────────────────────────────────────────────────────────
+# SKU → nazwa raz na PRODUCTS_TTL_S; zapytania faktów powyżej zwracają tylko SKU i liczby, nazwy są dołączane
+# lokalnie przy wyświetlaniu. SKU liczone jak w faktach (default_code albo id wariantu), także archiwalne.
+SQL_PRODUCTS = """
+SELECT
+  COALESCE(pp.default_code, pp.id::text) AS sku,
+  MAX(pt.name) AS product_name
+FROM product_product pp
+JOIN product_template pt ON pt.id = pp.product_tmpl_id
+GROUP BY 1
+"""
+
+PRODUCTS_TTL_S = 6 * 3600
+
+
+# Platformy — kolejność zakładek; argumenty render_platform (UI) i batch_reports.py (raporty hurtowe)
+PLATFORMS = [
+    dict(platform_key="allegro", platform_title="🇵🇱 Allegro.pl — Analiza sprzedaży (PLN)",
+         sql_query=SQL_WOW_ALLEGRO_PLN, sql_orders=SQL_ORDERS_ALLEGRO_PLN, sql_live=SQL_LIVE_LINES_ALLEGRO_PLN,
+         currency_label="PLN", currency_symbol="zł"),
+    dict(platform_key="ebay", platform_title="🇩🇪 eBay.de — Analiza sprzedaży (EUR)",
+         sql_query=SQL_WOW_EBAY_EUR, sql_orders=SQL_ORDERS_EBAY_EUR, sql_live=SQL_LIVE_LINES_EBAY_EUR,
+         currency_label="EUR", currency_symbol="€"),
+    dict(platform_key="kaufland", platform_title="🇩🇪 Kaufland.de — Analiza sprzedaży (EUR)",
+         sql_query=SQL_WOW_KAUFLAND_EUR, sql_orders=SQL_ORDERS_KAUFLAND_EUR, sql_live=SQL_LIVE_LINES_KAUFLAND_EUR,
+         currency_label="EUR", currency_symbol="€"),
+]
+
+# Agregaty dzienne (zakładka "Zakres dat") — osobno, bo PLATFORMS to argumenty render_platform
+SQL_DAILY = {"allegro": SQL_DAILY_ALLEGRO_PLN, "ebay": SQL_DAILY_EBAY_EUR, "kaufland": SQL_DAILY_KAUFLAND_EUR}
+
+query_metrics.register_sql(globals())
+
 
 # ─────────────────────────────────────────────────────────────
 # 4) Metabase session (cache)
 # ─────────────────────────────────────────────────────────────
-@st.cache_data(ttl=50 * 60)
+@query_cache.cached("metabase_session", ttl_s=50 * 60)
 def get_metabase_session() -> str | None:
+    t0 = time.perf_counter()
+    status = None
     try:
         payload = {"username": METABASE_USER, "password": METABASE_PASSWORD}
         r = requests.post(f"{METABASE_URL}/api/session", json=payload, timeout=20)
+        status = r.status_code
         r.raise_for_status()
         return r.json()["id"]
     except Exception as e:
         st.error(f"❌ Błąd logowania do Metabase: {e}")
         return None
+    finally:
+        query_metrics.record_call("session", "session", None, time.perf_counter() - t0, status)
 
 # Generowanie PDF
+@lru_cache(maxsize=1)
+def _executive_pdf_styles() -> dict:
+    """Style akapitów i tabel raportu kadrowego — budowane raz na proces, współdzielone przez raporty."""
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+
+    styles = getSampleStyleSheet()
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontSize=16,
+        textColor=colors.HexColor('#283593'),
+        spaceAfter=12,
+        spaceBefore=12
+    )
+    return {
+        "title": ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#1a237e'),
+            spaceAfter=30,
+            alignment=TA_CENTER
+        ),
+        "heading": heading_style,
+        "subheading": ParagraphStyle('SubHeading', parent=heading_style, fontSize=12),
+        "normal": styles['Normal'],
+        "kpi_table": TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3f51b5')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 10),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+        ]),
+        "top10_table": TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#5c6bc0')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+            ('ALIGN', (-2, 0), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
+        ]),
+        "ups_table": TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#66bb6a')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgreen]),
+        ]),
+        "downs_table": TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ef5350')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightpink]),
+        ]),
+    }
+
+
+def _change_rows(frame: pd.DataFrame, sku_len: int = 15, name_len: int = 50) -> list[list[str]]:
+    """Wiersze tabel Wzrosty/Spadki — kolumnowo zamiast iterrows."""
+    pct = frame['rev_change_pct'].to_numpy(dtype=float)
+    return [list(r) for r in zip(
+        frame['sku'].astype(str).str[:sku_len],
+        frame['product_name'].astype(str).str[:name_len],
+        analytics.fmt_money(frame['curr_rev'].to_numpy()),
+        pd.Series(pct).map("{:+.1f}%".format),
+    )]
+
+
 def generate_executive_pdf_report(
         platform_key: str,
         platform_title: str,
@@ -492,6 +889,12 @@ def generate_executive_pdf_report(
     """
     Generuje profesjonalny raport PDF z metrykami, tabelami i wykresami.
     """
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer, PageBreak
+    from reportlab.graphics.shapes import Drawing
+    from reportlab.graphics.charts.barcharts import VerticalBarChart
 
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(
@@ -503,27 +906,11 @@ def generate_executive_pdf_report(
         bottomMargin=2 * cm
     )
 
-    # Style
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#1a237e'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        textColor=colors.HexColor('#283593'),
-        spaceAfter=12,
-        spaceBefore=12
-    )
-
-    normal_style = styles['Normal']
+    # Style (wspólne dla wszystkich raportów w procesie)
+    pdf_styles = _executive_pdf_styles()
+    title_style = pdf_styles["title"]
+    heading_style = pdf_styles["heading"]
+    normal_style = pdf_styles["normal"]
 
     # Elementy raportu
     story = []
@@ -574,19 +961,7 @@ def generate_executive_pdf_report(
     ]
 
     kpi_table = Table(kpi_data, colWidths=[5 * cm, 4 * cm, 4 * cm, 3 * cm])
-    kpi_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3f51b5')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-    ]))
+    kpi_table.setStyle(pdf_styles["kpi_table"])
 
     story.append(kpi_table)
     story.append(Spacer(1, 1 * cm))
@@ -595,30 +970,19 @@ def generate_executive_pdf_report(
     story.append(Paragraph(f"TOP 10 Produktów wg Sprzedaży", heading_style))
     story.append(Spacer(1, 0.3 * cm))
 
-    top10_data = [['#', 'SKU', 'Produkt', 'Sprzedaż', 'Zmiana %']]
-    for idx, (_, row) in enumerate(df_top.head(10).iterrows(), 1):
-        top10_data.append([
-            str(idx),
-            str(row['sku'])[:20],
-            str(row['product_name'])[:40] + ('...' if len(str(row['product_name'])) > 40 else ''),
-            f"{row['curr_rev']:,.2f}",
-            f"{row['rev_change_pct']:+.1f}%" if pd.notna(row['rev_change_pct']) else 'NEW'
-        ])
+    top10 = df_top.head(10)
+    names = top10['product_name'].astype(str)
+    pct = top10['rev_change_pct'].to_numpy(dtype=float)
+    top10_data = [['#', 'SKU', 'Produkt', 'Sprzedaż', 'Zmiana %']] + [list(r) for r in zip(
+        (str(i) for i in range(1, len(top10) + 1)),
+        top10['sku'].astype(str).str[:20],
+        names.str[:40] + np.where(names.str.len() > 40, '...', ''),
+        analytics.fmt_money(top10['curr_rev'].to_numpy()),
+        np.where(np.isnan(pct), 'NEW', pd.Series(pct).map("{:+.1f}%".format).to_numpy()),
+    )]
 
     top10_table = Table(top10_data, colWidths=[1 * cm, 3 * cm, 7 * cm, 3 * cm, 2.5 * cm])
-    top10_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#5c6bc0')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-        ('ALIGN', (-2, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-    ]))
+    top10_table.setStyle(pdf_styles["top10_table"])
 
     story.append(top10_table)
     story.append(PageBreak())
@@ -659,26 +1023,12 @@ def generate_executive_pdf_report(
     downs = df[df['rev_change_pct'] <= -threshold].sort_values('curr_rev', ascending=False).head(5)
 
     # Wzrosty
-    story.append(Paragraph("🚀 TOP 5 Wzrostów (≥20%)", ParagraphStyle('SubHeading', parent=heading_style, fontSize=12)))
+    story.append(Paragraph("🚀 TOP 5 Wzrostów (≥20%)", pdf_styles["subheading"]))
 
     if not ups.empty:
-        ups_data = [['SKU', 'Produkt', 'Sprzedaż', 'Zmiana %']]
-        for _, row in ups.iterrows():
-            ups_data.append([
-                str(row['sku'])[:15],
-                str(row['product_name'])[:50],
-                f"{row['curr_rev']:,.2f}",
-                f"{row['rev_change_pct']:+.1f}%"
-            ])
-
+        ups_data = [['SKU', 'Produkt', 'Sprzedaż', 'Zmiana %']] + _change_rows(ups)
         ups_table = Table(ups_data, colWidths=[3 * cm, 8 * cm, 3 * cm, 2.5 * cm])
-        ups_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#66bb6a')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgreen]),
-        ]))
+        ups_table.setStyle(pdf_styles["ups_table"])
         story.append(ups_table)
     else:
         story.append(Paragraph("Brak znaczących wzrostów w tym okresie.", normal_style))
@@ -686,26 +1036,12 @@ def generate_executive_pdf_report(
     story.append(Spacer(1, 0.5 * cm))
 
     # Spadki
-    story.append(Paragraph("📉 TOP 5 Spadków (≤-20%)", ParagraphStyle('SubHeading', parent=heading_style, fontSize=12)))
+    story.append(Paragraph("📉 TOP 5 Spadków (≤-20%)", pdf_styles["subheading"]))
 
     if not downs.empty:
-        downs_data = [['SKU', 'Produkt', 'Sprzedaż', 'Zmiana %']]
-        for _, row in downs.iterrows():
-            downs_data.append([
-                str(row['sku'])[:15],
-                str(row['product_name'])[:50],
-                f"{row['curr_rev']:,.2f}",
-                f"{row['rev_change_pct']:+.1f}%"
-            ])
-
+        downs_data = [['SKU', 'Produkt', 'Sprzedaż', 'Zmiana %']] + _change_rows(downs)
         downs_table = Table(downs_data, colWidths=[3 * cm, 8 * cm, 3 * cm, 2.5 * cm])
-        downs_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ef5350')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightpink]),
-        ]))
+        downs_table.setStyle(pdf_styles["downs_table"])
         story.append(downs_table)
     else:
         story.append(Paragraph("Brak znaczących spadków w tym okresie.", normal_style))
@@ -732,35 +1068,91 @@ def generate_executive_pdf_report(
     buffer.seek(0)
     return buffer.read()
 
+
+def executive_pdf_cache_path(platform_key: str, df: pd.DataFrame, df_top: pd.DataFrame, week_start: date,
+                             **report_kwargs) -> str:
+    """Ścieżka raportu w cache dyskowym: platforma + tydzień + odcisk snapshotu, TOP i parametrów raportu."""
+    fp = report_cache.fingerprint(df, df_top, week_start=week_start.isoformat(), report_version=REPORT_VERSION,
+                                  **report_kwargs)
+    return PDF_CACHE.path(platform_key, week_start.isoformat(), fp)
+
+
+def generate_executive_pdf_report_cached(**kwargs) -> tuple[bytes, bool]:
+    """generate_executive_pdf_report z cache na dysku — (bytes, czy z cache)."""
+    path = executive_pdf_cache_path(**kwargs)
+    return PDF_CACHE.get_or_build(path, lambda: generate_executive_pdf_report(**kwargs))
+
 # ─────────────────────────────────────────────────────────────
-# 5) /api/dataset caller (200/202/401 handling)
+# 5) /api/dataset caller (200/202/401 handling; tryb kart — /api/card/:id/query z powrotem do /api/dataset)
 # ─────────────────────────────────────────────────────────────
 def _dataset_call(sql_text: str, params: dict, session: str, poll_max_s: float = 12.0) -> dict:
-    payload = {
+    t0 = time.perf_counter()
+    res = _dataset_request(sql_text, params, session, poll_max_s)
+    j = res["json"]
+    rows = j.get("data", {}).get("rows") if isinstance(j, dict) and isinstance(j.get("data"), dict) else None
+    query_metrics.record_call(
+        res.get("kind", "dataset"), query_metrics.sql_identity(sql_text), params, time.perf_counter() - t0,
+        res["status"],
+        rows=len(rows) if isinstance(rows, list) else None,
+        response_bytes=res.get("bytes"), polled=res.get("polled", False),
+    )
+    return res
+
+
+def _native_payload(sql_text: str, params: dict) -> dict:
+    """Zapytanie natywne z template tagami — liczby jako "number", reszta jako "date" (ISO)."""
+    def tag_type(v):
+        return "number" if isinstance(v, (int, float)) and not isinstance(v, bool) else "date"
+
+    return {
         "database": METABASE_DATABASE_ID,
         "type": "native",
         "native": {
             "query": sql_text,
-            "template-tags": {k: {"name": k, "display-name": k, "type": "date"} for k in params.keys()},
+            "template-tags": {k: {"name": k, "display-name": k, "type": tag_type(v)} for k, v in params.items()},
         },
         "parameters": [
-            {"type": "date", "target": ["variable", ["template-tag", k]], "value": v}
+            {"type": tag_type(v), "target": ["variable", ["template-tag", k]], "value": v}
             for k, v in params.items()
         ],
     }
+
+
+def _card_fallback(sql_text: str, card: int, status: int) -> None:
+    """Karta nie odpowiedziała wynikiem — to wywołanie idzie przez /api/dataset; 404 = karta do odtworzenia."""
+    if status == 404:
+        CARDS.invalidate(sql_text)
+    metabase_cards.log.warning("karta %s (%s) → HTTP %s, powrót do /api/dataset", card,
+                               query_metrics.sql_identity(sql_text), status)
+
+
+def _dataset_request(sql_text: str, params: dict, session: str, poll_max_s: float) -> dict:
+    payload = _native_payload(sql_text, params)
     headers = {"X-Metabase-Session": session}
+    card = CARDS.card_id(sql_text, payload, session) if CARDS is not None else None
+    if card is not None:
+        r = requests.post(f"{METABASE_URL}/api/card/{card}/query", headers=headers,
+                          json={"parameters": payload["parameters"]}, timeout=120)
+        res = _dataset_response(r, headers, poll_max_s)
+        if res["status"] in (200, 401):
+            return {**res, "kind": "card"}
+        _card_fallback(sql_text, card, res["status"])
     r = requests.post(f"{METABASE_URL}/api/dataset", headers=headers, json=payload, timeout=120)
+    return _dataset_response(r, headers, poll_max_s)
+
 
+def _dataset_response(r: requests.Response, headers: dict, poll_max_s: float) -> dict:
+    """Odpowiedź /api/dataset albo /api/card/:id/query: 200, 202 (wynik w ciele albo polling), 401, błędy."""
     if r.status_code == 401:
-        return {"status": 401, "json": None, "text": r.text}
+        return {"status": 401, "json": None, "text": r.text, "bytes": len(r.content)}
 
     if r.status_code == 200:
-        return {"status": 200, "json": (r.json() if r.content else None), "text": r.text}
+        return {"status": 200, "json": (r.json() if r.content else None), "text": r.text, "bytes": len(r.content)}
 
     if r.status_code == 202:
         j = r.json() if r.content else {}
         if isinstance(j, dict) and isinstance(j.get("data", {}).get("rows"), list):
-            return {"status": 200, "json": j, "text": r.text}
+            return {"status": 200, "json": j, "text": r.text, "bytes": len(r.content)}
         token = j.get("id") or j.get("data", {}).get("id")
         if token:
             deadline = time.time() + poll_max_s
@@ -768,16 +1160,75 @@ def _dataset_call(sql_text: str, params: dict, session: str, poll_max_s: float =
             while time.time() < deadline:
                 rr = requests.get(f"{METABASE_URL}/api/dataset/{token}/json", headers=headers, timeout=60)
                 if rr.status_code == 200 and rr.content:
-                    return {"status": 200, "json": rr.json(), "text": rr.text}
+                    return {"status": 200, "json": rr.json(), "text": rr.text, "bytes": len(rr.content), "polled": True}
                 rr = requests.get(f"{METABASE_URL}/api/dataset/{token}", headers=headers, timeout=60)
                 if rr.status_code == 200 and rr.content:
-                    return {"status": 200, "json": rr.json(), "text": rr.text}
+                    return {"status": 200, "json": rr.json(), "text": rr.text, "bytes": len(rr.content), "polled": True}
                 last = rr
                 time.sleep(0.5)
-            return {"status": getattr(last, "status_code", 202), "json": None, "text": getattr(last, "text", "")}
-        return {"status": 202, "json": None, "text": r.text}
+            return {"status": getattr(last, "status_code", 202), "json": None, "text": getattr(last, "text", ""),
+                    "bytes": len(getattr(last, "content", b"") or b""), "polled": True}
+        return {"status": 202, "json": None, "text": r.text, "bytes": len(r.content)}
 
-    return {"status": r.status_code, "json": (r.json() if r.content else None), "text": r.text}
+    return {"status": r.status_code, "json": (r.json() if r.content else None), "text": r.text,
+            "bytes": len(r.content)}
+
+
+def _dataset_csv_call(sql_text: str, params: dict, session: str, dtype: dict, parse_dates: list | None = None,
+                      chunksize: int = 200_000) -> dict:
+    """/api/dataset/csv bez limitu 2000 wierszy — odpowiedź czytana strumieniowo i parsowana porcjami.
+
+    Zwraca {"status", "df" (typowane kolumny albo None), "text" (przy błędzie)}; metryki jak w _dataset_call.
+    """
+    t0 = time.perf_counter()
+    r = None
+    kind = "csv"
+    out = {"status": None, "df": None, "text": ""}
+    headers = {"X-Metabase-Session": session}
+    payload = _native_payload(sql_text, params)
+    try:
+        card = CARDS.card_id(sql_text, payload, session) if CARDS is not None else None
+        if card is not None:
+            # eksport karty przyjmuje parametry jako pole formularza (JSON w tekście), jak przycisk pobierania w UI
+            r = requests.post(f"{METABASE_URL}/api/card/{card}/query/csv", headers=headers,
+                              data={"parameters": json.dumps(payload["parameters"])}, timeout=180, stream=True)
+            if r.status_code in (200, 401):
+                kind = "card_csv"
+            else:
+                _card_fallback(sql_text, card, r.status_code)
+                r.close()
+                r = None
+        if r is None:
+            r = requests.post(f"{METABASE_URL}/api/dataset/csv", headers=headers, json=payload, timeout=180,
+                              stream=True)
+        out["status"] = r.status_code
+        if r.status_code != 200:
+            out["text"] = r.text
+            return out
+        if hasattr(r.raw, "decode_content"):
+            r.raw.decode_content = True  # gzip/deflate rozpakowywane w locie
+        chunks = []
+        reader = pd.read_csv(r.raw, dtype=dtype, parse_dates=parse_dates, chunksize=chunksize)
+        for chunk in reader:
+            chunk.columns = [str(c).strip().lower().replace(" ", "_") for c in chunk.columns]
+            chunks.append(chunk)
+        if not chunks:
+            out["df"] = pd.DataFrame({c: pd.Series(dtype=t) for c, t in dtype.items()})
+            return out
+        # powtarzalne teksty jako category już w porcjach — scalane przez union_categoricals (bez object)
+        cat_cols = [c for c, t in dtype.items() if t == "category" and c in chunks[0].columns]
+        df = pd.concat([ch.drop(columns=cat_cols) for ch in chunks], ignore_index=True)
+        for col in cat_cols:
+            df[col] = union_categoricals([ch[col] for ch in chunks])
+        out["df"] = df[list(chunks[0].columns)]
+        return out
+    finally:
+        rows = len(out["df"]) if out["df"] is not None else None
+        raw_bytes = r.raw.tell() if r is not None and hasattr(r.raw, "tell") else None
+        query_metrics.record_call(kind, query_metrics.sql_identity(sql_text), params, time.perf_counter() - t0,
+                                  out["status"], rows=rows, response_bytes=raw_bytes)
+        if r is not None:
+            r.close()
 
 
 # ─────────────────────────────────────────────────────────────
@@ -804,9 +1255,8 @@ def _metabase_json_to_df(j: dict) -> pd.DataFrame:
                 df = pd.DataFrame(rows)
             else:
                 n = len(rows[0])
-                expected = ["sku", "product_name", "curr_rev", "curr_qty", "prev_rev", "prev_qty", "rev_change_pct",
-                            "qty_change_pct"]
-                col_names = expected[:n] if n == 8 else [f"c{i}" for i in range(n)]
+                expected = ["sku", "curr_rev", "curr_qty", "prev_rev", "prev_qty", "rev_change_pct", "qty_change_pct"]
+                col_names = expected[:n] if n == len(expected) else [f"c{i}" for i in range(n)]
                 df = pd.DataFrame(rows, columns=col_names)
         return df
 
@@ -819,41 +1269,48 @@ def _metabase_json_to_df(j: dict) -> pd.DataFrame:
 # ─────────────────────────────────────────────────────────────
 # 7) Zapytania pomocnicze
 # ─────────────────────────────────────────────────────────────
-@st.cache_data(ttl=600)
+@query_metrics.track_cache("query_snapshot")
+@query_cache.cached("query_snapshot", ttl_s=600)
 def query_snapshot(sql_text: str, week_start_iso: str) -> pd.DataFrame:
+    """Fakty snapshotu WoW (sku + liczby); nazwy produktów dołącza with_product_names przy wyświetlaniu."""
+    query_metrics.mark_miss()
     session = get_metabase_session()
     if not session:
         return pd.DataFrame()
-    res = _dataset_call(sql_text, {"week_start": week_start_iso}, session)
-    if res["status"] == 401:
-        get_metabase_session.clear()
-        session = get_metabase_session()
-        if not session:
-            st.error("❌ Nie udało się odświeżyć sesji Metabase.")
-            return pd.DataFrame()
+    with perf.stage("http"):
         res = _dataset_call(sql_text, {"week_start": week_start_iso}, session)
+        if res["status"] == 401:
+            get_metabase_session.invalidate(session)
+            session = get_metabase_session()
+            if not session:
+                st.error("❌ Nie udało się odświeżyć sesji Metabase.")
+                return pd.DataFrame()
+            res = _dataset_call(sql_text, {"week_start": week_start_iso}, session)
     st.session_state["mb_last_status"] = res["status"]
     st.session_state["mb_last_json"] = res["json"]
     if res["status"] not in (200, 202) or not res["json"]:
         st.error(f"❌ Metabase HTTP {res['status']}: {str(res.get('text', ''))[:300]}")
         return pd.DataFrame()
-    df = _metabase_json_to_df(res["json"])
-    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
-    for col in ["curr_rev", "prev_rev", "rev_change_pct", "curr_qty", "prev_qty", "qty_change_pct"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
+    with perf.stage("decode"):
+        df = _metabase_json_to_df(res["json"])
+        df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
+        for col in ["curr_rev", "prev_rev", "rev_change_pct", "curr_qty", "prev_qty", "qty_change_pct"]:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce")
     return df
 
 
-@st.cache_data(ttl=600)
+@query_metrics.track_cache("query_order_counts")
+@query_cache.cached("query_order_counts", ttl_s=600)
 def query_order_counts(sql_text: str, week_start_iso: str) -> pd.DataFrame:
     """Zwraca 1-wierszowy DF z kolumnami: orders_curr, orders_prev."""
+    query_metrics.mark_miss()
     session = get_metabase_session()
     if not session:
         return pd.DataFrame()
     res = _dataset_call(sql_text, {"week_start": week_start_iso}, session)
     if res["status"] == 401:
-        get_metabase_session.clear()
+        get_metabase_session.invalidate(session)
         session = get_metabase_session()
         if not session:
             st.error("❌ Nie udało się odświeżyć sesji Metabase.")
@@ -869,8 +1326,10 @@ def query_order_counts(sql_text: str, week_start_iso: str) -> pd.DataFrame:
     return df
 
 
-@st.cache_data(ttl=600)
+@query_metrics.track_cache("query_trend_many_weeks")
+@query_cache.cached("query_trend_many_weeks", ttl_s=600, shared=False)  # złożenie współdzielonych snapshotów
 def query_trend_many_weeks(sql_text: str, week_start_date: date, weeks: int = 8) -> pd.DataFrame:
+    query_metrics.mark_miss()
     frames = []
     for i in range(weeks):
         ws_date = week_start_date - timedelta(weeks=i)
@@ -885,105 +1344,164 @@ def query_trend_many_weeks(sql_text: str, week_start_date: date, weeks: int = 8)
     return pd.DataFrame()
 
 
-@st.cache_data(ttl=600)
-def query_poland_zip_full(week_start_iso: str) -> pd.DataFrame:
-    """Pobiera pełne dane przez CSV endpoint - bez limitu 2000 wierszy."""
+@query_metrics.track_cache("query_poland_zip_full")
+@query_cache.cached("query_poland_zip_full", ttl_s=600)
+def query_poland_zip_full(week_start_iso: str, weeks: int = 1) -> pd.DataFrame:
+    """Pobiera pełne dane przez CSV endpoint - bez limitu 2000 wierszy.
+
+    Tydzień × prefiks ZIP × SKU dla `weeks` tygodni kończących się na week_start_iso (źródło kostki mapy).
+    """
+    query_metrics.mark_miss()
     session = get_metabase_session()
     if not session:
         return pd.DataFrame()
 
-    sql = f"""
-WITH params AS (
-  SELECT
-    '{week_start_iso}'::date AS week_start,
-    ('{week_start_iso}'::date + INTERVAL '7 day') AS week_end
-),
-lines AS (
-  SELECT
-    l.product_id,
-    COALESCE(pp.default_code, l.product_id::text) AS sku,
-    COALESCE(pt.name, l.name) AS product_name,
-    COALESCE(l.price_total, l.price_subtotal,
-             l.price_unit * COALESCE(l.product_uom_qty,0), 0) AS line_total,
-    sh.receiver_zip
-  FROM sale_order_line l
-  JOIN sale_order s ON s.id = l.order_id
-  JOIN res_currency cur ON cur.id = l.currency_id
-  LEFT JOIN shipping_order sh ON sh.sale_order_id = s.id
-  LEFT JOIN product_product pp ON pp.id = l.product_id
-  LEFT JOIN product_template pt ON pt.id = pp.product_tmpl_id
-  WHERE s.state IN ('sale','done')
-    AND cur.name = 'PLN'
-    AND s.name ILIKE '%Allegro%'
-    AND s.name LIKE '%-1'
-    AND (s.confirm_date AT TIME ZONE 'Europe/Warsaw') >= (SELECT week_start FROM params)
-    AND (s.confirm_date AT TIME ZONE 'Europe/Warsaw') < (SELECT week_end FROM params)
-    AND sh.receiver_zip IS NOT NULL
-)
-SELECT
-  receiver_zip,
-  sku,
-  product_name,
-  SUM(line_total) AS revenue
-FROM lines
-GROUP BY receiver_zip, sku, product_name
-ORDER BY receiver_zip, revenue DESC;
-"""
+    params = {"week_start": week_start_iso, "weeks": int(weeks)}
+    dtype = {"zip_prefix": "category", "sku": "category", "revenue": "float64"}
+    try:
+        res = _dataset_csv_call(SQL_POLAND_ZIP_WEEKS, params, session, dtype, parse_dates=["week_start"])
+        if res["status"] == 401:
+            get_metabase_session.invalidate(session)
+            session = get_metabase_session()
+            if not session:
+                return pd.DataFrame()
+            res = _dataset_csv_call(SQL_POLAND_ZIP_WEEKS, params, session, dtype, parse_dates=["week_start"])
+    except Exception as e:
+        st.error(f"Błąd pobierania danych: {e}")
+        return pd.DataFrame()
 
-    payload = {
-        "database": METABASE_DATABASE_ID,
-        "type": "native",
-        "native": {"query": sql}
-    }
+    if res["status"] == 200:
+        df = res["df"]
+        df["revenue"] = df["revenue"].fillna(0.0)
+        return df
+    elif res["status"] == 202:
+        st.warning("Zapytanie w trakcie przetwarzania (202). Spróbuj ponownie za chwilę.")
+        return pd.DataFrame()
+    else:
+        st.error(f"Błąd {res['status']}: {res['text'][:300]}")
+        return pd.DataFrame()
 
-    headers = {"X-Metabase-Session": session}
 
+@query_metrics.track_cache("query_products")
+@query_cache.cached("query_products", ttl_s=PRODUCTS_TTL_S)
+def query_products() -> pd.DataFrame:
+    """Wymiar produktów (sku, product_name) przez CSV — jedno pobranie na PRODUCTS_TTL_S, wspólne dla replik."""
+    query_metrics.mark_miss()
+    session = get_metabase_session()
+    if not session:
+        return pd.DataFrame()
+    dtype = {"sku": "str", "product_name": "str"}
     try:
-        # Pobierz jako CSV
-        r = requests.post(
-            f"{METABASE_URL}/api/dataset/csv",
-            headers=headers,
-            json=payload,
-            timeout=180
-        )
-
-        if r.status_code == 401:
-            get_metabase_session.clear()
+        res = _dataset_csv_call(SQL_PRODUCTS, {}, session, dtype)
+        if res["status"] == 401:
+            get_metabase_session.invalidate(session)
             session = get_metabase_session()
             if not session:
                 return pd.DataFrame()
-            headers = {"X-Metabase-Session": session}
-            r = requests.post(
-                f"{METABASE_URL}/api/dataset/csv",
-                headers=headers,
-                json=payload,
-                timeout=180
-            )
-
-        if r.status_code == 200:
-            from io import StringIO
-            df = pd.read_csv(StringIO(r.text))
+            res = _dataset_csv_call(SQL_PRODUCTS, {}, session, dtype)
+    except Exception as e:
+        st.error(f"Błąd pobierania nazw produktów: {e}")
+        return pd.DataFrame()
+    if res["status"] != 200:
+        st.warning(f"Nazwy produktów niedostępne (HTTP {res['status']}) — pokazuję same SKU.")
+        return pd.DataFrame()
+    products.mark_refreshed()
+    return res["df"]
 
-            # Standaryzuj nazwy kolumn
-            df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
 
-            # Konwertuj typy
-            if "revenue" in df.columns:
-                df["revenue"] = pd.to_numeric(df["revenue"], errors="coerce").fillna(0.0)
+@query_cache.cached("product_names", ttl_s=PRODUCTS_TTL_S, shared=False)  # indeks z query_products
+def product_names() -> pd.Series:
+    return products.name_index(query_products())
 
-            st.success(f"✅ Pobrano {len(df):,} wierszy | Suma: {df['revenue'].sum():,.0f} zł")
-            return df
 
-        elif r.status_code == 202:
-            st.warning("Zapytanie w trakcie przetwarzania (202). Spróbuj ponownie za chwilę.")
-            return pd.DataFrame()
+def with_product_names(df: pd.DataFrame) -> pd.DataFrame:
+    """Fakty (sku + liczby) → ta sama ramka z product_name po sku; SKU spoza wymiaru odświeża go (z limitem)."""
+    if df is None or df.empty or "sku" not in df.columns or "product_name" in df.columns:
+        return df
+    names = product_names()
+    if products.refresh_due(products.missing_count(df["sku"], names)):
+        query_products.clear()
+        product_names.clear()
+        names = product_names()
+    return products.join_names(df, names)
+
+
+def refresh_live_week(platform_key: str, sql_live: str, week_start_date: date,
+                      force: bool = False) -> live_week.LiveWeek:
+    """Tryb na żywo: pełne pobranie linii przy pierwszym użyciu / resynchronizacji, potem tylko zmienione od
+    watermarku. Częściej niż co live_week.POLL_MIN_S (inne sesje, reruny) — stan bez zapytania."""
+    state = live_week.state(platform_key, week_start_date)
+    with state.lock:
+        now = time.time()
+        if not (force or state.due(now)):
+            return state
+        full = state.needs_full(now)
+        session = get_metabase_session()
+        if not session:
+            return state
+        params = {"week_start": week_start_date.isoformat(), "since": state.since(now)}
+        try:
+            with perf.stage("http"):
+                res = _dataset_csv_call(sql_live, params, session, live_week.LINE_DTYPES)
+                if res["status"] == 401:
+                    get_metabase_session.invalidate(session)
+                    session = get_metabase_session()
+                    if not session:
+                        return state
+                    res = _dataset_csv_call(sql_live, params, session, live_week.LINE_DTYPES)
+        except Exception as e:
+            st.error(f"Tryb na żywo — błąd pobierania: {e}")
+            return state
+        if res["status"] == 200:
+            state.apply(res["df"], full, now)
         else:
-            st.error(f"Błąd {r.status_code}: {r.text[:300]}")
-            return pd.DataFrame()
+            st.warning(f"Tryb na żywo — Metabase HTTP {res['status']}; pokazuję ostatni pobrany stan.")
+    return state
 
+
+def query_daily(sql_daily: str, range_start: date, range_end: date) -> pd.DataFrame | None:
+    """Agregaty dzienne [range_start, range_end) przez CSV (bez limitu wierszy); None = błąd — day_cache nie
+    zapisuje wtedy dni jako pustych."""
+    session = get_metabase_session()
+    if not session:
+        return None
+    params = {"range_start": range_start.isoformat(), "range_end": range_end.isoformat()}
+    try:
+        res = _dataset_csv_call(sql_daily, params, session, day_cache.DAY_DTYPES, parse_dates=["day"])
+        if res["status"] == 401:
+            get_metabase_session.invalidate(session)
+            session = get_metabase_session()
+            if not session:
+                return None
+            res = _dataset_csv_call(sql_daily, params, session, day_cache.DAY_DTYPES, parse_dates=["day"])
     except Exception as e:
-        st.error(f"Błąd pobierania danych: {e}")
-        return pd.DataFrame()
+        st.error(f"Błąd pobierania danych dziennych: {e}")
+        return None
+    if res["status"] != 200:
+        st.error(f"Błąd {res['status']}: {res['text'][:300]}")
+        return None
+    df = res["df"]
+    if "day" not in df.columns:  # pusta odpowiedź — ramka tylko z kolumn dtype
+        df = df.assign(day=pd.Series(dtype="datetime64[ns]"))
+    return df
+
+
+@st.cache_resource(ttl=600, max_entries=4)
+def get_region_cube(week_start_iso: str, weeks: int) -> region_cube.RegionCube:
+    """Kostka województwo × SKU × tydzień z jednego pobrania CSV (wspólna dla sesji, tylko do odczytu)."""
+    df = query_poland_zip_full(week_start_iso, weeks)
+    end = pd.Timestamp(week_start_iso)
+    cube_weeks = pd.date_range(end=end, periods=weeks, freq="W-MON")
+    if df.empty:
+        df = pd.DataFrame(columns=["week_start", "zip_prefix", "sku", "revenue"])
+    return region_cube.RegionCube(df, ZIP_TO_REGION, cube_weeks, names=product_names())
+
+
+@st.cache_resource(ttl=600, max_entries=12)
+def get_trend_search_index(sql_text: str, week_start_date: date, weeks: int) -> sku_search.SkuSearchIndex:
+    """Indeks SKU + nazw budowany raz na zbiór trendu (wspólny dla sesji)."""
+    return sku_search.SkuSearchIndex(query_trend_many_weeks(sql_text, week_start_date, weeks=weeks),
+                                     names=product_names())
 
 
 # ─────────────────────────────────────────────────────────────
@@ -995,38 +1513,50 @@ def last_completed_week_start(today: date | None = None) -> date:
     return d - timedelta(days=offset)
 
 
-st.sidebar.header("🔎 Filtry")
-default_week = last_completed_week_start()
-pick_day = st.sidebar.date_input("Wybierz tydzień (podaj dowolny dzień z tego tygodnia)", value=default_week)
-week_start = pick_day - timedelta(days=pick_day.weekday())
-week_end = week_start + timedelta(days=7)
+if __name__ == "__main__":
+    st.sidebar.header("🔎 Filtry")
+    default_week = last_completed_week_start()
+    live_mode = st.sidebar.toggle("🔴 Na żywo — bieżący tydzień", value=False, key="live_mode",
+                                  help="Bieżący tydzień do teraz vs poprzedni tydzień do tej samej chwili; "
+                                       "odświeżenie pobiera tylko linie zamówień zmienione od ostatniego.")
+    pick_day = st.sidebar.date_input("Wybierz tydzień (podaj dowolny dzień z tego tygodnia)", value=default_week,
+                                     disabled=live_mode)
+    if live_mode:
+        pick_day = datetime.now(TZ).date()
+        live_refresh = st.sidebar.button("🔄 Odśwież dane na żywo")
+    else:
+        live_refresh = False
+    week_start = pick_day - timedelta(days=pick_day.weekday())
+    week_end = week_start + timedelta(days=7)
+
+    threshold_rev = st.sidebar.slider("Próg alertu — wartość sprzedaży (%)", min_value=5, max_value=200, value=20, step=5)
+    threshold_qty = st.sidebar.slider("Próg alertu — ilość (%)", min_value=5, max_value=200, value=20, step=5)
 
-threshold_rev = st.sidebar.slider("Próg alertu — wartość sprzedaży (%)", min_value=5, max_value=200, value=20, step=5)
-threshold_qty = st.sidebar.slider("Próg alertu — ilość (%)", min_value=5, max_value=200, value=20, step=5)
+    weeks_back = st.sidebar.slider("Ile tygodni wstecz (trend)", 4, 52, 8, step=1,
+                                   help="Trend to jedno zapytanie Metabase na tydzień (kolejno; tygodnie już "
+                                        "pobrane są w cache) — pierwsze załadowanie 52 tygodni trwa dłużej.")
+    top_n = st.sidebar.slider("Ile pozycji w TOP?", 5, 20, 10, step=5)
 
-weeks_back = st.sidebar.slider("Ile tygodni wstecz (trend)", 4, 16, 8, step=1)
-top_n = st.sidebar.slider("Ile pozycji w TOP?", 5, 20, 10, step=5)
+    debug_api = st.sidebar.checkbox("Debug API", value=False)
 
-debug_api = st.sidebar.checkbox("Debug API", value=False)
+    # Profil jednego reruna — przycisk wywołuje rerun, który jest profilowany do końca skryptu
+    profile_this_run = st.sidebar.button("⏱️ Profiluj ten rerun (cProfile)")
+    run_profiler = perf.start_profiler() if profile_this_run else None
 
-st.caption(f"Tydzień: **{week_start} → {week_end - timedelta(days=1)}**  •  Strefa: Europe/Warsaw")
+    if live_mode:
+        st.caption(f"Na żywo: **{week_start} → teraz** vs poprzedni tydzień do tej samej chwili  •  "
+                   f"Strefa: Europe/Warsaw")
+    else:
+        st.caption(f"Tydzień: **{week_start} → {week_end - timedelta(days=1)}**  •  Strefa: Europe/Warsaw")
 
 
 # ─────────────────────────────────────────────────────────────
 # 9) Wspólne pomocnicze
 # ─────────────────────────────────────────────────────────────
-def classify_change_symbol(pct: float | np.floating | None, threshold: float):
-    if pd.isna(pct): return ("—", "#9e9e9e")
-    if pct >= threshold:
-        if pct >= threshold * 4: return ("🟢⬆️⬆️", "#2e7d32")
-        if pct >= threshold * 2: return ("🟢⬆️", "#388e3c")
-        return ("🟢↑", "#66bb6a")
-    if pct <= -threshold:
-        if pct <= -threshold * 4: return ("🔴⬇️⬇️", "#b71c1c")
-        if pct <= -threshold * 2: return ("🔴⬇️", "#d32f2f")
-        return ("🔴↓", "#ef5350")
-    return ("⚪≈", "#9e9e9e")
-
+# Trend: powyżej tylu punktów (tygodnie × SKU) tryb "auto" przełącza na WebGL; limit punktów przy decymacji
+TREND_WEBGL_MIN_POINTS = 2_000
+TREND_MAX_POINTS = 26
+TREND_SEARCH_PAGE = 200
 
 COLS_DISPLAY_BASE = {
     "sku": "SKU",
@@ -1064,28 +1594,127 @@ def to_display(df_in: pd.DataFrame, cur: str) -> pd.DataFrame:
     return out[keep]
 
 
-def to_excel_bytes(dframe: pd.DataFrame) -> bytes:
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        dframe.to_excel(writer, index=False, sheet_name="sprzedaz")
-    return output.getvalue()
+def to_excel_bytes(dframe: pd.DataFrame, sheet_name: str = "sprzedaz") -> bytes:
+    """Jeden arkusz, zapis strumieniowy (excel_export, openpyxl write_only)."""
+    import excel_export
+
+    return excel_export.workbook_bytes({sheet_name: dframe})
+
 
+def combined_excel_bytes(week_start_date: date, weeks: int) -> bytes:
+    """Skoroszyt zbiorczy: snapshot i trend każdej platformy + województwa (bieżący vs poprzedni tydzień)."""
+    import excel_export
 
-def df_to_pdf_bytes(dframe: pd.DataFrame, title: str = "Raport") -> bytes:
-    buf = io.BytesIO()
-    d = dframe.copy().head(200)
-    with PdfPages(buf) as pdf:
-        fig, ax = plt.subplots(figsize=(11.69, 8.27))
-        ax.axis('off')
-        ax.set_title(title, fontsize=14, loc='left')
-        table = ax.table(cellText=d.values, colLabels=d.columns, loc='center', cellLoc='left')
-        table.auto_set_font_size(False)
-        table.set_fontsize(8)
-        table.scale(1, 1.2)
-        pdf.savefig(fig, bbox_inches='tight')
-        plt.close(fig)
-    buf.seek(0)
-    return buf.read()
+    sheets = {}
+    for platform in PLATFORMS:
+        sheets[platform["platform_key"]] = with_product_names(
+            query_snapshot(platform["sql_query"], week_start_date.isoformat()))
+    for platform in PLATFORMS:
+        trend = with_product_names(query_trend_many_weeks(platform["sql_query"], week_start_date, weeks=weeks))
+        if not trend.empty:
+            trend = trend[["week_start"] + [c for c in trend.columns if c != "week_start"]]
+        sheets[f"trend_{platform['platform_key']}"] = trend
+    cube = get_region_cube(week_start_date.isoformat(), MAP_CUBE_WEEKS + 1)  # ta sama kostka co mapa
+    sheets["wojewodztwa"] = cube.region_totals_frame(cube.week_index(pd.Timestamp(week_start_date)))
+    return excel_export.workbook_bytes(sheets)
+
+
+def df_to_pdf_bytes(dframe: pd.DataFrame, title: str = "Raport", max_rows: int | None = None) -> bytes:
+    """Tabela → PDF stronami (pdf_tables, reportlab): nagłówek na każdej stronie, bez limitu 200 wierszy."""
+    import pdf_tables
+
+    return pdf_tables.table_pdf_bytes(dframe, title=title, max_rows=max_rows)
+
+
+def render_paged_table(table_key: str, df: pd.DataFrame, mask: np.ndarray, week_start: date, currency_label: str,
+                       selected_cols: list, page_size: int, empty_msg: str):
+    """Tabela stronicowana po stronie serwera: filtr i sortowanie na pełnym df, do przeglądarki jedna strona.
+
+    Przefiltrowane pozycje trzymane w session_state (klucz: tydzień, odcisk SKU/nazw, próg/maska i fraza) — po
+    odświeżeniu cache albo trybu na żywo z tą samą liczbą wierszy pozycje liczone od nowa; zmiana
+    strony czy sortowania nie powtarza filtrowania tekstu; sortowana jest tylko wybrana strona (page_index).
+    """
+    positions_all = np.flatnonzero(mask)
+    if positions_all.size == 0:
+        st.info(empty_msg)
+        return
+
+    sortable = [c for c in COLS_DISPLAY_BASE if c in df.columns]
+    labels = {c: COLS_DISPLAY_BASE[c].replace("{CUR}", currency_label) for c in sortable}
+    c1, c2, c3 = st.columns([3, 3, 2])
+    query = c1.text_input("Szukaj (SKU / nazwa)", key=f"{table_key}_q")
+    sort_col = c2.selectbox("Sortuj wg", sortable, index=sortable.index("curr_rev") if "curr_rev" in sortable else 0,
+                            format_func=labels.get, key=f"{table_key}_sort")
+    descending = c3.toggle("Malejąco", value=True, key=f"{table_key}_desc")
+
+    idx_key = f"{table_key}_idx"
+    rows_fp = report_cache.fingerprint(df[[c for c in ("sku", "product_name") if c in df.columns]])
+    sig = (week_start.isoformat(), rows_fp, hash(mask.tobytes()), query)
+    cached = st.session_state.get(idx_key)
+    if cached is None or cached[0] != sig:
+        cached = (sig, analytics.filter_positions(df, positions_all, query))
+        st.session_state[idx_key] = cached
+    positions = cached[1]
+
+    pages = max(1, -(-positions.size // page_size))
+    page_key = f"{table_key}_page"
+    view = (sig, sort_col, descending, page_size)
+    if st.session_state.get(f"{page_key}_view") != view:  # nowy filtr / sortowanie → od pierwszej strony
+        st.session_state[f"{page_key}_view"] = view
+        st.session_state[page_key] = 1
+    st.session_state[page_key] = min(st.session_state.get(page_key, 1), pages)
+    page = st.number_input(f"Strona (z {pages:,})", min_value=1, max_value=pages, step=1, key=page_key)
+
+    key = analytics.sort_key(df[sort_col].to_numpy()[positions])
+    rows = positions[analytics.page_index(key, page - 1, page_size, descending=descending)]
+    st.caption(f"Łącznie spełnia warunek: {positions_all.size:,} • Po filtrze: {positions.size:,} • "
+               f"Strona {page:,}/{pages:,} ({rows.size:,} wierszy)")
+    if rows.size == 0:
+        st.info("Brak pozycji pasujących do filtra.")
+        return
+    df_disp = to_display(df.iloc[rows], currency_label)
+    show_cols = [c for c in selected_cols if c in df_disp.columns] or list(df_disp.columns)
+    st.dataframe(df_disp[show_cols], width="stretch", hide_index=True)
+
+
+def render_query_cache_admin():
+    """Panel admina (?admin=1): zajętość budżetu, statystyki per funkcja i największe wpisy cache zapytań."""
+    with st.sidebar.expander("🗄️ Cache zapytań (admin)", expanded=True):
+        stats = query_cache.CACHE.stats()
+        backend = query_cache.SHARED
+        st.caption("Wspólny backend replik: " + (
+            f"katalog {backend.directory}" if isinstance(backend, shared_cache.DirectoryBackend)
+            else "Redis" if backend is not None else "brak (tylko pamięć procesu)"))
+        if CARDS is not None:
+            cards = CARDS.stats()
+            st.caption("Tryb kart Metabase: " + (", ".join(f"{k} → #{v}" for k, v in cards["cards"].items()) or "—")
+                       + (f" • /api/dataset: {', '.join(cards['failed'])}" if cards["failed"] else ""))
+        st.progress(min(1.0, stats["bytes"] / stats["max_bytes"]),
+                    text=f"{stats['bytes'] / 2**20:,.1f} / {stats['max_bytes'] / 2**20:,.0f} MB • "
+                         f"{stats['entries']} wpisów")
+        if stats["functions"]:
+            per_fn = pd.DataFrame.from_dict(stats["functions"], orient="index")
+            per_fn["hit_ratio"] = (per_fn["hits"] / (per_fn["hits"] + per_fn["misses"]).replace(0, np.nan)).round(3)
+            per_fn["MB"] = (per_fn.pop("bytes") / 2**20).round(2)
+            st.dataframe(per_fn, width="stretch")
+        entries = query_cache.CACHE.entries()
+        if entries:
+            df_entries = pd.DataFrame(entries)
+            df_entries["MB"] = (df_entries.pop("bytes") / 2**20).round(3)
+            st.dataframe(df_entries, width="stretch", hide_index=True)
+        if st.button("Wyczyść cache zapytań", key="query_cache_clear"):
+            st.toast(f"Usunięto {query_cache.CACHE.clear()} wpisów")
+
+
+def render_perf_panel(prefix: str):
+    """Czasy etapów bieżącego reruna + historia krocząca (do perf.PERF_HISTORY_LEN reranów)."""
+    st.write("Czasy etapów (ten rerun, ms):")
+    st.dataframe(perf.stages_frame(run_timer.snapshot(), prefix=prefix), width="stretch", hide_index=True)
+    hist = perf.history_frame(st.session_state.get("perf_history", []), prefix=prefix)
+    if not hist.empty:
+        st.write(f"Historia — ostatnie {len(hist)} reruny (ms):")
+        st.line_chart(hist)
+        st.dataframe(hist.describe().T[["mean", "50%", "max"]].round(1), width="stretch")
 
 
 # ─────────────────────────────────────────────────────────────
@@ -1095,12 +1724,24 @@ def render_platform(platform_key: str,
                     platform_title: str,
                     sql_query: str,
                     sql_orders: str,
+                    sql_live: str,
                     currency_label: str,
                     currency_symbol: str):
     st.header(platform_title)
 
-    # Snapshot SKU
-    df = query_snapshot(sql_query, week_start.isoformat())
+    # Snapshot SKU — w trybie na żywo ze stanu live_week (przyrostowo), ten sam kształt co query_snapshot
+    live, live_now = None, time.time()
+    with perf.stage(f"{platform_key}/query"):
+        if live_mode:
+            live = refresh_live_week(platform_key, sql_live, week_start, force=live_refresh)
+            df = live.snapshot(live_now)
+            live_stats = live.stats()
+            if live_stats["last_poll"]:
+                st.caption(f"🔴 Stan na {datetime.fromtimestamp(live_stats['last_poll'], TZ):%H:%M:%S} • "
+                           f"linii w stanie: {live_stats['lines']:,} • pobrano łącznie: {live_stats['rows_fetched']:,}")
+        else:
+            df = query_snapshot(sql_query, week_start.isoformat())
+        df = with_product_names(df)  # fakty z cache / stanu na żywo + nazwy z wymiaru produktów
     if df.empty:
         st.warning(f"Brak danych dla wybranego tygodnia ({currency_label}).")
         return
@@ -1112,42 +1753,31 @@ def render_platform(platform_key: str,
         st.dataframe(df.head(), width="stretch")
         return
 
-    # 👉 ŚREDNIE CENY NA PEŁNYM ZBIORZE (df) – potrzebne dla tabel Wzrosty/Spadki
-    if {"curr_rev", "curr_qty", "prev_rev", "prev_qty"}.issubset(df.columns):
-        df["avg_price_week"] = np.where(df["curr_qty"] > 0, df["curr_rev"] / df["curr_qty"], np.nan)
-        df["avg_price_prev"] = np.where(df["prev_qty"] > 0, df["prev_rev"] / df["prev_qty"], np.nan)
-        df["avg_price_delta"] = df["avg_price_week"] - df["avg_price_prev"]
-        df["avg_price_delta_pct"] = np.where(
-            (df["avg_price_prev"] > 0) & np.isfinite(df["avg_price_prev"]),
-            (df["avg_price_week"] - df["avg_price_prev"]) / df["avg_price_prev"] * 100.0,
-            np.nan
-        )
-        # Zaokrąglenia do prezentacji
-        df["avg_price_week"] = df["avg_price_week"].round(2)
-        df["avg_price_prev"] = df["avg_price_prev"].round(2)
-        df["avg_price_delta"] = df["avg_price_delta"].round(2)
-        df["avg_price_delta_pct"] = df["avg_price_delta_pct"].round(1)
-
-    # TOP N
-    df_top = df.sort_values("curr_rev", ascending=False).head(top_n).copy()
-    df_top["status_rev"], df_top["color_rev"] = zip(
-        *df_top["rev_change_pct"].apply(lambda x: classify_change_symbol(x, threshold_rev)))
-    df_top["status_qty"], df_top["color_qty"] = zip(
-        *df_top["qty_change_pct"].apply(lambda x: classify_change_symbol(x, threshold_qty)))
-
-    # KPI sumy
-    sum_curr = float(df["curr_rev"].sum() or 0)
-    sum_prev = float(df["prev_rev"].sum() or 0)
-    delta_abs = sum_curr - sum_prev
-    delta_pct = (delta_abs / sum_prev * 100) if sum_prev else 0.0
+    # Ustawienia tabel Wzrosty/Spadki — potrzebne już przy liczeniu metryk
+    max_rows = st.sidebar.slider("Wierszy na stronę (Wzrosty/Spadki)", 10, 500, 100, step=10,
+                                 key=f"max_rows_{platform_key}")
+    include_new = st.sidebar.checkbox("Traktuj nowe SKU (prev=0 & curr>0) jako wzrost", value=True,
+                                      key=f"incl_new_{platform_key}")
+
+    # Średnie ceny, TOP N, statusy, KPI, waterfall i zbiory wzrostów/spadków — jeden przebieg (analytics.py)
+    with perf.stage(f"{platform_key}/derive"):
+        metrics = analytics.compute_platform_metrics(
+            df, top_n, threshold_rev, threshold_qty, include_new=include_new, currency_symbol=currency_symbol)
+        df_top = metrics.df_top
+        sum_curr, sum_prev = metrics.sum_curr, metrics.sum_prev
+        delta_abs, delta_pct = metrics.delta_abs, metrics.delta_pct
 
     # AOV (średnia wartość koszyka)
-    df_ord = query_order_counts(sql_orders, week_start.isoformat())
+    with perf.stage(f"{platform_key}/query_orders"):
+        if live is not None:
+            df_ord = live.order_counts(live_now)
+        else:
+            df_ord = query_order_counts(sql_orders, week_start.isoformat())
     orders_curr = int(df_ord["orders_curr"].iloc[0]) if not df_ord.empty and "orders_curr" in df_ord.columns else 0
     orders_prev = int(df_ord["orders_prev"].iloc[0]) if not df_ord.empty and "orders_prev" in df_ord.columns else 0
 
-    aov_curr = (sum_curr / orders_curr) if orders_curr else np.nan
-    aov_prev = (sum_prev / orders_prev) if orders_prev else np.nan
+    aov_curr = analytics.aov(sum_curr, orders_curr)
+    aov_prev = analytics.aov(sum_prev, orders_prev)
     aov_delta = (aov_curr - aov_prev) if (pd.notna(aov_curr) and pd.notna(aov_prev)) else np.nan
 
     # Sticky KPI
@@ -1178,153 +1808,73 @@ def render_platform(platform_key: str,
 
     # TOP N — wykres
     st.subheader(f"TOP {top_n} — Sprzedaż tygodnia ({currency_label})")
-    colors = df_top["color_rev"].tolist()
-    hover = df_top.apply(
-        lambda r: (
-            f"{r.sku} — {r.product_name}"
-            f"<br>Sprzedaż: {r.curr_rev:,.2f} {currency_symbol}".replace(",", " ")
-            + ("" if pd.isna(r.rev_change_pct) else f"<br>Zmiana: {r.rev_change_pct:+.2f}%")
-        ),
-        axis=1
-    )
-    fig = go.Figure(go.Bar(
-        x=df_top["curr_rev"],
-        y=df_top["sku"],
-        orientation="h",
-        marker=dict(color=colors),
-        hoverinfo="text",
-        hovertext=hover
-    ))
-    fig.update_layout(yaxis={"categoryorder": "total ascending"}, height=520, margin=dict(l=150))
-    st.plotly_chart(fig, width="stretch")
+    # Figury z figures.FIGURES (LRU na proces, klucz = odcisk danych) — rerun z tymi samymi danymi ich nie buduje
+    with perf.stage(f"{platform_key}/figures"):
+        fig = figures.top_bar(metrics)
+        fig_wf = figures.waterfall(metrics.wf_x, metrics.wf_y, metrics.wf_measure, currency_label)
+    st.plotly_chart(fig, width="stretch", key=f"top_bar_{platform_key}")
 
-    # Waterfall
     st.subheader("📊 Wkład TOP produktów w zmianę sprzedaży (waterfall)")
-    df_delta = df_top.copy()
-    df_delta["delta"] = df_delta["curr_rev"] - df_delta["prev_rev"]
-    df_delta = df_delta.sort_values("delta", ascending=False).reset_index(drop=True)
-
-    measures = ["relative"] * len(df_delta) + ["total"]
-    x = df_delta["sku"].tolist() + ["SUMA"]
-    y = df_delta["delta"].tolist() + [df_delta["delta"].sum()]
-
-    fig_wf = go.Figure(go.Waterfall(
-        x=x,
-        y=y,
-        measure=measures,
-        text=[f"{v:,.2f}" for v in y],
-        textposition="outside"
-    ))
-    fig_wf.update_traces(
-        increasing=dict(marker=dict(color="#66bb6a")),
-        decreasing=dict(marker=dict(color="#ef5350")),
-        totals=dict(marker=dict(color="#42a5f5"))
-    )
-    fig_wf.update_layout(title=f"Wkład produktów w zmianę sprzedaży ({currency_label})", showlegend=False, height=420)
-    st.plotly_chart(fig_wf, width="stretch")
+    st.plotly_chart(fig_wf, width="stretch", key=f"waterfall_{platform_key}")
 
     # Trend tygodniowy — bogaty hover
     st.subheader("📈 Trendy tygodniowe — wybierz SKU do analizy trendu")
 
-    df_trend = query_trend_many_weeks(sql_query, week_start, weeks=weeks_back)
+    with perf.stage(f"{platform_key}/trend_query"):
+        df_trend = query_trend_many_weeks(sql_query, week_start, weeks=weeks_back)
     if df_trend.empty:
         st.info("Brak danych trendu (dla wybranej liczby tygodni).")
     else:
 
-        all_skus = sorted(df_trend["sku"].dropna().unique().tolist())
-
-        # Domyślne TOP5 wg sumarycznej sprzedaży w horyzoncie trendu (bezpieczny fallback gdy filtr jest pusty)
-        try:
-            top_by_rev = (df_trend.groupby('sku', as_index=False)['curr_rev']
-                          .sum().sort_values('curr_rev', ascending=False)['sku'].head(5).tolist())
-        except Exception:
-            top_by_rev = all_skus[:5]
-
-        search_term = st.text_input(f"Szukaj SKU lub produktu — {platform_key}", "")
-        if search_term:
-            filtered_skus = [sku for sku in all_skus if search_term.lower() in str(sku).lower()]
-            if not filtered_skus:
-                st.info("🔎 Brak wyników dla filtra — pokazuję listę wszystkich SKU.")
-                filtered_skus = all_skus
-        else:
-            filtered_skus = all_skus
-
-        default_selection = [sku for sku in top_by_rev if sku in filtered_skus][:5] or filtered_skus[:5]
+        search_index = get_trend_search_index(sql_query, week_start, weeks_back)
+
+        # Wybór trzymany w session_state — opcje multiselecta zmieniają się ze stroną wyników,
+        # a wybrane SKU muszą w nich zostać. Domyślnie TOP5 wg sprzedaży w horyzoncie trendu.
+        kept_key = f"trend_pick_{platform_key}"
+        kept = st.session_state.get(kept_key, search_index.top(5))
+
+        s1, s2 = st.columns([3, 1])
+        search_term = s1.text_input(f"Szukaj SKU lub produktu — {platform_key}", "")
+        page = s2.number_input(f"Strona wyników — {platform_key}", min_value=1, value=1, step=1)
+        n_hits, _ = search_index.search(search_term, limit=0)
+        if search_term and not n_hits:
+            st.info("🔎 Brak wyników dla filtra — pokazuję listę wszystkich SKU.")
+            search_term = ""
+            n_hits = len(search_index)
+        n_pages = max(1, -(-n_hits // TREND_SEARCH_PAGE))
+        page = min(int(page), n_pages)
+        _, page_skus = search_index.search(search_term, limit=TREND_SEARCH_PAGE,
+                                           offset=(page - 1) * TREND_SEARCH_PAGE)
+        st.caption(f"Trafień: {n_hits:,} • strona {page}/{n_pages} • {TREND_SEARCH_PAGE} na stronę")
+
+        kept_set = set(kept)
         pick_skus = st.multiselect(
             f"Wybierz SKU do analizy trendu — {platform_key}",
-            options=filtered_skus,
-            default=default_selection
+            options=list(kept) + [sku for sku in page_skus if sku not in kept_set],
+            default=kept,
+            format_func=search_index.label,
         )
+        st.session_state[kept_key] = pick_skus
+        pick_skus = [sku for sku in pick_skus if sku in search_index]
 
         chart_type = st.radio(f"Typ wykresu — {platform_key}", ["area", "line"], index=1, horizontal=True)
+        r1, r2 = st.columns(2)
+        render_mode = r1.radio(f"Renderowanie — {platform_key}", ["auto", "SVG", "WebGL"], horizontal=True,
+                               help="auto: WebGL (Scattergl) powyżej "
+                                    f"{TREND_WEBGL_MIN_POINTS:,} punktów; wykres warstwowy zawsze w SVG")
+        decimate = r2.checkbox(f"Decymacja punktów (maks. {TREND_MAX_POINTS} na serię) — {platform_key}",
+                               value=False, disabled=chart_type == "area",
+                               help="Tylko dla wykresu liniowego — warstwowy zawsze pokazuje wszystkie punkty")
 
         if pick_skus:
-            df_plot = df_trend[df_trend["sku"].isin(pick_skus)].copy()
-            df_plot = df_plot.groupby(["week_start", "sku"], as_index=False)[["curr_rev", "curr_qty"]].sum()
-
-            full_weeks = pd.date_range(
-                start=df_plot["week_start"].min().normalize(),
-                end=df_plot["week_start"].max().normalize(),
-                freq="W-MON"
-            )
-
-            pv_rev = df_plot.pivot(index="week_start", columns="sku", values="curr_rev").reindex(full_weeks).fillna(0.0)
-            pv_qty = df_plot.pivot(index="week_start", columns="sku", values="curr_qty").reindex(full_weeks).fillna(0.0)
-
-            week_end_labels = (pv_rev.index + pd.Timedelta(days=6)).strftime("%Y-%m-%d").values
-
-            fig_tr = go.Figure()
-            for sku in pv_rev.columns:
-                y = pv_rev[sku].values.astype(float)
-                q = pv_qty[sku].values.astype(float)
-                prev = np.concatenate(([np.nan], y[:-1]))
-                wow_abs = y - prev
-                wow_pct = np.where((prev > 0) & np.isfinite(prev), (y - prev) / prev * 100.0, np.nan)
-
-                custom = np.column_stack([q, wow_abs, wow_pct, week_end_labels])
-                hovertemplate = (
-                        "<b>%{fullData.name}</b><br>"
-                        "Tydzień: %{x|%Y-%m-%d} → %{customdata[3]}<br>"
-                        "Sprzedaż: %{y:,.2f} " + currency_symbol + "<br>"
-                                                                   "Ilość: %{customdata[0]:,.2f} szt.<br>"
-                                                                   "WoW: %{customdata[1]:+,.2f} " + currency_symbol + " (%{customdata[2]:+.2f}%)"
-                                                                                                                      "<extra></extra>"
-                )
-
-                if chart_type == "area":
-                    fig_tr.add_trace(
-                        go.Scatter(
-                            x=pv_rev.index, y=y, name=sku, mode="lines",
-                            stackgroup="one", customdata=custom, hovertemplate=hovertemplate
-                        )
-                    )
-                else:
-                    fig_tr.add_trace(
-                        go.Scatter(
-                            x=pv_rev.index, y=y, name=sku, mode="lines",
-                            customdata=custom, hovertemplate=hovertemplate
-                        )
-                    )
-
-            fig_tr.update_layout(height=460, xaxis_title="Tydzień", yaxis_title=f"Sprzedaż ({currency_label})")
-            st.plotly_chart(fig_tr, use_container_width=True)
-
-    # Tabele — REALNA skala (pełny df), z limitem i wyborem kolumn
-    max_rows = st.sidebar.slider("Limit wierszy w tabelach (Wzrosty/Spadki)", 10, 500, 100, step=10,
-                                 key=f"max_rows_{platform_key}")
-    include_new = st.sidebar.checkbox("Traktuj nowe SKU (prev=0 & curr>0) jako wzrost", value=True,
-                                      key=f"incl_new_{platform_key}")
-
-    cond_up = (df["rev_change_pct"] >= threshold_rev)
-    if include_new:
-        cond_up = cond_up | ((df["prev_rev"].fillna(0) == 0) & (df["curr_rev"].fillna(0) > 0))
-
-    ups_all = df[cond_up].copy()
-    downs_all = df[df["rev_change_pct"] <= -threshold_rev].copy()
-
-    # Sortowanie wg sprzedaży tygodnia
-    ups = ups_all.sort_values("curr_rev", ascending=False).head(max_rows)
-    downs = downs_all.sort_values("curr_rev", ascending=False).head(max_rows)
+            with perf.stage(f"{platform_key}/trend_figure"):
+                weeks, skus, rev, qty = analytics.trend_matrix(df_trend, pick_skus)
+                use_webgl = chart_type == "line" and (
+                    render_mode == "WebGL" or (render_mode == "auto" and rev.size >= TREND_WEBGL_MIN_POINTS))
+                fig_tr = figures.trend(weeks, skus, rev, qty, chart_type, use_webgl,
+                                       TREND_MAX_POINTS if decimate and chart_type == "line" else None,
+                                       currency_symbol, currency_label)
+            st.plotly_chart(fig_tr, width="stretch", key=f"trend_{platform_key}")
 
     # Wybór kolumn – w Sidebar (lista z mapowania, nie z próbki danych)
     display_map = {k: v.replace("{CUR}", currency_label) for k, v in COLS_DISPLAY_BASE.items()}
@@ -1338,26 +1888,18 @@ def render_platform(platform_key: str,
     if not selected_cols:
         selected_cols = available_cols
 
+    # Tabele — REALNA skala (pełny df), stronicowane po stronie serwera: do przeglądarki idzie jedna strona
     colA, colB = st.columns(2)
-    with colA:
-        st.markdown("### 🚀 Wzrosty (≥ próg)")
-        if ups.empty:
-            st.info(f"Brak pozycji przekraczających próg wzrostu. (Na pełnym zbiorze: {len(ups_all):,})")
-        else:
-            st.caption(f"Łącznie spełnia warunek: {len(ups_all):,} • Pokazuję: {min(len(ups_all), max_rows):,}")
-            df_disp = to_display(ups, currency_label)
-            show_cols = [c for c in selected_cols if c in df_disp.columns] or list(df_disp.columns)
-            st.dataframe(df_disp[show_cols], width="stretch")
-
-    with colB:
-        st.markdown("### 📉 Spadki (≤ -próg)")
-        if downs.empty:
-            st.info(f"Brak pozycji przekraczających próg spadku. (Na pełnym zbiorze: {len(downs_all):,})")
-        else:
-            st.caption(f"Łącznie spełnia warunek: {len(downs_all):,} • Pokazuję: {min(len(downs_all), max_rows):,}")
-            df_disp = to_display(downs, currency_label)
-            show_cols = [c for c in selected_cols if c in df_disp.columns] or list(df_disp.columns)
-            st.dataframe(df_disp[show_cols], width='stretch')
+    with perf.stage(f"{platform_key}/tables"):
+        with colA:
+            st.markdown("### 🚀 Wzrosty (≥ próg)")
+            render_paged_table(f"ups_{platform_key}", df, metrics.up_mask, week_start, currency_label, selected_cols,
+                               max_rows, empty_msg="Brak pozycji przekraczających próg wzrostu.")
+
+        with colB:
+            st.markdown("### 📉 Spadki (≤ -próg)")
+            render_paged_table(f"downs_{platform_key}", df, metrics.down_mask, week_start, currency_label,
+                               selected_cols, max_rows, empty_msg="Brak pozycji przekraczających próg spadku.")
 
     with st.expander("🔎 Podgląd TOP (tabela)"):
         st.dataframe(to_display(df_top, currency_label), width="stretch")
@@ -1365,188 +1907,328 @@ def render_platform(platform_key: str,
     # Eksport
     st.subheader("📥 Eksport danych")
     d1, d2, d3, d4 = st.columns(4)
-    csv_bytes = df.to_csv(index=False).encode("utf-8")
+    # Excel i PDF budowane dopiero po kliknięciu (data=callable) — rerun nie importuje openpyxl/reportlab
+    with perf.stage(f"{platform_key}/exports"):
+        csv_bytes = df.to_csv(index=False).encode("utf-8")
     d1.download_button(f"📥 Pobierz (CSV) — {platform_key}", csv_bytes, f"sprzedaz_{platform_key}.csv", "text/csv")
-    excel_bytes = to_excel_bytes(df)
-    d2.download_button(f"📥 Pobierz (Excel) — {platform_key}", excel_bytes, f"sprzedaz_{platform_key}.xlsx",
+    d2.download_button(f"📥 Pobierz (Excel) — {platform_key}", lambda: to_excel_bytes(df),
+                       f"sprzedaz_{platform_key}.xlsx",
                        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    pdf_bytes = df_to_pdf_bytes(to_display(df_top, currency_label),
-                                title=f"TOP{top_n} - raport tygodniowy - {platform_key}")
-    d3.download_button(f"📥 Pobierz (PDF) — TOP — {platform_key}", pdf_bytes,
+    d3.download_button(f"📥 Pobierz (PDF) — TOP — {platform_key}",
+                       lambda: df_to_pdf_bytes(to_display(df_top, currency_label),
+                                               title=f"TOP{top_n} - raport tygodniowy - {platform_key}"),
                        f"sprzedaz_top_{platform_key}.pdf", "application/pdf")
 
-    if st.button(f"📊 Generuj Raport Kadrowy (PDF) - {platform_key}"):
-        with st.spinner("Generowanie raportu..."):
-            pdf_executive = generate_executive_pdf_report(
-                platform_key=platform_key,
-                platform_title=platform_title,
-                df=df,
-                df_top=df_top,
-                sum_curr=sum_curr,
-                sum_prev=sum_prev,
-                orders_curr=orders_curr,
-                orders_prev=orders_prev,
-                aov_curr=aov_curr,
-                aov_prev=aov_prev,
-                currency_label=currency_label,
-                currency_symbol=currency_symbol,
-                week_start=week_start,
-                week_end=week_end
-            )
-
-            st.download_button(
-                f"⬇️ Pobierz Raport Kadrowy - {platform_key}",
-                pdf_executive,
-                f"raport_kadrowy_{platform_key}_{week_start.isoformat()}.pdf",
-                "application/pdf"
-            )
+    report_kwargs = dict(
+        platform_key=platform_key,
+        platform_title=platform_title,
+        df=df,
+        df_top=df_top,
+        sum_curr=sum_curr,
+        sum_prev=sum_prev,
+        orders_curr=orders_curr,
+        orders_prev=orders_prev,
+        aov_curr=aov_curr,
+        aov_prev=aov_prev,
+        currency_label=currency_label,
+        currency_symbol=currency_symbol,
+        week_start=week_start,
+        week_end=week_end
+    )
+    # Raport tych samych danych był już wygenerowany (dowolna sesja / proces) → od razu przycisk pobrania
+    pdf_executive = PDF_CACHE.get(executive_pdf_cache_path(**report_kwargs))
+    if pdf_executive is None and st.button(f"📊 Generuj Raport Kadrowy (PDF) - {platform_key}"):
+        with st.spinner("Generowanie raportu..."), perf.stage(f"{platform_key}/executive_pdf"):
+            pdf_executive, _ = generate_executive_pdf_report_cached(**report_kwargs)
+    if pdf_executive is not None:
+        st.download_button(
+            f"⬇️ Pobierz Raport Kadrowy - {platform_key}",
+            pdf_executive,
+            f"raport_kadrowy_{platform_key}_{week_start.isoformat()}.pdf",
+            "application/pdf"
+        )
     # QA / Debug
     with st.expander(f"🔧 Panel QA / Debug — {platform_key}"):
         st.write("Metabase HTTP:", st.session_state.get("mb_last_status"))
         st.write("Liczba wierszy (snapshot):", len(df))
         st.write("Liczba SKU w snapshot:", df["sku"].nunique())
         st.write("Zamówienia (tydzień / poprzedni):", orders_curr, orders_prev)
+        st.write("Cache raportów PDF (proces):", PDF_CACHE.stats())
+        st.write("Cache figur Plotly (proces):", figures.FIGURES.stats())
+        if live is not None:
+            st.write("Tryb na żywo (proces):", live.stats())
+        render_perf_panel(platform_key)
         if debug_api:
             st.subheader("Raw JSON (Metabase)")
             st.json(st.session_state.get("mb_last_json"))
 
 
 # Mapa polski
+MAP_CUBE_WEEKS = 8  # tygodnie do wyboru na mapie; kostka ma o 1 więcej, żeby każdy miał poprzednika (WoW)
+MAP_METRICS = {
+    "revenue": "Bieżący tydzień (zł)",
+    "prev": "Poprzedni tydzień (zł)",
+    "delta": "Zmiana WoW (zł)",
+    "share": "Udział w sumie (%)",
+}
+MAP_COLORSCALE = [[0.0, "#ffc8ff"], [1.0, "#0000ff"]]  # ta sama skala co analytics.sequential_colors
+MAP_COLORSCALE_DIVERGING = [[0.0, "#d32f2f"], [0.5, "#ffffff"], [1.0, "#388e3c"]]  # analytics.diverging_colors
+
+
+def region_metric_values(region_totals: pd.DataFrame, locations: list, metric: str) -> np.ndarray:
+    """Wartości wybranej miary w kolejności locations (brak województwa w danych = 0)."""
+    frame = region_totals.set_index("region").reindex(locations)
+    if metric == "prev":
+        return frame["prev_total"].fillna(0.0).to_numpy()
+    if metric == "delta":
+        return frame["delta"].fillna(0.0).to_numpy()
+    revenue = frame["region_total"].fillna(0.0).to_numpy()
+    if metric == "share":
+        total = revenue.sum()
+        return revenue / total * 100 if total > 0 else revenue
+    return revenue
+
+
+@st.cache_data(ttl=600, max_entries=32)
+def build_region_choropleth(week_start_iso: str, metric: str, resolution: str, data_fp: str,
+                            _region_totals: pd.DataFrame, _hover_text: dict) -> tuple["go.Figure", list]:
+    """Choropleth województw jako jeden ślad Plotly — cache per (tydzień, miara, dokładność granic, dane).
+
+    Ramki nie są hashowane przez Streamlit — kluczem jest data_fp (odcisk _region_totals i _hover_text), więc
+    ponowne pobranie kostki albo tydzień na żywo dają nową figurę zamiast nieaktualnej z cache.
+    Zwraca (figura, lista województw w kolejności punktów) — do mapowania kliknięcia na województwo.
+    """
+    import plotly.graph_objects as go
+
+    geojson, by_name = geo_assets.load_regions(resolution)
+    locations = [name for name in by_name if name]
+    z = region_metric_values(_region_totals, locations, metric)
+    if metric == "delta":
+        scale = dict(colorscale=MAP_COLORSCALE_DIVERGING, zmid=0.0)
+    else:
+        scale = dict(colorscale=MAP_COLORSCALE)
+    text = [_hover_text.get(name, f"<b>{name}</b><br>Brak danych") for name in locations]
+
+    fig = go.Figure(go.Choropleth(
+        geojson=geojson,
+        featureidkey="properties.name",
+        locations=locations,
+        z=z,
+        **scale,
+        marker_line_color="black",
+        marker_line_width=1,
+        colorbar_title="Udział %" if metric == "share" else "zł",
+        hovertext=text,
+        hovertemplate="%{hovertext}<extra></extra>",
+    ))
+    fig.update_geos(fitbounds="locations", visible=False)
+    fig.update_layout(height=600, margin=dict(l=0, r=0, t=0, b=0), clickmode="event+select")
+    return fig, locations
+
+
+def render_date_range():
+    """Dowolny zakres dat z agregatów dziennych (day_cache): okres vs okres porównawczy, kubełki D / W / M."""
+    st.header("📅 Dowolny zakres dat")
+    today = datetime.now(TZ).date()
+    c1, c2, c3 = st.columns(3)
+    platform = c1.selectbox("Platforma", PLATFORMS, format_func=lambda p: p["platform_title"], key="range_platform")
+    preset = c2.radio("Okres", ["Ten miesiąc vs poprzedni", "Ostatnie 30 dni vs poprzednie 30", "Własny zakres"],
+                      key="range_preset")
+    granularity = c3.radio("Szczegółowość", list(day_cache.GRANULARITY), horizontal=True, key="range_granularity")
+    if preset == "Ten miesiąc vs poprzedni":
+        start, end, mode = today.replace(day=1), today, "month"
+    elif preset == "Ostatnie 30 dni vs poprzednie 30":
+        start, end, mode = today - timedelta(days=29), today, "same_length"
+    else:
+        picked = st.date_input("Zakres (od – do)", value=(today - timedelta(days=13), today), max_value=today,
+                               key="range_dates")
+        if not isinstance(picked, tuple) or len(picked) != 2:
+            st.info("Wybierz datę początkową i końcową zakresu.")
+            return
+        (start, end), mode = picked, "same_length"
+    if (end - start).days + 1 > day_cache.MAX_RANGE_DAYS:
+        st.warning(f"Maksymalny zakres to {day_cache.MAX_RANGE_DAYS} dni.")
+        return
+    prev_start, prev_end = day_cache.previous_period(start, end, mode)
+    currency_label, currency_symbol = platform["currency_label"], platform["currency_symbol"]
+
+    # Dni z cache zapytań + brakujące dni ciągłymi odcinkami (jedno zapytanie na odcinek)
+    def fetch(a: date, b: date) -> pd.DataFrame | None:
+        return query_daily(SQL_DAILY[platform["platform_key"]], a, b)
+
+    with perf.stage("range/query"):
+        curr_rows, curr_stats = day_cache.load_days(platform["platform_key"], start, end, fetch, today)
+        prev_rows, prev_stats = day_cache.load_days(platform["platform_key"], prev_start, prev_end, fetch, today)
+    cached, fetched, queries = (curr_stats[k] + prev_stats[k] for k in ("cached", "fetched", "queries"))
+    st.caption(f"Okres: **{start} → {end}** vs **{prev_start} → {prev_end}**  •  dni z cache: {cached}, "
+               f"pobrane: {fetched} ({queries} zapytań)")
+
+    curr_sku, curr_tot = day_cache.split(curr_rows)
+    prev_sku, prev_tot = day_cache.split(prev_rows)
+    if curr_sku.empty:
+        st.warning(f"Brak danych dla wybranego zakresu ({currency_label}).")
+        return
+
+    with perf.stage("range/derive"):
+        sum_curr, sum_prev = float(curr_tot["revenue"].sum()), float(prev_tot["revenue"].sum())
+        orders_curr, orders_prev = int(curr_tot["orders"].sum()), int(prev_tot["orders"].sum())
+        delta_pct = float(analytics.change_pct(sum_curr, sum_prev))
+        aov_curr, aov_prev = analytics.aov(sum_curr, orders_curr), analytics.aov(sum_prev, orders_prev)
+        freq = day_cache.GRANULARITY[granularity]
+        fig = figures.period_compare(day_cache.series(curr_tot, start, end, freq),
+                                     day_cache.series(prev_tot, prev_start, prev_end, freq), currency_label)
+        df_range = with_product_names(analytics.period_snapshot(curr_sku, prev_sku))
+
+    k1, k2, k3, k4 = st.columns(4)
+    k1.metric(f"Suma sprzedaży ({currency_label}, okres)", f"{sum_curr:,.2f} {currency_symbol}".replace(",", " "))
+    k2.metric(f"Zmiana vs porównawczy ({currency_label})",
+              f"{sum_curr - sum_prev:,.2f} {currency_symbol}".replace(",", " "))
+    k3.metric("Zmiana % całości", f"{delta_pct:+.2f}%" if pd.notna(delta_pct) else "—")
+    k4.metric("Średnia wartość koszyka",
+              f"{aov_curr:,.2f} {currency_symbol}".replace(",", " ") if pd.notna(aov_curr) else "—",
+              delta=(f"{aov_curr - aov_prev:+,.2f} {currency_symbol}".replace(",", " ")
+                     if pd.notna(aov_curr) and pd.notna(aov_prev) else None))
+
+    st.plotly_chart(fig, width="stretch", key="range_chart")
+
+    rows = st.slider("Ile SKU w tabeli", 20, 1000, 100, step=20, key="range_rows")
+    labels = {"sku": "SKU", "product_name": "Produkt", "curr_rev": f"Sprzedaż okresu ({currency_label})",
+              "curr_qty": "Ilość okresu (szt.)", "prev_rev": f"Sprzedaż okresu porównawczego ({currency_label})",
+              "prev_qty": "Ilość okresu porównawczego (szt.)", "rev_change_pct": "Zmiana sprzedaży %",
+              "qty_change_pct": "Zmiana ilości %"}
+    st.dataframe(df_range.head(rows).rename(columns=labels), width="stretch", hide_index=True)
+    st.download_button("📥 Pobierz (CSV) — zakres", df_range.to_csv(index=False).encode("utf-8"),
+                       f"sprzedaz_{platform['platform_key']}_{start.isoformat()}_{end.isoformat()}.csv", "text/csv")
+    with st.expander("🔧 Panel QA / Debug — zakres dat"):
+        render_perf_panel("range")
+
+
 def render_poland_map(week_start: date):
     st.header("🗺️ Sprzedaż wg województw (na podstawie ZIP)")
 
-    # ETAP 1: Pobierz zagregowane dane województw (mało wierszy)
-    df_regions = query_snapshot(SQL_WOW_POLAND_REGION_ONLY, week_start.isoformat())
+    # Kostka województwo × SKU × tydzień — jedno pobranie CSV na horyzont, dalej tylko wycinki w pamięci
+    with perf.stage("map/query"):
+        cube = get_region_cube(week_start.isoformat(), MAP_CUBE_WEEKS + 1)
 
-    if df_regions.empty:
+    if not cube.totals.any():
         st.warning("Brak danych adresów ZIP dla tego tygodnia.")
         return
 
-    df_regions["region"] = df_regions["zip_prefix"].map(ZIP_TO_REGION)
-    df_regions = df_regions.dropna(subset=["region"])
+    # bieżący i poprzedni tydzień pochodzą z tego samego pobrania — porównanie WoW bez dodatkowego zapytania
+    map_week = st.select_slider("Tydzień na mapie", options=list(cube.weeks[1:]), value=cube.weeks[-1],
+                                format_func=lambda d: d.strftime("%Y-%m-%d"), key="map_week")
+    w = cube.week_index(map_week)
 
-    # Agreguj do poziomu województw
-    region_totals = df_regions.groupby("region", as_index=False)["revenue"].sum().rename(
-        columns={"revenue": "region_total"})
+    with perf.stage("map/derive"):
+        df_products = cube.top_products_frame(w, 10)
+        region_totals = cube.region_totals_frame(w)
 
-    # KPI
-    st.metric("Łączna sprzedaż (wszystkie regiony)", f"{region_totals['region_total'].sum():,.0f} zł".replace(",", " "))
-
-    # ETAP 2: Pobierz TOP produkty (TOP 10 na województwo)
-    df_products = query_snapshot(SQL_WOW_POLAND_TOP_PRODUCTS, week_start.isoformat())
-
-    if not df_products.empty:
-        df_products["region"] = df_products["zip_prefix"].map(ZIP_TO_REGION)
-        df_products = df_products.dropna(subset=["region"])
-
-        # Przygotuj tooltips z TOP produktami
-        hover_text = {}
-        for region, sub in df_products.groupby("region"):
-            sub_sorted = sub.sort_values("revenue", ascending=False)
-            total = region_totals[region_totals["region"] == region]["region_total"].iloc[0]
-            lines = [f"<b>{region}</b><br>Łącznie: {total:,.0f} zł<br><br>TOP 5:"]
-            for i, (_, row) in enumerate(sub_sorted.head(5).iterrows(), 1):
-                pct = (row["revenue"] / total * 100) if total > 0 else 0
-                lines.append(f"{i}. {row['sku']}: {row['revenue']:,.0f} zł ({pct:.1f}%)")
-            hover_text[region] = "<br>".join(lines)
-    else:
-        hover_text = {}
-        for _, row in region_totals.iterrows():
-            hover_text[
-                row["region"]] = f"<b>{row['region']}</b><br>Łącznie: {row['region_total']:,.0f} zł<br>Brak szczegółów"
-
-    # MAPA FOLIUM
-    import os
-    geojson_path = os.path.join(os.path.dirname(__file__), "polska-wojewodztwa.geojson")
-
-    if not os.path.exists(geojson_path):
-        st.error(f"Nie znaleziono pliku GeoJSON: {geojson_path}")
-        return
+        # Tooltipy z TOP 5 — ranking, udziały i napisy dla wszystkich województw naraz
+        hover_text = analytics.region_hover_text(df_products, region_totals, top_k=5)
 
+    # KPI
+    sum_curr, sum_prev = region_totals["region_total"].sum(), region_totals["prev_total"].sum()
+    kpi_cols = st.columns(2)
+    kpi_cols[0].metric("Łączna sprzedaż (wszystkie regiony)", f"{sum_curr:,.0f} zł".replace(",", " "),
+                       delta=f"{(sum_curr - sum_prev) / sum_prev * 100:+.1f}% WoW" if sum_prev else None)
+    kpi_cols[1].metric("Poprzedni tydzień", f"{sum_prev:,.0f} zł".replace(",", " "))
+
+    # MAPA — granice z uproszczonego assetu (cache na proces, patrz geo_assets.py)
+    geo_resolution = st.radio("Dokładność granic województw", ["low", "medium", "high", "full"],
+                              index=["low", "medium", "high", "full"].index(geo_assets.DEFAULT_RESOLUTION),
+                              horizontal=True)
+    map_cols = st.columns(2)
+    with map_cols[0]:
+        map_mode = st.radio("Tryb mapy", ["Choropleth (jedna warstwa)", "Folium (warstwa na województwo)"],
+                            horizontal=True, key="map_mode")
+    with map_cols[1]:
+        map_metric = st.radio("Miara", list(MAP_METRICS), format_func=MAP_METRICS.get,
+                              horizontal=True, key="map_metric")
     try:
-        with open(geojson_path, "r", encoding="utf-8") as f:
-            geojson = json.load(f)
+        with perf.stage("map/geojson"):
+            geojson, _ = geo_assets.load_regions(geo_resolution)
     except Exception as e:
         st.error(f"Błąd wczytywania GeoJSON: {e}")
         return
 
-    region_revenue_dict = region_totals.set_index("region")["region_total"].to_dict()
-
-    max_revenue = region_totals["region_total"].max()
-    min_revenue = region_totals["region_total"].min()
-
-    def get_color(revenue):
-        if revenue is None or pd.isna(revenue):
-            return "#e0e0e0"
-        if max_revenue == min_revenue:
-            return "#42a5f5"
-        norm = (revenue - min_revenue) / (max_revenue - min_revenue)
-        r = int(255 * (1 - norm))
-        g = int(200 * (1 - norm))
-        b = 255
-        return f"#{r:02x}{g:02x}{b:02x}"
-
-    m = folium.Map(location=[52.0, 19.0], zoom_start=6, tiles="CartoDB positron")
-
-    # Dodaj GeoJSON z popupami
-    for feature in geojson.get("features", []):
-        region_name = feature.get("properties", {}).get("nazwa")
-        revenue = region_revenue_dict.get(region_name, 0)
-
-        popup_content = hover_text.get(region_name, f"<b>{region_name}</b><br>Brak danych")
-
-        folium.GeoJson(
-            feature,
-            style_function=lambda x, rev=revenue: {
-                "fillColor": get_color(rev),
-                "color": "black",
-                "weight": 1.5,
-                "fillOpacity": 0.7 if rev > 0 else 0.3,
-            },
-            popup=folium.Popup(popup_content, max_width=300),
-            tooltip=f"{region_name}: {revenue:,.0f} zł" if revenue > 0 else f"{region_name}: brak danych"
-        ).add_to(m)
-
-    st_folium(m, width=1200, height=600)
+    if map_mode.startswith("Choropleth"):
+        # Jedna warstwa, kolory z danych; figura z cache (tydzień, miara, dokładność, odcisk danych) — klik
+        # wybiera województwo po stronie przeglądarki, a rerun bierze gotową figurę z cache zamiast budować mapę
+        with perf.stage("map/build_map"):
+            data_fp = report_cache.fingerprint(region_totals, hover=sorted(hover_text.items()))
+            fig_map, map_locations = build_region_choropleth(map_week.date().isoformat(), map_metric, geo_resolution,
+                                                             data_fp, region_totals, hover_text)
+        with perf.stage("map/render"):
+            map_event = st.plotly_chart(fig_map, width="stretch", on_select="rerun",
+                                        selection_mode="points", key="map_choropleth")
+        clicked = [map_locations[p["point_index"]] for p in (map_event.selection.points if map_event else [])
+                   if p.get("point_index") is not None and p["point_index"] < len(map_locations)]
+        if clicked and clicked[0] != st.session_state.get("map_region_clicked"):
+            st.session_state["map_region_clicked"] = clicked[0]
+            st.session_state["map_region"] = clicked[0]
+    else:
+        with perf.stage("map/build_map"):
+            import folium
+            from streamlit_folium import st_folium
+
+            # kolory dla wszystkich województw naraz (jedna funkcja wektorowa zamiast domknięcia per feature)
+            locations = [geo_assets.region_name(f) for f in geojson.get("features", [])]
+            values = region_metric_values(region_totals, locations, map_metric)
+            if map_metric == "delta":
+                fill = analytics.diverging_colors(values)
+            else:
+                fill = analytics.sequential_colors(values)
+            unit = "%" if map_metric == "share" else "zł"
+
+            m = folium.Map(location=[52.0, 19.0], zoom_start=6, tiles="CartoDB positron")
+
+            # Dodaj GeoJSON z popupami
+            for feature, region_name, value, color in zip(geojson.get("features", []), locations, values, fill):
+                popup_content = hover_text.get(region_name, f"<b>{region_name}</b><br>Brak danych")
+
+                folium.GeoJson(
+                    feature,
+                    style_function=lambda x, c=color, v=value: {
+                        "fillColor": c,
+                        "color": "black",
+                        "weight": 1.5,
+                        "fillOpacity": 0.7 if v != 0 else 0.3,
+                    },
+                    popup=folium.Popup(popup_content, max_width=300),
+                    tooltip=f"{region_name}: {value:,.0f} {unit}" if value != 0 else f"{region_name}: brak danych"
+                ).add_to(m)
+
+        with perf.stage("map/render"):
+            st_folium(m, width=1200, height=600)
 
     # WYKRES SŁUPKOWY
     st.subheader("📊 Sprzedaż według województw")
 
-    region_totals_sorted = region_totals.sort_values("region_total", ascending=False)
-
-    fig_bar = go.Figure(go.Bar(
-        x=region_totals_sorted["region_total"],
-        y=region_totals_sorted["region"],
-        orientation="h",
-        marker=dict(color=region_totals_sorted["region_total"], colorscale="Blues"),
-        text=region_totals_sorted["region_total"].apply(lambda x: f"{x:,.0f} zł"),
-        textposition="outside"
-    ))
-    fig_bar.update_layout(
-        xaxis_title="Przychód (zł)",
-        yaxis_title="Województwo",
-        height=400,
-        yaxis={"categoryorder": "total ascending"}
-    )
-    st.plotly_chart(fig_bar, use_container_width=True)
+    with perf.stage("map/figures"):
+        fig_bar = figures.region_bars(region_totals)
+    st.plotly_chart(fig_bar, width="stretch")
 
     # INTERAKTYWNY WYBÓR WOJEWÓDZTWA
     st.markdown("---")
+    region_options = sorted(region_totals["region"].tolist())
+    if st.session_state.get("map_region") not in region_options:
+        st.session_state.pop("map_region", None)
     selected_region = st.selectbox(
-        "🔍 Wybierz województwo, aby zobaczyć TOP produkty",
-        options=sorted(region_totals["region"].tolist()),
-        index=0
+        "🔍 Wybierz województwo, aby zobaczyć TOP produkty (lub kliknij je na mapie)",
+        options=region_options,
+        key="map_region"
     )
 
     if selected_region and not df_products.empty:
         region_data = df_products[df_products["region"] == selected_region].copy()
         region_data = region_data.sort_values("revenue", ascending=False)
+        total_region = float(region_data["region_total"].iloc[0]) if not region_data.empty else 0.0
 
         col1, col2 = st.columns(2)
         with col1:
             st.metric(
                 f"Sprzedaż w {selected_region}",
-                f"{region_data['revenue'].sum():,.0f} zł".replace(",", " ")
+                f"{total_region:,.0f} zł".replace(",", " ")
             )
         with col2:
             st.metric(
@@ -1557,7 +2239,6 @@ def render_poland_map(week_start: date):
         # TOP produktów w wybranym województwie
         st.markdown(f"#### TOP produkty w {selected_region}")
         top_products = region_data.head(10).copy()
-        total_region = region_data["revenue"].sum()
         top_products["share_pct"] = (top_products["revenue"] / total_region * 100).round(2)
         top_products["revenue_formatted"] = top_products["revenue"].apply(lambda x: f"{x:,.0f} zł")
 
@@ -1568,7 +2249,22 @@ def render_poland_map(week_start: date):
             "share_pct": "Udział %"
         })
 
-        st.dataframe(display_df, use_container_width=True, hide_index=True)
+        st.dataframe(display_df, width="stretch", hide_index=True)
+
+    # ROZKŁAD SKU PO WOJEWÓDZTWACH (wycinek kostki)
+    with st.expander("📦 Rozkład wybranego SKU po województwach"):
+        sku_options = cube.top_skus(w, 200)
+        if sku_options:
+            picked_sku = st.selectbox("SKU (TOP 200 w tygodniu)", options=sku_options, key="map_sku",
+                                      format_func=lambda s_: f"{s_} — {cube.names[cube.sku_index(s_)]}")
+            dist = cube.sku_distribution(picked_sku, w)
+            prev_dist = cube.sku_distribution(picked_sku, w - 1) if w > 0 else np.full(len(cube.regions), np.nan)
+            st.dataframe(pd.DataFrame({
+                "Województwo": cube.regions,
+                "Przychód": dist.round(2),
+                "Poprzedni tydzień": prev_dist.round(2),
+                "Zmiana": (dist - prev_dist).round(2),
+            }).sort_values("Przychód", ascending=False), width="stretch", hide_index=True)
 
     # TABELA WSZYSTKICH REGIONÓW
     with st.expander("📋 Pełna tabela - wszystkie województwa"):
@@ -1577,42 +2273,77 @@ def render_poland_map(week_start: date):
         st.dataframe(
             summary[["region", "revenue_formatted"]].rename(
                 columns={"region": "Województwo", "revenue_formatted": "Przychód"}),
-            use_container_width=True,
+            width="stretch",
             hide_index=True
-        )  # 11) Zakładki
+        )
 
+    # QA / Debug
+    with st.expander("🔧 Panel QA / Debug — mapa"):
+        st.write("Wiersze (województwa / TOP produkty):", len(region_totals), len(df_products))
+        st.write(f"Kostka: {len(cube.weeks)} tyg. × {len(cube.regions)} woj. × {len(cube):,} SKU, "
+                 f"{cube.nbytes / 1e6:.1f} MB")
+        st.write(f"Granice ({geo_resolution}): {geo_assets.vertex_count(geojson):,} wierzchołków, "
+                 f"{geo_assets.payload_bytes(geo_resolution):,} B")
+        render_perf_panel("map")
 
-# ─────────────────────────────────────────────────────────────
-tabs = st.tabs(["🇵🇱 Allegro.pl (PLN)", "🇩🇪 eBay.de (EUR)", "🇩🇪 Kaufland.de (EUR)", "🇵🇱 Polska — mapa wg województw"])
-
-with tabs[0]:
-    render_platform(
-        platform_key="allegro",
-        platform_title="🇵🇱 Allegro.pl — Analiza sprzedaży (PLN)",
-        sql_query=SQL_WOW_ALLEGRO_PLN,
-        sql_orders=SQL_ORDERS_ALLEGRO_PLN,
-        currency_label="PLN",
-        currency_symbol="zł",
-    )
 
-with tabs[1]:
-    render_platform(
-        platform_key="ebay",
-        platform_title="🇩🇪 eBay.de — Analiza sprzedaży (EUR)",
-        sql_query=SQL_WOW_EBAY_EUR,
-        sql_orders=SQL_ORDERS_EBAY_EUR,
-        currency_label="EUR",
-        currency_symbol="€",
-    )
+# 11) Zakładki
 
-with tabs[2]:
-    render_platform(
-        platform_key="kaufland",
-        platform_title="🇩🇪 Kaufland.de — Analiza sprzedaży (EUR)",
-        sql_query=SQL_WOW_KAUFLAND_EUR,
-        sql_orders=SQL_ORDERS_KAUFLAND_EUR,
-        currency_label="EUR",
-        currency_symbol="€",
-    )
-with tabs[3]:
-    render_poland_map(week_start)
\ No newline at end of file
+
+# ─────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    tabs = st.tabs(["🇵🇱 Allegro.pl (PLN)", "🇩🇪 eBay.de (EUR)", "🇩🇪 Kaufland.de (EUR)", "🇵🇱 Polska — mapa wg województw",
+                    "📅 Zakres dat"])
+
+    for tab, platform in zip(tabs, PLATFORMS):
+        with tab:
+            render_platform(**platform)
+
+    with tabs[3]:
+        render_poland_map(week_start)
+
+    with tabs[4]:
+        render_date_range()
+
+    with st.sidebar.expander("📥 Eksport zbiorczy (Excel)"):
+        st.caption(f"Wszystkie platformy, trend {weeks_back} tyg. i województwa — jeden plik, osobne arkusze.")
+        if st.button("Przygotuj skoroszyt", key="combined_excel_build"):
+            with st.spinner("Składanie skoroszytu..."), perf.stage("combined_excel"):
+                st.session_state["combined_excel"] = (week_start, weeks_back,
+                                                      combined_excel_bytes(week_start, weeks_back))
+        prepared = st.session_state.get("combined_excel")
+        if prepared and prepared[:2] == (week_start, weeks_back):
+            st.download_button("⬇️ Pobierz skoroszyt", prepared[2],
+                               f"sprzedaz_zbiorczo_{week_start.isoformat()}.xlsx",
+                               "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+# ─────────────────────────────────────────────────────────────
+# 12) Zamknięcie pomiaru reruna (historia + profil do pobrania)
+# ─────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    st.session_state.setdefault("perf_history", perf.new_history()).append(run_timer.snapshot())
+
+    query_metrics.flush_textfile()
+
+    with st.sidebar.expander("📈 Metryki zapytań Metabase (proces)"):
+        events = query_metrics.recent_events()
+        if events:
+            st.dataframe(pd.DataFrame(events[::-1]), width="stretch", hide_index=True)
+        st.download_button("⬇️ Metryki (Prometheus)", query_metrics.render_prometheus(), "metrics.prom", "text/plain")
+
+    if st.query_params.get("admin") == "1":
+        render_query_cache_admin()
+
+    if run_profiler is not None:
+        st.session_state["perf_profile"] = perf.stop_profiler(run_profiler)
+
+    if "perf_profile" in st.session_state:
+        prof = st.session_state["perf_profile"]
+        st.sidebar.download_button(
+            "⬇️ Pobierz profil (.prof)",
+            prof["prof_bytes"],
+            f"rerun_{prof['created_at'].strftime('%Y%m%d_%H%M%S')}.prof",
+            "application/octet-stream",
+        )
+        with st.sidebar.expander("Profil reruna (cProfile, top 40)"):
+            st.code(prof["report"])
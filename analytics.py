@@ -0,0 +1,375 @@
+# analytics.py — metryki pochodne snapshotu WoW (bez UI / bez Streamlit)
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+STATUS_NA = ("—", "#9e9e9e")
+STATUS_FLAT = ("⚪≈", "#9e9e9e")
+# (mnożnik progu, symbol, kolor) — kolejność ma znaczenie dla np.select (pierwszy pasujący wygrywa)
+STATUS_BINS_UP = [(4, "🟢⬆️⬆️", "#2e7d32"), (2, "🟢⬆️", "#388e3c"), (1, "🟢↑", "#66bb6a")]
+STATUS_BINS_DOWN = [(4, "🔴⬇️⬇️", "#b71c1c"), (2, "🔴⬇️", "#d32f2f"), (1, "🔴↓", "#ef5350")]
+
+
+def classify_change_symbol(pct: float | np.floating | None, threshold: float):
+    """Wersja skalarna (referencyjna) — dla pojedynczych wartości."""
+    if pd.isna(pct): return STATUS_NA
+    if pct >= threshold:
+        for mult, sym, col in STATUS_BINS_UP:
+            if pct >= threshold * mult: return (sym, col)
+    if pct <= -threshold:
+        for mult, sym, col in STATUS_BINS_DOWN:
+            if pct <= -threshold * mult: return (sym, col)
+    return STATUS_FLAT
+
+
+def classify_change(pct, threshold: float) -> tuple[np.ndarray, np.ndarray]:
+    """Wektorowo: (symbole, kolory) dla całej kolumny zmian % — np.select zamiast apply."""
+    p = np.asarray(pct, dtype=float)
+    conds = [np.isnan(p)]
+    syms, cols = [STATUS_NA[0]], [STATUS_NA[1]]
+    for mult, sym, col in STATUS_BINS_UP:
+        conds.append(p >= threshold * mult)
+        syms.append(sym)
+        cols.append(col)
+    for mult, sym, col in STATUS_BINS_DOWN:
+        conds.append(p <= -threshold * mult)
+        syms.append(sym)
+        cols.append(col)
+    return (np.select(conds, syms, default=STATUS_FLAT[0]),
+            np.select(conds, cols, default=STATUS_FLAT[1]))
+
+
+def top_n_index(values, n: int) -> np.ndarray:
+    """Pozycje n największych wartości (malejąco) — argpartition O(N) zamiast pełnego sortowania. NaN na końcu."""
+    v = np.asarray(values, dtype=float)
+    if n <= 0 or v.size == 0:
+        return np.empty(0, dtype=np.intp)
+    v = np.where(np.isnan(v), -np.inf, v)
+    if n < v.size:
+        part = np.argpartition(-v, n - 1)[:n]
+    else:
+        part = np.arange(v.size)
+    return part[np.argsort(-v[part], kind="stable")]
+
+
+def top_n(df: pd.DataFrame, n: int, col: str = "curr_rev") -> pd.DataFrame:
+    return df.iloc[top_n_index(df[col].to_numpy(), n)]
+
+
+def sort_key(values) -> np.ndarray:
+    """Klucz sortowania jako float: liczby bez zmian, tekst → ranga (factorize z sortowaniem), brak → NaN."""
+    s = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.to_numpy(dtype=float, na_value=np.nan)
+    codes, _ = pd.factorize(s.astype(str).where(s.notna()), sort=True)
+    return np.where(codes < 0, np.nan, codes).astype(float)
+
+
+def page_index(values, page: int, page_size: int, descending: bool = True) -> np.ndarray:
+    """Pozycje wierszy strony `page` (od 0) w porządku wg values; NaN zawsze na końcu.
+
+    argpartition do końca strony + sortowanie tylko kandydatów — bez pełnego sortowania zbioru. Kandydaci to
+    wszystko do wartości na granicy strony włącznie z całą grupą remisów, a remisy rozstrzyga pozycja wiersza —
+    porządek jest pełny, więc kolejne strony nie dublują ani nie gubią wierszy o równych wartościach.
+    """
+    v = np.asarray(values, dtype=float)
+    start, stop = page * page_size, min((page + 1) * page_size, v.size)
+    if page_size <= 0 or start >= v.size:
+        return np.empty(0, dtype=np.intp)
+    key = np.where(np.isnan(v), np.inf, -v if descending else v)
+    if stop < v.size:
+        boundary = key[np.argpartition(key, stop - 1)[stop - 1]]
+        part = np.flatnonzero(key <= boundary)
+    else:
+        part = np.arange(v.size)
+    return part[np.lexsort((part, key[part]))][start:stop]
+
+
+def filter_positions(df: pd.DataFrame, positions: np.ndarray, query: str,
+                     cols: tuple = ("sku", "product_name")) -> np.ndarray:
+    """Pozycje (z `positions`), w których SKU lub nazwa zawiera query (bez wielkości liter)."""
+    q = str(query).strip().lower()
+    if not q:
+        return positions
+    hit = np.zeros(len(positions), dtype=bool)
+    for c in cols:
+        if c in df.columns:
+            text = df[c].iloc[positions].astype(str).str.lower()
+            hit |= text.str.contains(q, regex=False).to_numpy(dtype=bool)
+    return positions[hit]
+
+
+def add_avg_prices(df: pd.DataFrame) -> pd.DataFrame:
+    """Średnie ceny tydzień / poprzedni i ich zmiana — dopisywane do df (in place)."""
+    if not {"curr_rev", "curr_qty", "prev_rev", "prev_qty"}.issubset(df.columns):
+        return df
+    cq, pq = df["curr_qty"].to_numpy(dtype=float), df["prev_qty"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        week = np.where(cq > 0, df["curr_rev"].to_numpy(dtype=float) / cq, np.nan)
+        prev = np.where(pq > 0, df["prev_rev"].to_numpy(dtype=float) / pq, np.nan)
+        delta_pct = np.where((prev > 0) & np.isfinite(prev), (week - prev) / prev * 100.0, np.nan)
+    # Zaokrąglenia do prezentacji
+    df["avg_price_week"] = np.round(week, 2)
+    df["avg_price_prev"] = np.round(prev, 2)
+    df["avg_price_delta"] = np.round(week - prev, 2)
+    df["avg_price_delta_pct"] = np.round(delta_pct, 1)
+    return df
+
+
+def fmt_money(values, decimals: int = 2, sep: str = ",") -> pd.Series:
+    """Liczby z separatorem tysięcy, kolumnowo (format jak f"{x:,.2f}")."""
+    s = pd.Series(values, dtype=float)
+    out = s.map(("{:,.%df}" % decimals).format)
+    return out if sep == "," else out.str.replace(",", sep, regex=False)
+
+
+def top_hover_text(df_top: pd.DataFrame, currency_symbol: str) -> pd.Series:
+    """Hover TOP N: budowa kolumnowa (konkatenacja Series) zamiast apply(axis=1)."""
+    head = (df_top["sku"].astype(str) + " — " + df_top["product_name"].astype(str)
+            + "<br>Sprzedaż: " + fmt_money(df_top["curr_rev"].to_numpy()).to_numpy() + " " + currency_symbol)
+    pct = df_top["rev_change_pct"].to_numpy(dtype=float)
+    change = np.where(np.isnan(pct), "", "<br>Zmiana: " + pd.Series(pct).map("{:+.2f}%".format).to_numpy())
+    return head.str.replace(",", " ", regex=False) + change
+
+
+def up_down_masks(df: pd.DataFrame, threshold: float, include_new: bool) -> tuple[np.ndarray, np.ndarray]:
+    pct = df["rev_change_pct"].to_numpy(dtype=float)
+    up = pct >= threshold
+    if include_new:
+        up |= (df["prev_rev"].fillna(0).to_numpy() == 0) & (df["curr_rev"].fillna(0).to_numpy() > 0)
+    return up, pct <= -threshold
+
+
+def waterfall_series(df_top: pd.DataFrame) -> tuple[list, list, list]:
+    """(x, y, measure) dla go.Waterfall: wkład SKU posortowany malejąco + SUMA."""
+    delta = df_top["curr_rev"].to_numpy(dtype=float) - df_top["prev_rev"].to_numpy(dtype=float)
+    order = np.argsort(-delta, kind="stable")
+    x = df_top["sku"].to_numpy()[order].tolist() + ["SUMA"]
+    y = delta[order].tolist() + [float(delta.sum())]
+    return x, y, ["relative"] * len(order) + ["total"]
+
+
+@dataclass
+class PlatformMetrics:
+    df_top: pd.DataFrame
+    sum_curr: float
+    sum_prev: float
+    delta_abs: float
+    delta_pct: float
+    wf_x: list
+    wf_y: list
+    wf_measure: list
+    up_mask: np.ndarray
+    down_mask: np.ndarray
+    currency_symbol: str = "zł"
+
+    @cached_property
+    def hover(self) -> pd.Series:
+        """Hover TOP N — liczony dopiero przy budowie wykresu (trafienie w cache figur go pomija)."""
+        return top_hover_text(self.df_top, self.currency_symbol)
+
+
+def compute_platform_metrics(df: pd.DataFrame, top_n_rows: int, threshold_rev: float, threshold_qty: float,
+                             include_new: bool, currency_symbol: str) -> PlatformMetrics:
+    """Wszystkie metryki pochodne snapshotu w jednym przebiegu (df dostaje kolumny średnich cen)."""
+    add_avg_prices(df)
+
+    df_top = top_n(df, top_n_rows).copy()
+    df_top["status_rev"], df_top["color_rev"] = classify_change(df_top["rev_change_pct"], threshold_rev)
+    df_top["status_qty"], df_top["color_qty"] = classify_change(df_top["qty_change_pct"], threshold_qty)
+
+    sum_curr = float(np.nansum(df["curr_rev"].to_numpy(dtype=float)))
+    sum_prev = float(np.nansum(df["prev_rev"].to_numpy(dtype=float)))
+    delta_abs = sum_curr - sum_prev
+    up_mask, down_mask = up_down_masks(df, threshold_rev, include_new)
+    wf_x, wf_y, wf_measure = waterfall_series(df_top)
+
+    return PlatformMetrics(
+        df_top=df_top,
+        sum_curr=sum_curr,
+        sum_prev=sum_prev,
+        delta_abs=delta_abs,
+        delta_pct=(delta_abs / sum_prev * 100) if sum_prev else 0.0,
+        wf_x=wf_x,
+        wf_y=wf_y,
+        wf_measure=wf_measure,
+        up_mask=up_mask,
+        down_mask=down_mask,
+        currency_symbol=currency_symbol,
+    )
+
+
+def aov(sum_rev: float, orders: int) -> float:
+    return (sum_rev / orders) if orders else np.nan
+
+
+def change_pct(curr, prev) -> np.ndarray:
+    """Jak w SQL snapshotu: prev=0 i curr>0 → NULL (nowe SKU), prev=0 → 0, inaczej zmiana w %."""
+    curr, prev = np.asarray(curr, dtype=float), np.asarray(prev, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = (curr - prev) / prev * 100.0
+    return np.where(prev == 0, np.where(curr > 0, np.nan, 0.0), pct)
+
+
+def period_snapshot(curr: pd.DataFrame, prev: pd.DataFrame) -> pd.DataFrame:
+    """Snapshot w kształcie query_snapshot (fakty, bez nazw) z dwóch okresów (sku, revenue, qty) — SKU z bieżącego."""
+    c = curr.groupby("sku").agg(curr_rev=("revenue", "sum"), curr_qty=("qty", "sum"))
+    p = prev.groupby("sku")[["revenue", "qty"]].sum().reindex(c.index).fillna(0.0)
+    out = c.assign(prev_rev=p["revenue"], prev_qty=p["qty"]).reset_index()
+    out["rev_change_pct"] = change_pct(out["curr_rev"], out["prev_rev"])
+    out["qty_change_pct"] = change_pct(out["curr_qty"], out["prev_qty"])
+    out = out[["sku", "curr_rev", "curr_qty", "prev_rev", "prev_qty", "rev_change_pct", "qty_change_pct"]]
+    return out.sort_values("curr_rev", ascending=False, ignore_index=True)
+
+
+# ─────────────────────────────────────────────────────────────
+# Trend tygodniowy — macierz tydzień × SKU
+# ─────────────────────────────────────────────────────────────
+def trend_matrix(df_trend: pd.DataFrame, skus) -> tuple[pd.DatetimeIndex, list, np.ndarray, np.ndarray]:
+    """(tygodnie, sku, przychód[W×K], ilość[W×K]) — pełna siatka poniedziałków, braki = 0."""
+    sub = df_trend[df_trend["sku"].isin(skus)]
+    agg = sub.groupby(["week_start", "sku"])[["curr_rev", "curr_qty"]].sum().unstack("sku")
+    weeks = pd.date_range(start=agg.index.min().normalize(), end=agg.index.max().normalize(), freq="W-MON")
+    agg = agg.reindex(weeks).fillna(0.0)
+    cols = agg["curr_rev"].columns.tolist()
+    return (weeks, cols,
+            agg["curr_rev"].to_numpy(dtype=float),
+            agg["curr_qty"].reindex(columns=cols).to_numpy(dtype=float))
+
+
+def wow_change(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """WoW abs i % dla wszystkich kolumn naraz (pierwszy tydzień = NaN)."""
+    y = np.asarray(values, dtype=float)
+    prev = np.empty_like(y)
+    prev[0] = np.nan
+    prev[1:] = y[:-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where((prev > 0) & np.isfinite(prev), (y - prev) / prev * 100.0, np.nan)
+    return y - prev, pct
+
+
+def minmax_decimate_index(y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indeksy wierszy [M×K] po decymacji min/max w kubełkach (osobno dla każdej kolumny), M ≤ max_points.
+
+    Zachowuje szczyty i dołki serii; przy krótkim horyzoncie zwraca wszystkie punkty.
+    """
+    n, k = y.shape
+    if max_points < 4 or n <= max_points:
+        return np.broadcast_to(np.arange(n)[:, None], (n, k))
+    n_buckets = max_points // 2
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+    pad = n_buckets * size - n
+    lo = np.vstack([y, np.full((pad, k), np.inf)]).reshape(n_buckets, size, k)
+    hi = np.vstack([y, np.full((pad, k), -np.inf)]).reshape(n_buckets, size, k)
+    base = (np.arange(n_buckets) * size)[:, None]
+    idx = np.vstack([lo.argmin(axis=1) + base, hi.argmax(axis=1) + base])
+    return np.sort(idx, axis=0)
+
+
+# ─────────────────────────────────────────────────────────────
+# Mapa — tooltipy województw
+# ─────────────────────────────────────────────────────────────
+def top_k_within(groups, values, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """(pozycje wierszy, miejsce 1..k) — k największych values w każdej grupie.
+
+    k przebiegów po całej kolumnie (maksimum grupy przez np.maximum.at) zamiast sortowania wszystkich wierszy;
+    przy remisie wygrywa wcześniejszy wiersz.
+    """
+    codes, uniques = pd.factorize(groups, sort=False)
+    v = np.where(np.isnan(np.asarray(values, dtype=float)), -np.inf, np.asarray(values, dtype=float))
+    taken_rows, taken_rank = [], []
+    for rank in range(1, k + 1):
+        gmax = np.full(len(uniques), -np.inf)
+        np.maximum.at(gmax, codes, v)
+        hit = np.flatnonzero((v == gmax[codes]) & (v > -np.inf))
+        if not hit.size:
+            break
+        _, first = np.unique(codes[hit], return_index=True)
+        rows = hit[first]
+        taken_rows.append(rows)
+        taken_rank.append(np.full(rows.size, rank))
+        v[rows] = -np.inf
+    if not taken_rows:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int64)
+    return np.concatenate(taken_rows), np.concatenate(taken_rank)
+
+
+def region_hover_text(df_products: pd.DataFrame, region_totals: pd.DataFrame, top_k: int = 5,
+                      currency_symbol: str = "zł") -> dict:
+    """{województwo: tooltip HTML} — ranking w regionie, udział z joinu do sum regionów, napisy kolumnowo."""
+    if df_products.empty:
+        return {}
+    rows, rank = top_k_within(df_products["region"], df_products["revenue"].to_numpy(), top_k)
+    top = df_products.iloc[rows][["region", "sku", "revenue"]].assign(rank=rank)
+    top = top.join(region_totals.set_index("region")["region_total"], on="region", how="inner")
+    top = top.sort_values(["region", "rank"], kind="stable")
+
+    rev = top["revenue"].to_numpy(dtype=float)
+    tot = top["region_total"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(tot > 0, rev / tot * 100.0, 0.0)
+    lines = (top["rank"].astype(str).to_numpy() + ". " + top["sku"].astype(str).to_numpy() + ": "
+             + fmt_money(rev, 0).to_numpy() + f" {currency_symbol} ("
+             + pd.Series(pct).map("{:.1f}%".format).to_numpy() + ")")
+    body = pd.Series(lines).groupby(top["region"].to_numpy(), sort=False).agg("<br>".join)
+
+    totals = top.drop_duplicates("region").set_index("region")["region_total"].reindex(body.index)
+    wow = np.full(len(body), "", dtype=object)
+    if "prev_total" in region_totals.columns:
+        # porównanie WoW, jeśli ramka sum ma poprzedni tydzień (kostka mapy)
+        prev = region_totals.set_index("region")["prev_total"].reindex(body.index).to_numpy(dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pct = np.where(prev > 0, (totals.to_numpy() - prev) / prev * 100.0, np.nan)
+        wow = np.where(np.isnan(prev), "", "<br>Poprzedni tydzień: " + fmt_money(prev, 0).to_numpy()
+                       + f" {currency_symbol}"
+                       + np.where(np.isnan(pct), "", " (" + pd.Series(pct).map("{:+.1f}%".format).to_numpy() + ")"))
+    header = ("<b>" + body.index.astype(str) + "</b><br>Łącznie: " + fmt_money(totals.to_numpy(), 0).to_numpy()
+              + f" {currency_symbol}" + wow + f"<br><br>TOP {top_k}:")
+    return dict(zip(body.index, header + "<br>" + body.to_numpy()))
+
+
+_HEX = np.array([f"{i:02x}" for i in range(256)], dtype=object)
+
+
+def _hex_colors(rgb: np.ndarray) -> np.ndarray:
+    rgb = np.clip(np.floor(rgb), 0, 255).astype(np.intp)
+    return "#" + _HEX[rgb[:, 0]] + _HEX[rgb[:, 1]] + _HEX[rgb[:, 2]]
+
+
+def _rgb(color: str) -> np.ndarray:
+    return np.array([int(color[i:i + 2], 16) for i in (1, 3, 5)], dtype=float)
+
+
+def sequential_colors(values, low: str = "#ffc8ff", high: str = "#0000ff", flat: str = "#42a5f5",
+                      missing: str = "#e0e0e0") -> np.ndarray:
+    """Kolory hex dla całej kolumny: liniowo między low (min) a high (max); NaN = missing."""
+    v = np.asarray(values, dtype=float)
+    out = np.full(v.shape, missing, dtype=object)
+    ok = ~np.isnan(v)
+    if not ok.any():
+        return out
+    lo, hi = v[ok].min(), v[ok].max()
+    if hi == lo:
+        out[ok] = flat
+        return out
+    norm = (v[ok] - lo) / (hi - lo)
+    out[ok] = _hex_colors(_rgb(low) + norm[:, None] * (_rgb(high) - _rgb(low)))
+    return out
+
+
+def diverging_colors(values, neg: str = "#d32f2f", mid: str = "#ffffff", pos: str = "#388e3c",
+                     missing: str = "#e0e0e0") -> np.ndarray:
+    """Kolory hex symetrycznie wokół 0 (skala ±max|v|): ujemne → neg, 0 → mid, dodatnie → pos."""
+    v = np.asarray(values, dtype=float)
+    out = np.full(v.shape, missing, dtype=object)
+    ok = ~np.isnan(v)
+    if not ok.any():
+        return out
+    span = np.abs(v[ok]).max() or 1.0
+    t = (v[ok] / span)[:, None]
+    target = np.where(t < 0, _rgb(neg), _rgb(pos))
+    out[ok] = _hex_colors(_rgb(mid) + np.abs(t) * (target - _rgb(mid)))
+    return out
@@ -0,0 +1,167 @@
+# batch_reports.py — hurtowe raporty (PDF kadrowy, CSV, Excel) dla wszystkich platform i zakresu tygodni
+#
+#   python batch_reports.py --from 2025-09-01 --to 2025-09-29 [--platforms allegro ebay] [--workers 4]
+#                           [--out raporty.zip] [--top-n 10] [--threshold-rev 20] [--threshold-qty 20]
+#
+# Poza `streamlit run` dane logowania Metabase brane są z .streamlit/secrets.toml albo ze zmiennych
+# METABASE_USER / METABASE_PASSWORD. Każdy proces puli importuje aplikację raz (warstwa zapytań + query_cache
+# w pamięci procesu, przy shared_cache_url także wspólny backend replik; sesja Metabase logowana raz na proces
+# albo brana ze wspólnego backendu). PDF kadrowe idą przez cache
+# dyskowy aplikacji (report_cache) — ponowny eksport zamkniętego tygodnia nie składa raportu od nowa.
+import argparse
+import json
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import perf
+
+_app = None
+
+
+def _load_app():
+    """Import Seller_Dashboard bez części UI (guard __name__ == "__main__" w aplikacji)."""
+    global _app
+    if _app is None:
+        from streamlit import logger as st_logger
+        st_logger.set_log_level("error")  # bez ostrzeżeń o braku runtime / session_state poza `streamlit run`
+        import Seller_Dashboard
+        _app = Seller_Dashboard
+        st_logger.set_log_level("error")  # loggery utworzone przy imporcie aplikacji
+    return _app
+
+
+def week_range(first: date, last: date) -> list[date]:
+    start = first - timedelta(days=first.weekday())
+    return [start + timedelta(weeks=i) for i in range((last - start).days // 7 + 1)]
+
+
+def build_platform_week(platform_key: str, week_start_iso: str, top_n: int, threshold_rev: float,
+                        threshold_qty: float, include_new: bool = True) -> dict:
+    """Jedna platforma × tydzień → {"files": {nazwa: bytes}, "stages": {etap: s}, "rows": int}."""
+    app = _load_app()
+    import analytics
+
+    platform = next(p for p in app.PLATFORMS if p["platform_key"] == platform_key)
+    week_start = date.fromisoformat(week_start_iso)
+    week_end = week_start + timedelta(days=7)
+    timer = perf.begin_run()
+    files = {}
+
+    with perf.stage("query"):
+        df = app.with_product_names(app.query_snapshot(platform["sql_query"], week_start_iso))
+    if df.empty:
+        return {"files": files, "stages": timer.snapshot()["stages"], "rows": 0}
+
+    with perf.stage("derive"):
+        metrics = analytics.compute_platform_metrics(df, top_n, threshold_rev, threshold_qty, include_new,
+                                                     platform["currency_symbol"])
+    with perf.stage("query_orders"):
+        df_ord = app.query_order_counts(platform["sql_orders"], week_start_iso)
+    orders_curr = int(df_ord["orders_curr"].iloc[0]) if not df_ord.empty and "orders_curr" in df_ord.columns else 0
+    orders_prev = int(df_ord["orders_prev"].iloc[0]) if not df_ord.empty and "orders_prev" in df_ord.columns else 0
+
+    prefix = f"{week_start_iso}/{platform_key}"
+    with perf.stage("executive_pdf"):
+        pdf, from_cache = app.generate_executive_pdf_report_cached(
+            platform_key=platform_key,
+            platform_title=platform["platform_title"],
+            df=df,
+            df_top=metrics.df_top,
+            sum_curr=metrics.sum_curr,
+            sum_prev=metrics.sum_prev,
+            orders_curr=orders_curr,
+            orders_prev=orders_prev,
+            aov_curr=analytics.aov(metrics.sum_curr, orders_curr),
+            aov_prev=analytics.aov(metrics.sum_prev, orders_prev),
+            currency_label=platform["currency_label"],
+            currency_symbol=platform["currency_symbol"],
+            week_start=week_start,
+            week_end=week_end,
+        )
+    files[f"{prefix}/raport_kadrowy_{platform_key}_{week_start_iso}.pdf"] = pdf
+    with perf.stage("csv"):
+        files[f"{prefix}/sprzedaz_{platform_key}.csv"] = df.to_csv(index=False).encode("utf-8")
+    with perf.stage("excel"):
+        files[f"{prefix}/sprzedaz_{platform_key}.xlsx"] = app.to_excel_bytes(df)
+
+    return {"files": files, "stages": timer.snapshot()["stages"], "rows": len(df), "pdf_cached": from_cache}
+
+
+def run_batch(weeks: list[date], platform_keys: list[str], out_path: str, workers: int, top_n: int,
+              threshold_rev: float, threshold_qty: float) -> list[dict]:
+    """Zadania platforma × tydzień w puli procesów; pliki + timings.json zapisywane do jednego ZIP."""
+    tasks = [(p, w.isoformat()) for w in weeks for p in platform_keys]
+    summary = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_app) as pool, \
+            zipfile.ZipFile(out_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        futures = {pool.submit(build_platform_week, p, w, top_n, threshold_rev, threshold_qty): (p, w)
+                   for p, w in tasks}
+        for fut in as_completed(futures):
+            platform_key, week_iso = futures[fut]
+            entry = {"platform": platform_key, "week_start": week_iso}
+            try:
+                res = fut.result()
+                for name, data in res["files"].items():
+                    zf.writestr(name, data)
+                entry.update(rows=res["rows"], files=len(res["files"]), pdf_cached=res.get("pdf_cached", False),
+                             stages={k: round(v, 4) for k, v in res["stages"].items()})
+            except Exception as e:
+                entry["error"] = repr(e)
+            summary.append(entry)
+            print(_format_entry(entry), flush=True)
+        summary.sort(key=lambda e: (e["week_start"], e["platform"]))
+        total_s = time.perf_counter() - t0
+        zf.writestr("timings.json", json.dumps({"total_s": round(total_s, 3), "tasks": summary},
+                                               ensure_ascii=False, indent=2))
+    print(f"Gotowe: {len(tasks)} zadań w {total_s:.1f} s → {out_path} ({os.path.getsize(out_path):,} B)")
+    return summary
+
+
+def _format_entry(entry: dict) -> str:
+    head = f"{entry['week_start']} {entry['platform']:<9}"
+    if "error" in entry:
+        return f"{head} BŁĄD: {entry['error']}"
+    if not entry["files"]:
+        return f"{head} brak danych"
+    stages = "  ".join(f"{k}={v * 1000:.0f}ms" for k, v in entry["stages"].items())
+    cached = "  (PDF z cache)" if entry.get("pdf_cached") else ""
+    return f"{head} {entry['rows']:>7,} wierszy  {stages}{cached}"
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Raporty tygodniowe (PDF/CSV/Excel) dla wszystkich platform.")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="pierwszy tydzień (dowolny dzień)")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="ostatni tydzień (dowolny dzień)")
+    parser.add_argument("--platforms", nargs="+", help="domyślnie wszystkie")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--out", default=None, help="ścieżka ZIP (domyślnie raporty_<od>_<do>.zip)")
+    parser.add_argument("--top-n", type=int, default=10)
+    parser.add_argument("--threshold-rev", type=float, default=20)
+    parser.add_argument("--threshold-qty", type=float, default=20)
+    args = parser.parse_args(argv)
+
+    app = _load_app()
+    last = args.date_to or app.last_completed_week_start()
+    first = args.date_from or last
+    if first > last:
+        parser.error("--from jest po --to")
+    known = [p["platform_key"] for p in app.PLATFORMS]
+    platform_keys = args.platforms or known
+    unknown = sorted(set(platform_keys) - set(known))
+    if unknown:
+        parser.error(f"nieznane platformy: {unknown} (dostępne: {known})")
+
+    weeks = week_range(first, last)
+    out_path = args.out or f"raporty_{weeks[0].isoformat()}_{weeks[-1].isoformat()}.zip"
+    summary = run_batch(weeks, platform_keys, out_path, args.workers, args.top_n, args.threshold_rev,
+                        args.threshold_qty)
+    return 1 if any("error" in e for e in summary) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# benchmarks/bench_analytics.py — analytics.compute_platform_metrics vs. dotychczasowa ścieżka z render_platform
+#
+#   python benchmarks/bench_analytics.py [liczba_sku]
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import analytics  # noqa: E402
+
+
+def make_snapshot(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    curr_rev = rng.gamma(1.5, 300.0, n).round(2)
+    prev_rev = np.where(rng.random(n) < 0.1, 0.0, rng.gamma(1.5, 300.0, n).round(2))
+    curr_qty = rng.integers(0, 60, n).astype(float)
+    prev_qty = rng.integers(0, 60, n).astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rev_pct = np.where(prev_rev > 0, (curr_rev - prev_rev) / prev_rev * 100.0, np.nan)
+        qty_pct = np.where(prev_qty > 0, (curr_qty - prev_qty) / prev_qty * 100.0, np.nan)
+    return pd.DataFrame({
+        "sku": [f"SKU-{i:06d}" for i in range(n)],
+        "product_name": [f"Produkt {i}, wariant {i % 7}" for i in range(n)],
+        "curr_rev": curr_rev, "curr_qty": curr_qty, "prev_rev": prev_rev, "prev_qty": prev_qty,
+        "rev_change_pct": rev_pct, "qty_change_pct": qty_pct,
+    })
+
+
+def legacy(df, top_n, threshold_rev, threshold_qty, include_new, currency_symbol, max_rows):
+    """Kopia logiki sprzed wydzielenia analytics.py (sort_values + apply)."""
+    df["avg_price_week"] = np.where(df["curr_qty"] > 0, df["curr_rev"] / df["curr_qty"], np.nan)
+    df["avg_price_prev"] = np.where(df["prev_qty"] > 0, df["prev_rev"] / df["prev_qty"], np.nan)
+    df["avg_price_delta"] = df["avg_price_week"] - df["avg_price_prev"]
+    df["avg_price_delta_pct"] = np.where(
+        (df["avg_price_prev"] > 0) & np.isfinite(df["avg_price_prev"]),
+        (df["avg_price_week"] - df["avg_price_prev"]) / df["avg_price_prev"] * 100.0, np.nan)
+    for c, d in [("avg_price_week", 2), ("avg_price_prev", 2), ("avg_price_delta", 2), ("avg_price_delta_pct", 1)]:
+        df[c] = df[c].round(d)
+    df_top = df.sort_values("curr_rev", ascending=False).head(top_n).copy()
+    df_top["status_rev"], df_top["color_rev"] = zip(
+        *df_top["rev_change_pct"].apply(lambda x: analytics.classify_change_symbol(x, threshold_rev)))
+    df_top["status_qty"], df_top["color_qty"] = zip(
+        *df_top["qty_change_pct"].apply(lambda x: analytics.classify_change_symbol(x, threshold_qty)))
+    hover = df_top.apply(
+        lambda r: (f"{r.sku} — {r.product_name}"
+                   f"<br>Sprzedaż: {r.curr_rev:,.2f} {currency_symbol}".replace(",", " ")
+                   + ("" if pd.isna(r.rev_change_pct) else f"<br>Zmiana: {r.rev_change_pct:+.2f}%")), axis=1)
+    cond_up = df["rev_change_pct"] >= threshold_rev
+    if include_new:
+        cond_up = cond_up | ((df["prev_rev"].fillna(0) == 0) & (df["curr_rev"].fillna(0) > 0))
+    ups = df[cond_up].copy().sort_values("curr_rev", ascending=False).head(max_rows)
+    downs = df[df["rev_change_pct"] <= -threshold_rev].copy().sort_values("curr_rev", ascending=False).head(max_rows)
+    return df_top, hover, ups, downs
+
+
+def vectorized(df, top_n, threshold_rev, threshold_qty, include_new, currency_symbol, max_rows):
+    m = analytics.compute_platform_metrics(df, top_n, threshold_rev, threshold_qty, include_new, currency_symbol)
+    ups = analytics.top_n(df[m.up_mask], max_rows)
+    downs = analytics.top_n(df[m.down_mask], max_rows)
+    return m.df_top, m.hover, ups, downs
+
+
+def bench(fn, df, repeat=5, **kw):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        d = df.copy()
+        t0 = time.perf_counter()
+        out = fn(d, **kw)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = make_snapshot(n)
+    kw = dict(top_n=20, threshold_rev=20, threshold_qty=20, include_new=True, currency_symbol="zł", max_rows=500)
+    t_old, (top_a, hov_a, ups_a, downs_a) = bench(legacy, df, **kw)
+    t_new, (top_b, hov_b, ups_b, downs_b) = bench(vectorized, df, **kw)
+
+    assert top_a["sku"].tolist() == top_b["sku"].tolist()
+    assert top_a["status_rev"].tolist() == top_b["status_rev"].tolist()
+    assert hov_a.tolist() == hov_b.tolist()
+    # remisy na granicy max_rows mogą wybrać inne SKU — porównujemy wartości
+    assert ups_a["curr_rev"].tolist() == ups_b["curr_rev"].tolist()
+    assert downs_a["curr_rev"].tolist() == downs_b["curr_rev"].tolist()
+
+    print(f"SKU: {n:,}")
+    print(f"legacy (sort_values + apply): {t_old * 1000:8.1f} ms")
+    print(f"analytics (wektorowo):        {t_new * 1000:8.1f} ms")
+    print(f"przyspieszenie:               {t_old / t_new:8.1f}x")
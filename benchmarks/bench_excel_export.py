@@ -0,0 +1,93 @@
+# benchmarks/bench_excel_export.py — excel_export (openpyxl write_only) vs. pd.ExcelWriter z to_excel_bytes
+#
+#   python benchmarks/bench_excel_export.py [liczba_wierszy ...]      # domyślnie 10k, 100k, 500k
+#
+# Każdy pomiar w osobnym procesie: czas budowy .xlsx i przyrost szczytowego RSS (VmHWM) ponad stan
+# po wygenerowaniu danych — tracemalloc zniekształca czasy openpyxl, a RSS obejmuje też bufory C.
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def legacy(dframe) -> bytes:
+    """Kopia to_excel_bytes sprzed excel_export.py (pełny skoroszyt openpyxl w pamięci)."""
+    import io
+    import pandas as pd
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        dframe.to_excel(writer, index=False, sheet_name="sprzedaz")
+    return output.getvalue()
+
+
+def streaming(dframe) -> bytes:
+    import excel_export
+    return excel_export.workbook_bytes({"sprzedaz": dframe})
+
+
+def _reset_peak() -> None:
+    """Linux: zeruje VmHWM (szczyt RSS) procesu, żeby generowanie danych nie zawyżało punktu odniesienia."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: kB
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+
+def run_one(impl: str, n: int) -> None:
+    from bench_analytics import make_snapshot
+    df = make_snapshot(n)
+    fn = {"legacy": legacy, "streaming": streaming}[impl]
+    _reset_peak()
+    base = _rss_mb()
+    t0 = time.perf_counter()
+    out = fn(df)
+    dt = time.perf_counter() - t0
+    print(f"{dt:.3f} {_peak_rss_mb() - base:.1f} {len(out)}")
+
+
+def measure(impl: str, n: int) -> tuple[float, float, int]:
+    res = subprocess.run([sys.executable, __file__, "--one", impl, str(n)], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    t, mem, size = res.stdout.split()
+    return float(t), float(mem), int(size)
+
+
+def main(sizes: list[int]) -> None:
+    for n in sizes:
+        t_new, mem_new, size_new = measure("streaming", n)
+        t_old, mem_old, _ = measure("legacy", n)
+        print(f"{n:>8,} wierszy  write_only: {t_new:7.2f} s  +{mem_new:7.1f} MB  {size_new / 1e6:6.1f} MB pliku"
+              f"  | ExcelWriter: {t_old:7.2f} s  +{mem_old:7.1f} MB  ×{t_old / t_new:.1f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--one"]:
+        run_one(sys.argv[2], int(sys.argv[3]))
+    else:
+        main([int(a) for a in sys.argv[1:]] or [10_000, 100_000, 500_000])
@@ -0,0 +1,73 @@
+# benchmarks/bench_import.py — zimny start: import Seller_Dashboard i pierwszy render (AppTest)
+#
+#   python benchmarks/bench_import.py [powtórzenia]
+#
+# Każdy pomiar w świeżym interpreterze (jak nowy kontener). "Pierwszy render" to pełny przebieg skryptu przez
+# streamlit.testing.AppTest z Metabase wskazanym na nieosiągalny adres lokalny — mierzy importy, sidebar
+# i ścieżki bez danych, bez sieci. Dodatkowo: koszt stosu, który wcześniej był importowany zawsze.
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+IMPORT_APP = """
+import time, json
+from streamlit import logger
+logger.set_log_level("error")
+t0 = time.perf_counter()
+import Seller_Dashboard
+t = time.perf_counter() - t0
+import sys
+# plotly.graph_objects pomijane — importuje go sam streamlit (elements.plotly_chart)
+heavy = [m for m in ("reportlab", "folium", "streamlit_folium", "matplotlib", "openpyxl") if m in sys.modules]
+print(json.dumps({"s": t, "heavy": heavy}))
+"""
+
+FIRST_RENDER = """
+import time, json
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("Seller_Dashboard.py", default_timeout=120)
+at.secrets["metabase_url"] = "http://127.0.0.1:9"
+at.secrets["metabase_user"] = "bench"
+at.secrets["metabase_password"] = "bench"
+at.run()
+first = time.perf_counter() - t0
+t1 = time.perf_counter()
+at.run()
+print(json.dumps({"s": first, "rerun_s": time.perf_counter() - t1, "exceptions": len(at.exception)}))
+"""
+
+HEAVY_STACK = """
+import time, json
+t0 = time.perf_counter()
+import reportlab.platypus, reportlab.graphics.charts.barcharts, reportlab.graphics.charts.linecharts
+import folium, streamlit_folium, plotly.express, plotly.graph_objects
+import matplotlib.pyplot
+from matplotlib.backends.backend_pdf import PdfPages
+print(json.dumps({"s": time.perf_counter() - t0}))
+"""
+
+
+def run(code: str) -> dict:
+    res = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def main(repeat: int) -> None:
+    imports = [run(IMPORT_APP) for _ in range(repeat)]
+    renders = [run(FIRST_RENDER) for _ in range(repeat)]
+    heavy = [run(HEAVY_STACK)["s"] for _ in range(repeat)]
+    med = lambda xs: statistics.median(xs) * 1000  # noqa: E731
+    print(f"import Seller_Dashboard:     {med([r['s'] for r in imports]):7.0f} ms  "
+          f"(załadowane ciężkie: {', '.join(imports[0]['heavy']) or 'brak'})")
+    print(f"pierwszy render (AppTest):   {med([r['s'] for r in renders]):7.0f} ms  "
+          f"rerun: {med([r['rerun_s'] for r in renders]):.0f} ms  wyjątki: {renders[0]['exceptions']}")
+    print(f"stos PDF/mapy (dawniej zawsze): {med(heavy):5.0f} ms  — mediana z {repeat} świeżych procesów")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,64 @@
+# benchmarks/bench_region_hover.py — analytics.region_hover_text vs. pętla groupby/iterrows z render_poland_map
+#
+#   python benchmarks/bench_region_hover.py [liczba_wierszy]
+#
+# Dane w skali ZIP: ~100 prefiksów × SKU, prefiks zmapowany na jedno z 16 województw.
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import analytics  # noqa: E402
+
+REGIONS = ["Dolnoslaskie", "Kujawsko-Pomorskie", "Lubelskie", "Lubuskie", "Lodzkie", "Malopolskie",
+           "Mazowieckie", "Opolskie", "Podkarpackie", "Podlaskie", "Pomorskie", "Slaskie", "Swietokrzyskie",
+           "Warminsko-Mazurskie", "Wielkopolskie", "Zachodniopomorskie"]
+
+
+def make_products(n: int, seed: int = 0) -> tuple[pd.DataFrame, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    zip_prefix = rng.integers(0, 100, n)
+    df = pd.DataFrame({
+        "region": np.asarray(REGIONS, dtype=object)[zip_prefix % len(REGIONS)],
+        "sku": [f"SKU-{i:06d}" for i in rng.integers(0, 50_000, n)],
+        "revenue": rng.gamma(1.5, 300.0, n).round(2),
+    })
+    totals = df.groupby("region", as_index=False)["revenue"].sum().rename(columns={"revenue": "region_total"})
+    return df, totals
+
+
+def legacy(df_products, region_totals):
+    """Kopia pętli sprzed zmiany (maska na region_totals, sort per region, iterrows)."""
+    hover_text = {}
+    for region, sub in df_products.groupby("region"):
+        sub_sorted = sub.sort_values("revenue", ascending=False)
+        total = region_totals[region_totals["region"] == region]["region_total"].iloc[0]
+        lines = [f"<b>{region}</b><br>Łącznie: {total:,.0f} zł<br><br>TOP 5:"]
+        for i, (_, row) in enumerate(sub_sorted.head(5).iterrows(), 1):
+            pct = (row["revenue"] / total * 100) if total > 0 else 0
+            lines.append(f"{i}. {row['sku']}: {row['revenue']:,.0f} zł ({pct:.1f}%)")
+        hover_text[region] = "<br>".join(lines)
+    return hover_text
+
+
+def bench(fn, *args, repeat=5):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+if __name__ == "__main__":
+    sizes = [int(sys.argv[1])] if len(sys.argv) > 1 else [1_000, 100_000, 1_000_000]
+    for n in sizes:
+        df, totals = make_products(n)
+        t_old, a = bench(legacy, df, totals)
+        t_new, b = bench(analytics.region_hover_text, df, totals)
+        assert a == b
+        print(f"wiersze: {n:>9,}   legacy: {t_old * 1000:8.1f} ms   wektorowo: {t_new * 1000:8.1f} ms"
+              f"   przyspieszenie: {t_old / t_new:5.1f}x")
@@ -0,0 +1,73 @@
+# benchmarks/bench_table_pdf.py — pdf_tables.table_pdf_bytes vs. dotychczasowy df_to_pdf_bytes (matplotlib)
+#
+#   python benchmarks/bench_table_pdf.py [liczba_wierszy ...]
+#
+# Stara ścieżka rysowała max 200 wierszy na jednej stronie (ax.table), więc porównanie 1:1 jest przy 200;
+# większe rozmiary mierzą tylko nową ścieżkę (czas, szczytowa pamięć tracemalloc, strony, rozmiar pliku).
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pdf_tables  # noqa: E402
+from bench_analytics import make_snapshot  # noqa: E402
+
+
+def legacy(dframe: pd.DataFrame, title: str = "Raport") -> bytes:
+    """Kopia df_to_pdf_bytes sprzed pdf_tables.py (matplotlib, jedna strona, head(200))."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+    buf = io.BytesIO()
+    d = dframe.copy().head(200)
+    with PdfPages(buf) as pdf:
+        fig, ax = plt.subplots(figsize=(11.69, 8.27))
+        ax.axis('off')
+        ax.set_title(title, fontsize=14, loc='left')
+        table = ax.table(cellText=d.values, colLabels=d.columns, loc='center', cellLoc='left')
+        table.auto_set_font_size(False)
+        table.set_fontsize(8)
+        table.scale(1, 1.2)
+        pdf.savefig(fig, bbox_inches='tight')
+        plt.close(fig)
+    buf.seek(0)
+    return buf.read()
+
+
+def measure(fn, *args, repeat: int = 3) -> tuple[float, float, bytes]:
+    """(najlepszy czas s, szczyt pamięci MB, wynik)."""
+    fn(*args)  # rozgrzewka (fonty, importy)
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return best, peak, out
+
+
+def main(sizes: list[int]) -> None:
+    for n in sizes:
+        df = make_snapshot(n)[["sku", "product_name", "curr_rev", "prev_rev", "rev_change_pct", "curr_qty"]]
+        df["rev_change_pct"] = df["rev_change_pct"].round(1)
+        repeat = 3 if n <= 2_000 else 1
+        t_new, mem_new, pdf = measure(pdf_tables.table_pdf_bytes, df, "Benchmark", repeat=repeat)
+        pages = pdf.count(b"/Type /Page\n") or pdf.count(b"/Type /Page")
+        line = (f"{n:>8,} wierszy  pdf_tables: {t_new * 1000:8.1f} ms  {mem_new:7.1f} MB  "
+                f"{pages:>5} str.  {len(pdf) / 1e3:8.0f} kB")
+        if n <= 200:
+            t_old, mem_old, _ = measure(legacy, df, "Benchmark", repeat=repeat)
+            line += f"  | matplotlib: {t_old * 1000:8.1f} ms  {mem_old:7.1f} MB  ×{t_old / t_new:.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [200, 2_000, 10_000])
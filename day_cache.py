@@ -0,0 +1,102 @@
+# day_cache.py — agregaty dzienne (dzień × SKU) w cache zapytań; dowolny zakres składany z dni
+#
+# Jeden wpis query_cache.CACHE na (platforma, dzień): wiersze dzień × SKU plus wiersz sumy dnia (sku = NULL,
+# GROUPING SETS w SQL) z liczbą zamówień — zamówienia z wielu SKU liczone raz. Zakres = dni z cache + brakujące
+# dni pobrane ciągłymi odcinkami (jedno zapytanie CSV na odcinek). Dzień zamknięty w chwili pobrania (przed
+# dzisiaj) żyje CLOSED_DAY_TTL_S, pobrany jako otwarty — OPEN_DAY_TTL_S także po północy (niepełne zamówienia
+# z 23:55 nie udają zamkniętego dnia); pusty dzień też jest wpisem, żeby nie pytać o niego ponownie.
+import time
+from collections.abc import Callable
+from datetime import date, timedelta
+
+import pandas as pd
+
+import query_cache
+
+CLOSED_DAY_TTL_S = 6 * 3600
+OPEN_DAY_TTL_S = query_cache.DEFAULT_TTL_S
+MAX_RANGE_DAYS = 400
+
+DAY_DTYPES = {"sku": "str", "revenue": "float64", "qty": "float64", "orders": "float64", "is_total": "bool"}
+GRANULARITY = {"Dzień": "D", "Tydzień": "W-MON", "Miesiąc": "MS"}
+
+
+def _key(platform_key: str, day: date, closed: bool) -> tuple:
+    """closed — czy dzień był już zamknięty w chwili pobrania (decyduje o TTL wpisu)."""
+    return ("day_agg", platform_key, day.isoformat(), "closed" if closed else "open")
+
+
+def _cached_day(platform_key: str, day: date, today: date):
+    """Wpis dnia z cache: najpierw pobrany jako zamknięty (tylko dni przed dzisiaj), potem jako otwarty."""
+    if day < today:
+        value, hit = query_cache.CACHE.get(_key(platform_key, day, True), CLOSED_DAY_TTL_S)
+        if hit:
+            return value, True
+    return query_cache.CACHE.get(_key(platform_key, day, False), OPEN_DAY_TTL_S)
+
+
+def _runs(days: list[date]) -> list[tuple[date, date]]:
+    """Posortowane dni → ciągłe odcinki [start, koniec) — jedno zapytanie na odcinek zamiast na dzień."""
+    runs = []
+    for d in days:
+        if runs and runs[-1][1] == d:
+            runs[-1] = (runs[-1][0], d + timedelta(days=1))
+        else:
+            runs.append((d, d + timedelta(days=1)))
+    return runs
+
+
+def load_days(platform_key: str, start: date, end: date, fetch: Callable[[date, date], pd.DataFrame | None],
+              today: date) -> tuple[pd.DataFrame, dict]:
+    """Wiersze dzień × SKU (i sumy dni) dla [start, end]; fetch(start, koniec_wyłącznie) → ramka z kolumną `day`
+    albo None przy błędzie (dni z błędem nie trafiają do cache). Zwraca (ramka, {"cached", "fetched", "queries"})."""
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    frames, missing = [], []
+    for d in days:
+        value, hit = _cached_day(platform_key, d, today)
+        if hit:
+            frames.append(value)
+        else:
+            missing.append(d)
+    runs = _runs(missing)
+    for run_start, run_end in runs:
+        t0 = time.perf_counter()
+        df = fetch(run_start, run_end)
+        if df is None:
+            continue
+        cost_s = (time.perf_counter() - t0) / (run_end - run_start).days  # GDSF: koszt odtworzenia jednego dnia
+        by_day = dict(tuple(df.groupby(df["day"].dt.date))) if not df.empty else {}
+        for i in range((run_end - run_start).days):
+            d = run_start + timedelta(days=i)
+            day_df = by_day.get(d, df.iloc[:0]).reset_index(drop=True)
+            query_cache.CACHE.put(_key(platform_key, d, d < today), day_df, cost_s)
+            frames.append(day_df)
+    out = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["day", *DAY_DTYPES])
+    return out, {"cached": len(days) - len(missing), "fetched": len(missing), "queries": len(runs)}
+
+
+def split(rows: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """(dzień × SKU, sumy dni) — wiersze sumy po fladze GROUPING(sku) z SQL, nie po sku = NULL: linie bez
+    produktu (sekcje/notatki Odoo) też mają pusty SKU i liczyłyby zamówienia podwójnie."""
+    is_total = rows["is_total"].astype(bool)
+    return rows[~is_total], rows[is_total]
+
+
+def series(day_totals: pd.DataFrame, start: date, end: date, granularity: str) -> pd.Series:
+    """Przychód okresu w kubełkach (D / W-MON / MS), pełna siatka od start do end — brak sprzedaży = 0."""
+    s = day_totals.groupby("day")["revenue"].sum()
+    s = s.reindex(pd.date_range(start, end, freq="D"), fill_value=0.0)
+    if granularity == "D":
+        return s
+    return s.resample(granularity, label="left", closed="left").sum()
+
+
+def previous_period(start: date, end: date, mode: str) -> tuple[date, date]:
+    """Okres porównawczy: "month" — te same dni poprzedniego miesiąca (miesiąc do dziś vs miesiąc wcześniej),
+    inaczej — tyle samo dni bezpośrednio przed zakresem."""
+    if mode == "month":
+        prev_end_of_month = start.replace(day=1) - timedelta(days=1)
+        prev_start = prev_end_of_month.replace(day=1)
+        return prev_start, min(prev_start + (end - start), prev_end_of_month)
+    length = end - start
+    return start - length - timedelta(days=1), start - timedelta(days=1)
@@ -0,0 +1,79 @@
+# excel_export.py — eksport do Excela w trybie strumieniowym (openpyxl write_only), jeden lub wiele arkuszy
+#
+# Workbook(write_only=True) zapisuje wiersze od razu do pliku tymczasowego arkusza zamiast trzymać obiekty
+# komórek; wiersze podawane są blokami (kolumnowo .tolist()), więc pamięć zależy od bloku, nie od ramki.
+import io
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+BLOCK_ROWS = 10_000
+MAX_SHEET_NAME = 31
+_INVALID_SHEET_CHARS = re.compile(r"[\[\]:*?/\\]")
+
+
+def sheet_title(name: str, taken: set) -> str:
+    """Nazwa arkusza zgodna z Excelem (≤ 31 znaków, bez []:*?/\\), unikalna w skoroszycie."""
+    base = _INVALID_SHEET_CHARS.sub("_", str(name)).strip() or "arkusz"
+    base = base[:MAX_SHEET_NAME]
+    title, i = base, 2
+    while title.lower() in taken:
+        suffix = f"_{i}"
+        title, i = base[:MAX_SHEET_NAME - len(suffix)] + suffix, i + 1
+    taken.add(title.lower())
+    return title
+
+
+def _column_values(s: pd.Series) -> list:
+    """Kolumna → lista wartości Pythona zrozumiałych dla openpyxl (NaN/NaT → pusta komórka)."""
+    if pd.api.types.is_datetime64_any_dtype(s):
+        if s.dt.tz is not None:
+            s = s.dt.tz_localize(None)
+        return [None if v is pd.NaT else v for v in s.dt.to_pydatetime().tolist()]
+    if pd.api.types.is_bool_dtype(s):
+        # nullable "boolean" z pd.NA — openpyxl nie zna <NA>, pusta komórka jak dla liczb
+        return s.to_numpy().tolist() if not s.hasnans else s.astype(object).where(s.notna(), None).tolist()
+    if pd.api.types.is_integer_dtype(s) and not s.hasnans:
+        return s.to_numpy().tolist()
+    if pd.api.types.is_numeric_dtype(s):
+        arr = s.to_numpy(dtype=float, na_value=np.nan)
+        return np.where(np.isnan(arr), None, arr).tolist()
+    out = s.astype(object).where(s.notna(), None)
+    return [v if v is None or isinstance(v, (str, int, float, datetime)) else str(v) for v in out.tolist()]
+
+
+def _write_frame(wb: Workbook, title: str, dframe: pd.DataFrame) -> None:
+    ws = wb.create_sheet(title)
+    ws.freeze_panes = "A2"
+    for i, col in enumerate(dframe.columns, 1):
+        ws.column_dimensions[get_column_letter(i)].width = min(max(len(str(col)) + 2, 10), 50)
+    bold = Font(bold=True)
+    header = []
+    for col in dframe.columns:
+        cell = WriteOnlyCell(ws, value=str(col))
+        cell.font = bold
+        header.append(cell)
+    ws.append(header)
+    for start in range(0, len(dframe), BLOCK_ROWS):
+        block = dframe.iloc[start:start + BLOCK_ROWS]
+        for row in zip(*(_column_values(block[c]) for c in block.columns)):
+            ws.append(row)
+
+
+def workbook_bytes(sheets: dict[str, pd.DataFrame]) -> bytes:
+    """{nazwa arkusza: ramka} → .xlsx (kolejność arkuszy jak w słowniku; pusta ramka = arkusz z nagłówkiem)."""
+    wb = Workbook(write_only=True)
+    taken: set = set()
+    for name, dframe in sheets.items():
+        _write_frame(wb, sheet_title(name, taken), dframe)
+    if not sheets:
+        wb.create_sheet("arkusz")
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
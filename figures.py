@@ -0,0 +1,218 @@
+# figures.py — czyste budowniczki figur Plotly z pamięcią LRU na proces (wspólna dla sesji i reranów)
+#
+# Klucz = nazwa wykresu + odcisk danych wejściowych i opcji (report_cache.fingerprint), więc zmiana
+# niezwiązanego widżetu trafia w gotową figurę zamiast budować ślady i hovery od nowa. Figury są
+# współdzielone między sesjami — tylko do odczytu (st.plotly_chart ich nie modyfikuje).
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import report_cache
+
+FIGURE_CACHE_SIZE = 128
+
+
+class FigureCache:
+    """Ograniczony LRU: {klucz: go.Figure}; najdawniej użyta figura wypada po przekroczeniu max_entries."""
+
+    def __init__(self, max_entries: int = FIGURE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key: tuple, build):
+        with self._lock:
+            fig = self._items.get(key)
+            if fig is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return fig
+            self.misses += 1
+        fig = build()  # poza blokadą — budowa nie blokuje innych sesji
+        with self._lock:
+            self._items[key] = fig
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return fig
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
+
+
+FIGURES = FigureCache()
+
+
+# ─────────────────────────────────────────────────────────────
+# Platforma — TOP N i waterfall
+# ─────────────────────────────────────────────────────────────
+def top_bar(metrics: analytics.PlatformMetrics):
+    df_top = metrics.df_top
+    key = ("top_bar", report_cache.fingerprint(df_top[["sku", "product_name", "curr_rev",
+                                                       "rev_change_pct", "color_rev"]],
+                                               currency_symbol=metrics.currency_symbol))
+
+    def build():
+        import plotly.graph_objects as go
+        fig = go.Figure(go.Bar(
+            x=df_top["curr_rev"],
+            y=df_top["sku"],
+            orientation="h",
+            marker=dict(color=df_top["color_rev"].tolist()),
+            hoverinfo="text",
+            hovertext=metrics.hover
+        ))
+        fig.update_layout(yaxis={"categoryorder": "total ascending"}, height=520, margin=dict(l=150))
+        return fig
+
+    return FIGURES.get_or_build(key, build)
+
+
+def waterfall(x: list, y: list, measures: list, currency_label: str):
+    key = ("waterfall", report_cache.fingerprint(np.asarray(x, dtype=object), np.asarray(y, dtype=float),
+                                                 measures=tuple(measures), currency_label=currency_label))
+
+    def build():
+        import plotly.graph_objects as go
+        fig = go.Figure(go.Waterfall(
+            x=x,
+            y=y,
+            measure=measures,
+            text=analytics.fmt_money(y).tolist(),
+            textposition="outside"
+        ))
+        fig.update_traces(
+            increasing=dict(marker=dict(color="#66bb6a")),
+            decreasing=dict(marker=dict(color="#ef5350")),
+            totals=dict(marker=dict(color="#42a5f5"))
+        )
+        fig.update_layout(title=f"Wkład produktów w zmianę sprzedaży ({currency_label})", showlegend=False,
+                          height=420)
+        return fig
+
+    return FIGURES.get_or_build(key, build)
+
+
+# ─────────────────────────────────────────────────────────────
+# Trend tygodniowy
+# ─────────────────────────────────────────────────────────────
+def trend(weeks: pd.DatetimeIndex, skus: list, rev: np.ndarray, qty: np.ndarray, chart_type: str,
+          use_webgl: bool, decimate_to: int | None, currency_symbol: str, currency_label: str):
+    """Serie SKU z macierzy analytics.trend_matrix; decimate_to = maks. punktów na serię (None = wszystkie)."""
+    key = ("trend", report_cache.fingerprint(weeks.asi8, np.asarray(skus, dtype=object), rev, qty,
+                                             chart_type=chart_type, use_webgl=use_webgl, decimate_to=decimate_to,
+                                             currency_symbol=currency_symbol, currency_label=currency_label))
+
+    def build():
+        import plotly.graph_objects as go
+        wow_abs, wow_pct = analytics.wow_change(rev)
+
+        # Jedna macierz customdata [tydzień × SKU × (ilość, WoW abs, WoW %)] dla wszystkich serii
+        custom = np.stack([qty, wow_abs, wow_pct], axis=-1)
+        week_end_labels = (weeks + pd.Timedelta(days=6)).strftime("%Y-%m-%d").to_numpy()
+        idx = (analytics.minmax_decimate_index(rev, decimate_to) if decimate_to
+               else np.broadcast_to(np.arange(len(weeks))[:, None], rev.shape))
+        trace_cls = go.Scattergl if use_webgl else go.Scatter
+
+        hovertemplate = (
+                "<b>%{fullData.name}</b><br>"
+                "Tydzień: %{x|%Y-%m-%d} → %{text}<br>"
+                "Sprzedaż: %{y:,.2f} " + currency_symbol + "<br>"
+                "Ilość: %{customdata[0]:,.2f} szt.<br>"
+                "WoW: %{customdata[1]:+,.2f} " + currency_symbol + " (%{customdata[2]:+.2f}%)"
+                "<extra></extra>"
+        )
+        extra = {"stackgroup": "one"} if chart_type == "area" else {}
+        fig = go.Figure([
+            trace_cls(
+                x=weeks[idx[:, j]], y=rev[idx[:, j], j], name=sku, mode="lines",
+                customdata=custom[idx[:, j], j], text=week_end_labels[idx[:, j]],
+                hovertemplate=hovertemplate, **extra
+            )
+            for j, sku in enumerate(skus)
+        ])
+        fig.update_layout(height=460, xaxis_title="Tydzień", yaxis_title=f"Sprzedaż ({currency_label})")
+        return fig
+
+    return FIGURES.get_or_build(key, build)
+
+
+# ─────────────────────────────────────────────────────────────
+# Mapa — słupki województw (bieżący vs poprzedni tydzień)
+# ─────────────────────────────────────────────────────────────
+def region_bars(region_totals: pd.DataFrame):
+    key = ("region_bars", report_cache.fingerprint(region_totals))
+
+    def build():
+        import plotly.graph_objects as go
+        rt = region_totals.sort_values("region_total", ascending=False)
+        fig = go.Figure([
+            go.Bar(
+                x=rt["prev_total"],
+                y=rt["region"],
+                orientation="h",
+                name="Poprzedni tydzień",
+                marker=dict(color="#bdbdbd"),
+            ),
+            go.Bar(
+                x=rt["region_total"],
+                y=rt["region"],
+                orientation="h",
+                name="Bieżący tydzień",
+                marker=dict(color=analytics.diverging_colors(rt["delta"]).tolist(),
+                            line=dict(color="#1565c0", width=1)),
+                text=(analytics.fmt_money(rt["region_total"].to_numpy(), decimals=0) + " zł").tolist(),
+                textposition="outside",
+                customdata=rt["delta_pct"],
+                hovertemplate="%{y}: %{x:,.0f} zł (WoW %{customdata:+.1f}%)<extra></extra>",
+            ),
+        ])
+        fig.update_layout(
+            xaxis_title="Przychód (zł)",
+            yaxis_title="Województwo",
+            height=400,
+            barmode="group",
+            yaxis={"categoryorder": "array", "categoryarray": rt["region"].tolist()[::-1]}
+        )
+        return fig
+
+    return FIGURES.get_or_build(key, build)
+
+
+# ─────────────────────────────────────────────────────────────
+# Dowolny zakres dat — okres vs okres porównawczy w kubełkach
+# ─────────────────────────────────────────────────────────────
+def period_compare(curr: pd.Series, prev: pd.Series, currency_label: str):
+    """Słupki przychodu w kubełkach (dzień / tydzień / miesiąc); okres porównawczy wyrównany pozycją kubełka."""
+    key = ("period_compare", report_cache.fingerprint(curr.index.asi8, curr.to_numpy(), prev.index.asi8,
+                                                      prev.to_numpy(), currency_label=currency_label))
+
+    def build():
+        import plotly.graph_objects as go
+        n, k = len(curr), min(len(curr), len(prev))
+        prev_vals = np.zeros(n)
+        prev_vals[:k] = prev.to_numpy()[:k]
+        prev_labels = np.full(n, "—", dtype=object)
+        prev_labels[:k] = prev.index[:k].strftime("%Y-%m-%d")
+        fig = go.Figure([
+            go.Bar(x=curr.index, y=prev_vals, name="Okres porównawczy", marker=dict(color="#bdbdbd"),
+                   customdata=prev_labels,
+                   hovertemplate="od %{customdata}: %{y:,.2f}<extra>Okres porównawczy</extra>"),
+            go.Bar(x=curr.index, y=curr.to_numpy(), name="Wybrany okres", marker=dict(color="#42a5f5"),
+                   hovertemplate="od %{x|%Y-%m-%d}: %{y:,.2f}<extra>Wybrany okres</extra>"),
+        ])
+        fig.update_layout(barmode="group", height=420, yaxis_title=f"Sprzedaż ({currency_label})")
+        return fig
+
+    return FIGURES.get_or_build(key, build)
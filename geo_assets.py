@@ -0,0 +1,182 @@
+# geo_assets.py — uproszczone, kwantyzowane granice województw (asset budowany offline, cache na proces)
+#
+#   python geo_assets.py            # przebudowa polska-wojewodztwa.simplified.json z polska-wojewodztwa.geojson
+#
+# Upraszczanie zachowuje topologię: pierścienie są cięte na łuki w węzłach (punktach, gdzie zmienia się
+# zbiór województw posiadających granicę), a każdy łuk jest upraszczany raz (Douglas-Peucker, końce stałe)
+# i używany przez oba sąsiednie województwa — wspólne granice pozostają identyczne, bez szpar i nakładek.
+import json
+import math
+import os
+import threading
+from functools import lru_cache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_PATH = os.path.join(BASE_DIR, "polska-wojewodztwa.geojson")
+ASSET_PATH = os.path.join(BASE_DIR, "polska-wojewodztwa.simplified.json")
+
+# rozdzielczość → (tolerancja Douglasa-Peuckera w stopniach, liczba miejsc po przecinku)
+RESOLUTIONS = {
+    "high": (0.005, 4),
+    "medium": (0.015, 3),
+    "low": (0.04, 2),
+}
+DEFAULT_RESOLUTION = "medium"
+KEEP_PROPERTIES = ("name", "NAME_1", "HASC_1")
+
+_lock = threading.Lock()
+
+
+# ─────────────────────────────────────────────────────────────
+# 1) Upraszczanie łuków (Douglas-Peucker, iteracyjnie)
+# ─────────────────────────────────────────────────────────────
+def _seg_dist(p, a, b) -> float:
+    (px, py), (ax, ay), (bx, by) = p, a, b
+    dx, dy = bx - ax, by - ay
+    if dx == 0 and dy == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def douglas_peucker(points: list, tolerance: float) -> list:
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        i, j = stack.pop()
+        best, idx = -1.0, -1
+        for k in range(i + 1, j):
+            d = _seg_dist(points[k], points[i], points[j])
+            if d > best:
+                best, idx = d, k
+        if idx >= 0 and best > tolerance:
+            keep[idx] = True
+            stack.append((i, idx))
+            stack.append((idx, j))
+    return [p for p, k in zip(points, keep) if k]
+
+
+# ─────────────────────────────────────────────────────────────
+# 2) Łuki współdzielone między województwami
+# ─────────────────────────────────────────────────────────────
+def _rings(geometry: dict):
+    polys = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+    for poly in polys:
+        yield [[tuple(p) for p in ring] for ring in poly]
+
+
+def _canonical(chain: tuple) -> tuple:
+    """Ten sam łuk przechodzony w obu kierunkach → jeden klucz (i jedno uproszczenie)."""
+    rev = chain[::-1]
+    return chain if chain <= rev else rev
+
+
+def simplify_collection(fc: dict, tolerance: float, decimals: int) -> dict:
+    owners: dict[tuple, set] = {}
+    for fi, feat in enumerate(fc["features"]):
+        for poly in _rings(feat["geometry"]):
+            for ring in poly:
+                for p in ring:
+                    owners.setdefault(p, set()).add(fi)
+
+    simplified_arcs: dict[tuple, list] = {}
+
+    def simplify_ring(ring: list) -> list:
+        pts = ring[:-1] if ring[0] == ring[-1] else ring
+        n = len(pts)
+        junction = [owners[pts[i]] != owners[pts[i - 1]] or owners[pts[i]] != owners[pts[(i + 1) % n]]
+                    for i in range(n)]
+        cuts = [i for i in range(n) if junction[i]]
+        if not cuts:
+            # pierścień bez sąsiadów (np. wyspa) — dwa stałe punkty: start i najdalszy od niego
+            far = max(range(n), key=lambda i: math.hypot(pts[i][0] - pts[0][0], pts[i][1] - pts[0][1]))
+            cuts = sorted({0, far})
+        out = []
+        for ci, start in enumerate(cuts):
+            end = cuts[(ci + 1) % len(cuts)]
+            chain = tuple(pts[start:end + 1] if end > start else pts[start:] + pts[:end + 1])
+            key = _canonical(chain)
+            if key not in simplified_arcs:
+                simplified_arcs[key] = douglas_peucker(list(key), tolerance)
+            arc = simplified_arcs[key] if key == chain else simplified_arcs[key][::-1]
+            out.extend(arc[:-1])
+        out = [(round(x, decimals), round(y, decimals)) for x, y in out]
+        # usuń duplikaty po kwantyzacji; pierścień musi mieć ≥ 3 różne punkty
+        dedup = [p for i, p in enumerate(out) if i == 0 or p != out[i - 1]]
+        if len(dedup) < 3:
+            dedup = [(round(x, decimals), round(y, decimals)) for x, y in pts]
+        return [list(p) for p in dedup] + [list(dedup[0])]
+
+    features = []
+    for feat in fc["features"]:
+        polys = [[simplify_ring(ring) for ring in poly] for poly in _rings(feat["geometry"])]
+        geometry = ({"type": "Polygon", "coordinates": polys[0]} if len(polys) == 1
+                    else {"type": "MultiPolygon", "coordinates": polys})
+        props = {k: feat["properties"].get(k) for k in KEEP_PROPERTIES if k in feat["properties"]}
+        features.append({"type": "Feature", "properties": props, "geometry": geometry})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def build_asset(source_path: str = SOURCE_PATH) -> dict:
+    with open(source_path, "r", encoding="utf-8") as f:
+        fc = json.load(f)
+    return {res: simplify_collection(fc, tol, dec) for res, (tol, dec) in RESOLUTIONS.items()}
+
+
+def write_asset(asset: dict, path: str = ASSET_PATH) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(asset, f, ensure_ascii=False, separators=(",", ":"))
+
+
+# ─────────────────────────────────────────────────────────────
+# 3) Cache na proces — wczytanie raz, indeks po nazwie województwa
+# ─────────────────────────────────────────────────────────────
+def region_name(feature: dict) -> str | None:
+    props = feature.get("properties", {})
+    return props.get("name") or props.get("nazwa")
+
+
+@lru_cache(maxsize=None)
+def _load_json(path: str) -> dict:
+    with _lock, open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def load_regions(resolution: str = DEFAULT_RESOLUTION) -> tuple[dict, dict]:
+    """(FeatureCollection, {nazwa województwa: feature}) — obiekty współdzielone, tylko do odczytu.
+
+    "full" = plik źródłowy bez upraszczania; brak assetu na dysku → budowa w locie (raz na proces).
+    """
+    if resolution == "full":
+        fc = _load_json(SOURCE_PATH)
+    elif os.path.exists(ASSET_PATH):
+        fc = _load_json(ASSET_PATH)[resolution]
+    else:
+        tol, dec = RESOLUTIONS[resolution]
+        fc = simplify_collection(_load_json(SOURCE_PATH), tol, dec)
+    return fc, {region_name(f): f for f in fc["features"]}
+
+
+@lru_cache(maxsize=None)
+def payload_bytes(resolution: str) -> int:
+    return len(json.dumps(load_regions(resolution)[0], separators=(",", ":")).encode("utf-8"))
+
+
+def vertex_count(fc: dict) -> int:
+    return sum(len(ring) for feat in fc["features"] for poly in _rings(feat["geometry"]) for ring in poly)
+
+
+if __name__ == "__main__":
+    asset = build_asset()
+    write_asset(asset)
+    with open(SOURCE_PATH, "r", encoding="utf-8") as f:
+        src = json.load(f)
+    print(f"full:   {vertex_count(src):6,} wierzchołków, {os.path.getsize(SOURCE_PATH):9,} B (plik źródłowy)")
+    for res, fc in asset.items():
+        size = len(json.dumps(fc, separators=(",", ":")).encode("utf-8"))
+        print(f"{res:7s} {vertex_count(fc):6,} wierzchołków, {size:9,} B")
+    print(f"zapisano {ASSET_PATH} ({os.path.getsize(ASSET_PATH):,} B)")
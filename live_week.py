@@ -0,0 +1,131 @@
+# live_week.py — tryb "na żywo" bieżącego tygodnia: przyrostowe pobieranie linii zamówień od znacznika zmian
+#
+# Pierwsze odświeżenie pobiera linie bieżącego i poprzedniego tygodnia (jedno zapytanie CSV), kolejne — tylko
+# linie zmienione od watermarku: max(write_date) linii/zamówienia z dotychczasowych odpowiedzi (czas bazy, nie
+# klienta), z zakładką OVERLAP_S na transakcje zatwierdzone z opóźnieniem. Zmienione linie zastępują poprzednie
+# wersje (upsert po line_id), a agregaty SKU bieżącego tygodnia są korygowane wektorowo:
+#   curr = curr − groupby(stare wersje zmienionych linii) + groupby(nowe wersje).
+# Linie usunięte fizycznie (unlink) nie dostają write_date — pełna resynchronizacja co FULL_RESYNC_S
+# i przy zmianie tygodnia. Stan wspólny dla sesji procesu (jak query_cache), jeden na platformę.
+import threading
+from datetime import date
+
+import pandas as pd
+
+import analytics
+
+OVERLAP_S = 120
+FULL_RESYNC_S = 3600
+POLL_MIN_S = 30  # częstsze odświeżenia (inne sesje, reruny widżetów) czytają stan bez pytania Metabase
+
+LINE_DTYPES = {
+    "line_id": "int64", "order_id": "int64", "sku": "str", "qty": "float64",
+    "line_total": "float64", "order_epoch": "float64", "is_curr": "bool", "valid": "bool", "changed_at": "float64",
+}
+_AGG_COLUMNS = ["curr_rev", "curr_qty", "n_lines"]
+
+
+def _curr_agg(lines: pd.DataFrame) -> pd.DataFrame:
+    """Sumy SKU bieżącego tygodnia z linii (n_lines — żeby SKU bez linii wypadło po korekcie)."""
+    cur = lines[lines["is_curr"]]
+    return pd.DataFrame({
+        "curr_rev": cur.groupby("sku")["line_total"].sum(),
+        "curr_qty": cur.groupby("sku")["qty"].sum(),
+        "n_lines": cur.groupby("sku").size().astype("float64"),
+    }, columns=_AGG_COLUMNS)
+
+
+class LiveWeek:
+    def __init__(self, week_start: date):
+        self.week_start = week_start
+        self.lines = pd.DataFrame({c: pd.Series(dtype=t) for c, t in LINE_DTYPES.items()}).set_index("line_id")
+        self.curr = pd.DataFrame(columns=_AGG_COLUMNS, dtype="float64")
+        self.watermark = 0.0
+        self.last_full = 0.0
+        self.last_poll = 0.0
+        self.polls = 0
+        self.rows_fetched = 0
+        self.lock = threading.Lock()
+
+    # ── pobieranie ─────────────────────────────────────────────
+    def needs_full(self, now: float) -> bool:
+        return self.last_full == 0.0 or now - self.last_full > FULL_RESYNC_S
+
+    def due(self, now: float) -> bool:
+        return now - self.last_poll >= POLL_MIN_S
+
+    def since(self, now: float) -> float:
+        """Parametr `since` zapytania (epoch): 0 = pełne pobranie obu tygodni."""
+        return 0.0 if self.needs_full(now) else max(0.0, self.watermark - OVERLAP_S)
+
+    def apply(self, delta: pd.DataFrame, full: bool, now: float) -> None:
+        """Scala odpowiedź zapytania linii: pełna zastępuje stan, przyrostowa — upsert + korekta agregatów.
+        Wołane pod self.lock (refresh_live_week); odczyty poniżej biorą tę samą blokadę, więc nie widzą
+        nowego `curr` ze starymi `lines`."""
+        delta = (delta.sort_values("changed_at").drop_duplicates("line_id", keep="last").set_index("line_id")
+                 if not delta.empty else self.lines.iloc[:0])
+        keep = delta[delta["valid"]]  # anulowane / poza platformą: usuwane ze stanu
+        if full:
+            self.lines = keep
+            self.curr = _curr_agg(keep)
+            self.last_full = now
+        else:
+            old = self.lines.loc[self.lines.index.intersection(delta.index)]
+            self.curr = (self.curr.sub(_curr_agg(old), fill_value=0.0)
+                         .add(_curr_agg(keep), fill_value=0.0))
+            self.curr = self.curr[self.curr["n_lines"] > 0]
+            self.lines = pd.concat([self.lines.drop(delta.index, errors="ignore"), keep])
+        if not delta.empty:
+            self.watermark = max(self.watermark, float(delta["changed_at"].max()))
+        self.last_poll = now
+        self.polls += 1
+        self.rows_fetched += len(delta)
+
+    # ── wyniki w kształcie query_snapshot (fakty, bez nazw) / query_order_counts ─
+    def _prev_to_date(self, now: float) -> pd.DataFrame:
+        """Poprzedni tydzień do tej samej chwili (teraz − 7 dni) — porównanie niepełnego tygodnia z pełnym
+        zaniżałoby każdą zmianę WoW."""
+        return self.lines[~self.lines["is_curr"] & (self.lines["order_epoch"] < now - 7 * 86400)]
+
+    def snapshot(self, now: float) -> pd.DataFrame:
+        with self.lock:
+            prev_lines = self._prev_to_date(now)
+            df = self.curr.reindex(columns=["curr_rev", "curr_qty"])
+        prev = prev_lines.groupby("sku")[["line_total", "qty"]].sum()
+        prev = prev.reindex(df.index).fillna(0.0)
+        out = pd.DataFrame({
+            "sku": df.index.astype(str),
+            "curr_rev": df["curr_rev"].to_numpy(),
+            "curr_qty": df["curr_qty"].to_numpy(),
+            "prev_rev": prev["line_total"].to_numpy(),
+            "prev_qty": prev["qty"].to_numpy(),
+        })
+        out["rev_change_pct"] = analytics.change_pct(out["curr_rev"], out["prev_rev"])
+        out["qty_change_pct"] = analytics.change_pct(out["curr_qty"], out["prev_qty"])
+        return out.sort_values("curr_rev", ascending=False, ignore_index=True)
+
+    def order_counts(self, now: float) -> pd.DataFrame:
+        with self.lock:
+            lines, prev_lines = self.lines, self._prev_to_date(now)
+        curr = lines.loc[lines["is_curr"], "order_id"].nunique()
+        prev = prev_lines["order_id"].nunique()
+        return pd.DataFrame({"orders_curr": [int(curr)], "orders_prev": [int(prev)]})
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"lines": len(self.lines), "skus": len(self.curr), "polls": self.polls,
+                    "rows_fetched": self.rows_fetched, "watermark": self.watermark, "last_full": self.last_full,
+                    "last_poll": self.last_poll}
+
+
+_states: dict[str, LiveWeek] = {}
+_states_lock = threading.Lock()
+
+
+def state(platform_key: str, week_start: date) -> LiveWeek:
+    """Stan platformy dla tygodnia; nowy tydzień = nowy stan (pełne pobranie)."""
+    with _states_lock:
+        st = _states.get(platform_key)
+        if st is None or st.week_start != week_start:
+            st = _states[platform_key] = LiveWeek(week_start)
+        return st
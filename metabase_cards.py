@@ -0,0 +1,128 @@
+# metabase_cards.py — szablony SQL_* jako zapisane pytania (karty) Metabase zamiast ad-hoc /api/dataset
+#
+#   metabase_exec_mode = "card"          # domyślnie "dataset" (dotychczasowe zapytania ad-hoc)
+#   metabase_card_collection_id = 42     # opcjonalnie: kolekcja na karty aplikacji
+#
+# Karta na szablon: nazwa "[seller_dashboard] SQL_…", skrót SQL w opisie. Rejestr przy pierwszym użyciu czyta
+# listę kart z Metabase (źródło prawdy dla ID), tworzy brakującą kartę albo aktualizuje zapytanie, gdy SQL
+# w kodzie się zmienił. Wykonanie przez /api/card/:id/query — wtedy działa cache wyników pytań Metabase.
+# Każdy błąd rejestracji/wykonania (brak uprawnień, usunięta karta) = powrót do /api/dataset dla tego wywołania.
+import contextlib
+import logging
+import threading
+import time
+import uuid
+
+import requests
+
+import query_metrics
+
+log = logging.getLogger("seller_dashboard.metabase_cards")
+
+CARD_PREFIX = "[seller_dashboard] "
+HASH_MARK = "sql sha1: "
+RETRY_AFTER_S = 600  # po nieudanej rejestracji (np. chwilowy błąd sieci) — ponowna próba najwcześniej po 10 min
+
+
+class CardRegistry:
+    """{nazwa szablonu: id karty} dla jednej instancji Metabase; wspólny dla sesji procesu."""
+
+    def __init__(self, base_url: str, database_id: int, collection_id: int | None = None, shared=None,
+                 cache_ttl_h: int | None = None):
+        self.base_url = base_url
+        self.database_id = database_id
+        self.collection_id = collection_id
+        self.shared = shared  # shared_cache backend — blokada, żeby repliki nie tworzyły duplikatów kart
+        self.cache_ttl_h = cache_ttl_h
+        self._ids: dict[str, int] = {}
+        self._remote: dict[str, dict] | None = None  # nazwa karty → {"id", "description"} z Metabase
+        self._failed: dict[str, float] = {}  # nazwa → czas nieudanej rejestracji
+        self._lock = threading.Lock()
+
+    # ── rejestracja ────────────────────────────────────────────
+    def card_id(self, sql_text: str, payload: dict, session: str) -> int | None:
+        """ID karty dla szablonu (tworzy/aktualizuje przy pierwszym użyciu); None = użyj /api/dataset."""
+        name = query_metrics.sql_identity(sql_text)
+        if name.startswith("adhoc_") or time.time() - self._failed.get(name, 0.0) < RETRY_AFTER_S:
+            return None
+        card = self._ids.get(name)
+        if card is not None:
+            return card
+        try:
+            lock = self.shared.lock("metabase_cards") if self.shared is not None else contextlib.nullcontext()
+            with self._lock, lock:
+                if name not in self._ids:
+                    self._ids[name] = self._register(name, sql_text, payload, session)
+                    self._failed.pop(name, None)
+                return self._ids[name]
+        except Exception as e:  # także niedostępna blokada wspólna (np. Redis) — nigdy błąd zapytania
+            log.warning("metabase_cards: rejestracja %s nieudana, zostaje /api/dataset: %s", name, e)
+            self._failed[name] = time.time()
+            return None
+
+    def invalidate(self, sql_text: str) -> None:
+        """Karta usunięta/niedostępna (404) — przy następnym wywołaniu rejestr czyta listę kart od nowa."""
+        with self._lock:
+            self._ids.pop(query_metrics.sql_identity(sql_text), None)
+            self._remote = None
+
+    def _headers(self, session: str) -> dict:
+        return {"X-Metabase-Session": session}
+
+    def _load_remote(self, session: str) -> None:
+        r = requests.get(f"{self.base_url}/api/card", params={"f": "all"}, headers=self._headers(session),
+                         timeout=60)
+        r.raise_for_status()
+        self._remote = {c["name"]: c for c in r.json()
+                        if isinstance(c, dict) and str(c.get("name", "")).startswith(CARD_PREFIX)
+                        and not c.get("archived")}
+
+    def _register(self, name: str, sql_text: str, payload: dict, session: str) -> int:
+        fresh = self._remote is None
+        if fresh:
+            self._load_remote(session)
+        description = f"Zarządzane przez Seller Dashboard — nie edytować ręcznie. {HASH_MARK}" \
+                      f"{query_metrics.sql_hash(sql_text)}"
+        body = {
+            "name": CARD_PREFIX + name,
+            "description": description,
+            "display": "table",
+            "visualization_settings": {},
+            "collection_id": self.collection_id,
+            "dataset_query": self._dataset_query(payload),
+        }
+        if self.cache_ttl_h:
+            body["cache_ttl"] = self.cache_ttl_h
+        existing = self._remote.get(CARD_PREFIX + name)
+        if existing is None and not fresh:
+            # lista z wcześniejszej rejestracji mogła się zestarzeć — inna replika mogła utworzyć kartę po niej;
+            # czytana ponownie pod wspólną blokadą, więc POST tylko gdy karty naprawdę nie ma
+            self._load_remote(session)
+            existing = self._remote.get(CARD_PREFIX + name)
+        if existing is None:
+            r = requests.post(f"{self.base_url}/api/card", json=body, headers=self._headers(session), timeout=60)
+            r.raise_for_status()
+            card = r.json()
+            log.info("metabase_cards: utworzono kartę %s → %s", name, card["id"])
+        elif existing.get("description") != description:
+            r = requests.put(f"{self.base_url}/api/card/{existing['id']}", json=body,
+                             headers=self._headers(session), timeout=60)
+            r.raise_for_status()
+            card = {**existing, **body}
+            log.info("metabase_cards: zaktualizowano SQL karty %s (%s)", name, existing["id"])
+        else:
+            card = existing
+        self._remote[CARD_PREFIX + name] = card
+        return int(card["id"])
+
+    def _dataset_query(self, payload: dict) -> dict:
+        """Zapytanie natywne karty: template tagi z payloadu /api/dataset, z id wymaganym przez nowsze Metabase."""
+        native = dict(payload["native"])
+        native["template-tags"] = {k: {"id": str(uuid.uuid5(uuid.NAMESPACE_URL, k)), **tag}
+                                   for k, tag in native.get("template-tags", {}).items()}
+        return {"database": self.database_id, "type": "native", "native": native}
+
+    # ── podgląd (panel admina) ─────────────────────────────────
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cards": dict(self._ids), "failed": sorted(self._failed)}
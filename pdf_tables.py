@@ -0,0 +1,141 @@
+# pdf_tables.py — stronicowany eksport tabel do PDF (reportlab, bez matplotlib)
+#
+# Wiersze idą do płótna stronami: każda strona to osobna reportlab.Table (nagłówek powtarzany na każdej
+# stronie), rysowana i od razu zwalniana — w pamięci jest jeden blok napisów (BLOCK_ROWS) i gotowy strumień
+# PDF, nie cały dokument jako drzewo flowables.
+import importlib.util
+import io
+import os
+from functools import lru_cache
+
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph, Table, TableStyle
+
+PAGE_SIZE = landscape(A4)
+MARGIN = 1.2 * cm
+FONT_SIZE = 7
+ROW_HEIGHT = 11  # pt, stała wysokość wiersza danych → stała liczba wierszy na stronę
+HEADER_HEIGHT = 30  # pt, nagłówek do 3 linii
+SAMPLE_ROWS = 500  # szerokości kolumn z próbki pierwszych wierszy
+BLOCK_ROWS = 2_000  # formatowanie napisów blokami (kolumnowo), rysowanie stronami
+MIN_COL_CHARS = 4
+
+
+@lru_cache(maxsize=1)
+def fonts() -> tuple[str, str]:
+    """(zwykły, pogrubiony) — DejaVuSans z pakietu matplotlib (polskie znaki), w razie braku Helvetica."""
+    try:
+        # ścieżka pakietu bez importu matplotlib (import kosztuje więcej niż cały eksport małej tabeli)
+        spec = importlib.util.find_spec("matplotlib")
+        base = os.path.join(spec.submodule_search_locations[0], "mpl-data", "fonts", "ttf")
+        pdfmetrics.registerFont(TTFont("DejaVuSans", os.path.join(base, "DejaVuSans.ttf")))
+        pdfmetrics.registerFont(TTFont("DejaVuSans-Bold", os.path.join(base, "DejaVuSans-Bold.ttf")))
+        return "DejaVuSans", "DejaVuSans-Bold"
+    except Exception:
+        return "Helvetica", "Helvetica-Bold"
+
+
+@lru_cache(maxsize=1)
+def _styles() -> tuple[TableStyle, ParagraphStyle]:
+    regular, bold = fonts()
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3f51b5')),
+        ('FONTNAME', (0, 1), (-1, -1), regular),
+        ('FONTSIZE', (0, 0), (-1, -1), FONT_SIZE),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('TOPPADDING', (0, 0), (-1, -1), 1),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+        ('LEFTPADDING', (0, 0), (-1, -1), 2),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#eeeeee')]),
+    ])
+    header_style = ParagraphStyle("TableHeader", fontName=bold, fontSize=FONT_SIZE, leading=FONT_SIZE + 1,
+                                  textColor=colors.whitesmoke)
+    return table_style, header_style
+
+
+def _cell_strings(chunk: pd.DataFrame) -> list[pd.Series]:
+    """Kolumny fragmentu jako napisy (NaN → pusty), kolumnowo zamiast per komórka."""
+    out = []
+    for col in chunk.columns:
+        s = chunk[col]
+        if pd.api.types.is_float_dtype(s):
+            txt = s.map("{:,.2f}".format).where(s.notna(), "")
+        else:
+            txt = s.astype(str).where(s.notna(), "")
+        out.append(txt)
+    return out
+
+
+def _column_widths(sample: pd.DataFrame, width: float) -> tuple[list[float], list[int]]:
+    """Szerokości kolumn proporcjonalne do długości treści (z próbki) i limit znaków na kolumnę."""
+    chars = []
+    for col, txt in zip(sample.columns, _cell_strings(sample)):
+        longest = int(txt.str.len().quantile(0.95)) if len(txt) else 0
+        chars.append(max(MIN_COL_CHARS, min(longest, 60), min(len(str(col)), 14)))
+    total = float(sum(chars))
+    widths = [width * c / total for c in chars]
+    char_w = FONT_SIZE * 0.55
+    limits = [max(MIN_COL_CHARS, int((w - 4) / char_w)) for w in widths]
+    return widths, limits
+
+
+def rows_per_page(page_size: tuple[float, float] = PAGE_SIZE, first_page: bool = False) -> int:
+    usable = page_size[1] - 2 * MARGIN - HEADER_HEIGHT - 14  # 14 pt: stopka
+    if first_page:
+        usable -= 22  # tytuł
+    return max(1, int(usable // ROW_HEIGHT))
+
+
+def table_pdf_bytes(dframe: pd.DataFrame, title: str = "Raport", max_rows: int | None = None,
+                    page_size: tuple[float, float] = PAGE_SIZE) -> bytes:
+    """Tabela na wielu stronach A4 (poziomo), nagłówek na każdej stronie, numer strony w stopce."""
+    d = dframe if max_rows is None else dframe.head(max_rows)
+    regular, bold = fonts()
+    table_style, header_style = _styles()
+    page_w, page_h = page_size
+    width = page_w - 2 * MARGIN
+    widths, limits = _column_widths(d.head(SAMPLE_ROWS), width)
+    header = [Paragraph(str(c), header_style) for c in d.columns]
+
+    per_first, per_page = rows_per_page(page_size, first_page=True), rows_per_page(page_size)
+    n = len(d)
+    pages = 1 if n <= per_first else 1 + -(-(n - per_first) // per_page)
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=page_size, pageCompression=1)
+    c.setTitle(title)
+    block_start, block = 0, []
+    start = 0
+    for page in range(1, pages + 1):
+        top = page_h - MARGIN
+        if page == 1:
+            c.setFont(bold, 13)
+            c.drawString(MARGIN, top - 13, title)
+            top -= 22
+        stop = min(n, start + (per_first if page == 1 else per_page))
+        if stop > block_start + len(block):
+            # następny blok wierszy: napisy kolumnowo, przycięte do szerokości kolumn
+            block_start = start
+            chunk = d.iloc[start:max(stop, start + BLOCK_ROWS)]
+            cols = [txt.str.slice(0, lim) for txt, lim in zip(_cell_strings(chunk), limits)]
+            block = [list(r) for r in zip(*cols)]
+        data = [header] + block[start - block_start:stop - block_start]
+        table = Table(data, colWidths=widths, rowHeights=[HEADER_HEIGHT] + [ROW_HEIGHT] * (len(data) - 1))
+        table.setStyle(table_style)
+        _, h = table.wrapOn(c, width, top - MARGIN)
+        table.drawOn(c, MARGIN, top - h)
+        c.setFont(regular, 7)
+        c.drawRightString(page_w - MARGIN, MARGIN / 2, f"Strona {page}/{pages} • wierszy: {n:,}")
+        c.showPage()
+        start = stop
+    c.save()
+    return buf.getvalue()
@@ -0,0 +1,121 @@
+# perf.py — pomiar czasu etapów reruna i profilowanie (bez zależności od Streamlit)
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+PERF_HISTORY_LEN = 50
+
+_local = threading.local()
+
+
+# ─────────────────────────────────────────────────────────────
+# 1) Timer etapów (zagnieżdżone nazwy: "allegro/query/decode")
+# ─────────────────────────────────────────────────────────────
+class StageTimer:
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.durations: dict[str, float] = {}
+        self._t0 = time.perf_counter()
+        self._stack: list[str] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        self._stack.append(name)
+        key = "/".join(self._stack)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[key] = self.durations.get(key, 0.0) + (time.perf_counter() - t0)
+            self._stack.pop()
+
+    def total(self) -> float:
+        return time.perf_counter() - self._t0
+
+    def snapshot(self) -> dict:
+        """Zamrożony wynik reruna — do historii kroczącej."""
+        return {"started_at": self.started_at, "total_s": self.total(), "stages": dict(self.durations)}
+
+
+def begin_run() -> StageTimer:
+    """Zakłada nowy timer dla bieżącego wątku (jeden rerun = jeden wątek skryptu)."""
+    _local.timer = StageTimer()
+    return _local.timer
+
+
+def current() -> StageTimer | None:
+    return getattr(_local, "timer", None)
+
+
+@contextmanager
+def stage(name: str):
+    """Mierzy etap w aktywnym timerze; bez timera (np. CLI) działa jako no-op."""
+    timer = current()
+    if timer is None:
+        yield
+    else:
+        with timer.stage(name):
+            yield
+
+
+def new_history() -> deque:
+    return deque(maxlen=PERF_HISTORY_LEN)
+
+
+# ─────────────────────────────────────────────────────────────
+# 2) Ramki do panelu QA
+# ─────────────────────────────────────────────────────────────
+def _matches(key: str, prefix: str | None) -> bool:
+    return prefix is None or key == prefix or key.startswith(prefix + "/")
+
+
+def stages_frame(snapshot: dict, prefix: str | None = None) -> pd.DataFrame:
+    rows = [(k, v * 1000.0) for k, v in snapshot.get("stages", {}).items() if _matches(k, prefix)]
+    return pd.DataFrame(rows, columns=["etap", "ms"]).round({"ms": 1})
+
+
+def history_frame(history, prefix: str | None = None) -> pd.DataFrame:
+    """Wiersze = reruny, kolumny = etapy (ms). Brakujące etapy (np. cache hit) = NaN."""
+    records = []
+    for snap in history:
+        rec = {k: v * 1000.0 for k, v in snap.get("stages", {}).items() if _matches(k, prefix)}
+        if rec:
+            rec["started_at"] = snap["started_at"]
+            records.append(rec)
+    if not records:
+        return pd.DataFrame()
+    return pd.DataFrame.from_records(records).set_index("started_at").round(1)
+
+
+# ─────────────────────────────────────────────────────────────
+# 3) Profilowanie jednego reruna (cProfile)
+# ─────────────────────────────────────────────────────────────
+def start_profiler() -> cProfile.Profile | None:
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except ValueError:
+        # inny profiler jest już aktywny w tym procesie
+        return None
+    return prof
+
+
+def stop_profiler(prof: cProfile.Profile, limit: int = 40) -> dict:
+    """Zwraca surowe statystyki (.prof, zgodne z pstats/snakeviz) i raport tekstowy."""
+    prof.disable()
+    prof.create_stats()
+    out = io.StringIO()
+    pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(limit)
+    return {
+        "created_at": datetime.now(),
+        "prof_bytes": marshal.dumps(prof.stats),
+        "report": out.getvalue(),
+    }
@@ -0,0 +1,73 @@
+# products.py — wymiar produktów (SKU → nazwa) pobierany raz i dołączany do faktów lokalnie, przy wyświetlaniu
+#
+# Zapytania faktów (snapshot, trend, mapa, tryb na żywo, dni) zwracają tylko SKU i liczby: nazwa nie jest
+# powtarzana w każdym wierszu odpowiedzi (bajty JSON/CSV, dekodowanie, GROUP BY po tekście w bazie). Nazwy
+# z jednego zapytania SQL_PRODUCTS (długi TTL, wspólny cache replik) są mapowane po SKU — dla kolumny
+# kategorycznej raz na kategorię, nie na wiersz. SKU spoza wymiaru (nowy produkt) dostaje jako nazwę sam SKU,
+# a wymiar jest odświeżany najwyżej raz na REFRESH_MISSING_AFTER_S.
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+REFRESH_MISSING_AFTER_S = 600
+
+_last_refresh = 0.0
+_refresh_lock = threading.Lock()
+
+
+def name_index(dim: pd.DataFrame) -> pd.Series:
+    """Ramka wymiaru (sku, product_name) → Series sku → nazwa, unikalny indeks."""
+    if dim is None or dim.empty:
+        return pd.Series(dtype="str")
+    s = pd.Series(dim["product_name"].astype(str).to_numpy(), index=dim["sku"].astype(str).to_numpy())
+    return s[~s.index.duplicated()]
+
+
+def lookup(skus, names: pd.Series) -> np.ndarray:
+    """Nazwy dla tablicy SKU; brak w wymiarze → sam SKU."""
+    skus = pd.Index(np.asarray(skus, dtype=object)).astype(str)
+    found = names.reindex(skus).to_numpy(dtype=object)
+    missing = pd.isna(found)
+    found[missing] = skus.to_numpy(dtype=object)[missing]
+    return found
+
+
+def missing_count(skus: pd.Series, names: pd.Series) -> int:
+    uniq = pd.Index(skus.dropna().unique()).astype(str)
+    return int((~uniq.isin(names.index)).sum())
+
+
+def join_names(df: pd.DataFrame, names: pd.Series) -> pd.DataFrame:
+    """Kopia df z kolumną product_name zaraz po sku (kształt sprzed podziału na wymiar i fakty)."""
+    if "product_name" in df.columns or "sku" not in df.columns:
+        return df
+    sku = df["sku"]
+    if isinstance(sku.dtype, pd.CategoricalDtype):
+        # nazwy kategorii, kody bez zmian — ta sama nazwa dla kilku SKU to jedna kategoria wyniku
+        inverse, uniques = pd.factorize(lookup(sku.cat.categories, names))
+        codes = sku.cat.codes.to_numpy()
+        values = pd.Categorical.from_codes(np.where(codes >= 0, inverse[codes], -1), categories=uniques)
+    else:
+        values = lookup(sku.fillna("").to_numpy(dtype=object), names)
+        values[sku.isna().to_numpy()] = None
+    out = df.copy(deep=False)
+    out.insert(out.columns.get_loc("sku") + 1, "product_name", values)
+    return out
+
+
+def mark_refreshed(now: float | None = None) -> None:
+    global _last_refresh
+    _last_refresh = time.time() if now is None else now
+
+
+def refresh_due(n_missing: int, now: float | None = None) -> bool:
+    """Czy odświeżyć wymiar z powodu SKU bez nazwy — najwyżej raz na REFRESH_MISSING_AFTER_S (proces)."""
+    global _last_refresh
+    now = time.time() if now is None else now
+    with _refresh_lock:
+        if n_missing and now - _last_refresh > REFRESH_MISSING_AFTER_S:
+            _last_refresh = now
+            return True
+    return False
@@ -0,0 +1,347 @@
+# query_cache.py — cache wyników zapytań w pamięci procesu z budżetem bajtów (zamiast @st.cache_data bez limitu)
+#
+# Wspólny dla sesji jak st.cache_data, ale: rozmiar wpisu liczony z ramki (memory_usage(deep=True)), łączny
+# budżet pamięci i eviction GDSF (Greedy-Dual-Size-Frequency): priorytet = zegar + trafienia × koszt / rozmiar,
+# gdzie koszt = czas pobrania z Metabase. Wypadają najpierw duże, rzadko czytane i tanie do odtworzenia wpisy;
+# jednowierszowe liczniki zamówień zostają, a rok przeglądanych tygodni trendu nie rozsadza pamięci.
+#
+# Opcjonalny drugi poziom (configure(shared=...), shared_cache.py): przy lokalnym chybieniu wynik czytany ze
+# wspólnego backendu replik, a pobranie z Metabase odbywa się pod blokadą klucza — jedna replika pyta, reszta
+# dostaje gotowy wynik. Awaria backendu = zwykłe chybienie (log), nigdy błąd strony.
+#
+# W procesie (także bez wspólnego backendu) pobranie klucza jest single-flight jak blokada obliczeń
+# st.cache_data: sesje chybiające ten sam zimny klucz czekają na pierwszą zamiast pytać Metabase równolegle.
+import contextlib
+import functools
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+import query_metrics
+import shared_cache
+
+log = logging.getLogger("seller_dashboard.query_cache")
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_TTL_S = 600
+
+
+@dataclass
+class _Entry:
+    fn: str
+    args: tuple
+    value: object
+    nbytes: int
+    cost_s: float
+    created: float
+    last_access: float
+    hits: int = 0
+    priority: float = 0.0
+
+
+@dataclass
+class _FnStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    shared_hits: int = 0
+    shared_stores: int = 0
+    entries: int = 0
+    bytes: int = 0
+    fetch_s: float = field(default=0.0)
+
+
+def value_nbytes(value) -> int:
+    """Rozmiar wyniku w pamięci: ramki/serie głęboko (z napisami), reszta — przybliżenie stałe."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True, index=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    return 1024
+
+
+def _share(value):
+    """Ramka oddawana wywołującemu jako płytka kopia — dopisanie kolumn (add_avg_prices) nie zmienia wpisu w
+    cache (pandas copy-on-write), a kopiowanie danych jak w st.cache_data (pickle) odpada."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    return value
+
+
+class QueryCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: dict[tuple, _Entry] = {}
+        self._stats: dict[str, _FnStats] = {}
+        self._bytes = 0
+        self._clock = 0.0  # GDSF: L — rośnie do priorytetu ostatnio usuniętego wpisu (starzenie)
+        self._lock = threading.Lock()
+
+    # ── odczyt / zapis ─────────────────────────────────────────
+    def _priority(self, e: _Entry) -> float:
+        return self._clock + (e.hits + 1) * max(e.cost_s, 1e-3) / max(e.nbytes, 1) * 1e6
+
+    def get(self, key: tuple, ttl_s: float):
+        now = time.time()
+        with self._lock:
+            e = self._entries.get(key)
+            st = self._stats.setdefault(key[0], _FnStats())
+            if e is not None and now - e.created > ttl_s:
+                self._drop(key, reason="expired")
+                e = None
+            if e is None:
+                st.misses += 1
+                return None, False
+            e.hits += 1
+            e.last_access = now
+            e.priority = self._priority(e)
+            st.hits += 1
+            return e.value, True
+
+    def put(self, key: tuple, value, cost_s: float, created: float | None = None) -> None:
+        """created — moment pobrania z Metabase (wpis ze wspólnego backendu nie dostaje nowego TTL)."""
+        nbytes = value_nbytes(value)
+        now = time.time()
+        with self._lock:
+            st = self._stats.setdefault(key[0], _FnStats())
+            st.fetch_s += cost_s
+            if key in self._entries:
+                self._drop(key, reason=None)
+            if nbytes > self.max_bytes:
+                return  # pojedynczy wynik większy niż cały budżet — nie cache'ujemy
+            e = _Entry(fn=key[0], args=key[1:], value=value, nbytes=nbytes, cost_s=cost_s,
+                       created=now if created is None else created, last_access=now)
+            e.priority = self._priority(e)
+            self._entries[key] = e
+            self._bytes += nbytes
+            st.entries += 1
+            st.bytes += nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                victim = min((k for k in self._entries if k != key), key=lambda k: self._entries[k].priority)
+                self._clock = self._entries[victim].priority
+                self._drop(victim, reason="evicted")
+
+    def _drop(self, key: tuple, reason: str | None) -> None:
+        e = self._entries.pop(key)
+        self._bytes -= e.nbytes
+        st = self._stats[e.fn]
+        st.entries -= 1
+        st.bytes -= e.nbytes
+        if reason == "evicted":
+            st.evictions += 1
+        elif reason == "expired":
+            st.expirations += 1
+        if reason:
+            query_metrics.record_cache_eviction(e.fn, reason)
+
+    def count(self, fn: str, stat: str) -> None:
+        with self._lock:
+            st = self._stats.setdefault(fn, _FnStats())
+            setattr(st, stat, getattr(st, stat) + 1)
+
+    def discard(self, key: tuple) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._drop(key, reason=None)
+            return True
+
+    def clear(self, fn: str | None = None) -> int:
+        with self._lock:
+            keys = [k for k in self._entries if fn is None or k[0] == fn]
+            for k in keys:
+                self._drop(k, reason=None)
+            return len(keys)
+
+    # ── podgląd (panel admina) ─────────────────────────────────
+    def stats(self) -> dict:
+        with self._lock:
+            return {"bytes": self._bytes, "max_bytes": self.max_bytes, "entries": len(self._entries),
+                    "functions": {fn: vars(st).copy() for fn, st in self._stats.items()}}
+
+    def entries(self) -> list[dict]:
+        now = time.time()
+        with self._lock:
+            return [{"fn": e.fn, "args": ", ".join(map(_arg_label, e.args)), "bytes": e.nbytes,
+                     "age_s": round(now - e.created, 1), "idle_s": round(now - e.last_access, 1),
+                     "hits": e.hits, "fetch_s": round(e.cost_s, 3), "priority": e.priority}
+                    for e in sorted(self._entries.values(), key=lambda e: -e.nbytes)]
+
+
+def _arg_label(a) -> str:
+    if isinstance(a, str) and "SELECT" in a:
+        return query_metrics.sql_identity(a)  # nazwa szablonu SQL_* zamiast pełnego tekstu
+    return str(a)
+
+
+CACHE = QueryCache()
+SHARED = None  # shared_cache.DirectoryBackend / RedisBackend albo None (tylko pamięć procesu)
+
+
+def configure(max_bytes: int | None = None, shared=None) -> None:
+    global SHARED
+    if max_bytes:
+        CACHE.max_bytes = int(max_bytes)
+    if shared is not None:
+        SHARED = shared
+
+
+# ── drugi poziom: wspólny backend replik ─────────────────────
+def _shared_get(skey: str):
+    """(wartość, created) ze wspólnego backendu albo (None, None)."""
+    try:
+        found = SHARED.get(skey)
+        if found is not None:
+            data, expires = found
+            return shared_cache.deserialize(data), expires
+    except Exception as e:
+        log.warning("shared cache: odczyt %s nieudany: %s", skey, e)
+    return None, None
+
+
+def _shared_put(skey: str, value, ttl_s: float) -> bool:
+    data = shared_cache.serialize(value)
+    if data is None:
+        return False
+    try:
+        SHARED.set(skey, data, ttl_s)
+        return True
+    except Exception as e:
+        log.warning("shared cache: zapis %s nieudany: %s", skey, e)
+        return False
+
+
+@contextlib.contextmanager
+def _shared_lock(skey: str):
+    """Blokada klucza między replikami; niedostępny backend — pobieramy bez blokady."""
+    cm = SHARED.lock(skey)
+    try:
+        cm.__enter__()
+    except Exception as e:
+        log.warning("shared cache: blokada %s niedostępna: %s", skey, e)
+        yield
+        return
+    try:
+        yield
+    finally:
+        cm.__exit__(None, None, None)
+
+
+def _storable(value) -> bool:
+    return value is not None and not (isinstance(value, (pd.DataFrame, pd.Series)) and value.empty)
+
+
+_flights: dict[tuple, list] = {}  # klucz → [blokada, liczba sesji czekających / pobierających]
+_flights_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _single_flight(key: tuple):
+    """Jedno pobranie klucza naraz w procesie; yield True = czekaliśmy na inne pobranie (sprawdź cache ponownie)."""
+    with _flights_lock:
+        flight = _flights.setdefault(key, [threading.Lock(), 0])
+        flight[1] += 1
+    waited = not flight[0].acquire(blocking=False)
+    if waited:
+        flight[0].acquire()
+    try:
+        yield waited
+    finally:
+        flight[0].release()
+        with _flights_lock:
+            flight[1] -= 1
+            if flight[1] == 0:
+                _flights.pop(key, None)
+
+
+def _key_part(a):
+    return a.isoformat() if hasattr(a, "isoformat") else a
+
+
+def _make_key(fn_name: str, args: tuple, kwargs: dict) -> tuple:
+    return (fn_name,) + tuple(_key_part(a) for a in args) + tuple(
+        (k, _key_part(v)) for k, v in sorted(kwargs.items()))
+
+
+def cached(fn_name: str, ttl_s: float = DEFAULT_TTL_S, shared: bool = True):
+    """Dekorator zamiast @st.cache_data: klucz = (fn_name, argumenty), wynik wspólny dla sesji procesu.
+
+    Puste ramki i None nie są zapisywane: to zwykle błąd / HTTP 202 (komunikat st.error z ciała funkcji nie
+    byłby odtworzony przy trafieniu, jak w st.cache_data), a pusty tydzień jest tani do ponownego sprawdzenia.
+    shared=False — wynik tylko w pamięci procesu (np. złożenie z innych, już współdzielonych wyników).
+    """
+
+    def deco(fn):
+        def fetch(key, args, kwargs):
+            t0 = time.perf_counter()
+            value = fn(*args, **kwargs)
+            cost = time.perf_counter() - t0
+            if _storable(value):
+                CACHE.put(key, value, cost)
+            return value, cost
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = _make_key(fn_name, args, kwargs)
+            value, hit = CACHE.get(key, ttl_s)
+            if hit:
+                return _share(value)
+            with _single_flight(key) as waited:
+                if waited:  # inna sesja pobierała ten klucz — zwykle wynik już jest w cache
+                    value, hit = CACHE.get(key, ttl_s)
+                    if hit:
+                        return _share(value)
+                return load(key, args, kwargs)
+
+        def load(key, args, kwargs):
+            if not (shared and SHARED is not None):
+                return _share(fetch(key, args, kwargs)[0])
+
+            skey = shared_cache.key_name(*key)
+            t0 = time.perf_counter()
+            value, expires = _shared_get(skey)
+            if value is None:
+                with _shared_lock(skey):
+                    value, expires = _shared_get(skey)  # inna replika mogła pobrać, gdy czekaliśmy na blokadę
+                    if value is None:
+                        value, _ = fetch(key, args, kwargs)
+                        if _storable(value) and _shared_put(skey, value, ttl_s):
+                            CACHE.count(fn_name, "shared_stores")
+                        return _share(value)
+            CACHE.count(fn_name, "shared_hits")
+            CACHE.put(key, value, time.perf_counter() - t0, created=expires - ttl_s)
+            return _share(value)
+
+        def clear():
+            if shared and SHARED is not None:
+                try:
+                    SHARED.delete_prefix(fn_name)
+                except Exception as e:
+                    log.warning("shared cache: czyszczenie %s nieudane: %s", fn_name, e)
+            return CACHE.clear(fn_name)
+
+        def invalidate(stale: str, *args, **kwargs) -> None:
+            """Usuwa wynik wywołania (args), gdy to nadal `stale` — np. token sesji odrzucony przez 401.
+
+            Lokalny wpis znika zawsze; wspólny tylko, jeśli wciąż zawiera `stale` — inna replika mogła już zapisać
+            świeży token i wtedy następne wywołanie go przeczyta zamiast logować się ponownie.
+            """
+            key = _make_key(fn_name, args, kwargs)
+            CACHE.discard(key)
+            if shared and SHARED is not None:
+                skey = shared_cache.key_name(*key)
+                current, _ = _shared_get(skey)
+                if isinstance(current, str) and current == stale:
+                    try:
+                        SHARED.delete(skey)
+                    except Exception as e:
+                        log.warning("shared cache: usunięcie %s nieudane: %s", skey, e)
+
+        wrapper.clear = clear
+        wrapper.invalidate = invalidate
+        return wrapper
+
+    return deco
@@ -0,0 +1,252 @@
+# query_metrics.py — metryki wywołań Metabase (Prometheus + logi strukturalne), wspólne dla całego procesu
+import functools
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger("seller_dashboard.metabase")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RECENT_EVENTS = 200
+
+_lock = threading.Lock()
+_local = threading.local()
+_sql_names: dict[str, str] = {}
+
+# klucz etykiet → wartość; etykiety celowo bez parametrów (kardynalność) — parametry trafiają do logów/zdarzeń
+_counters: dict[tuple, float] = {}
+_hist_buckets: dict[tuple, list[int]] = {}
+_hist_sum: dict[tuple, float] = {}
+_hist_count: dict[tuple, int] = {}
+_recent: deque = deque(maxlen=RECENT_EVENTS)
+
+_textfile: str | None = None
+_server: ThreadingHTTPServer | None = None
+
+
+# ─────────────────────────────────────────────────────────────
+# 1) Tożsamość zapytania
+# ─────────────────────────────────────────────────────────────
+def register_sql(namespace: dict) -> None:
+    """Rejestruje nazwy szablonów SQL_* (np. globals() aplikacji), żeby metryki miały czytelne etykiety."""
+    for name, value in namespace.items():
+        if name.startswith("SQL_") and isinstance(value, str):
+            _sql_names[sql_hash(value)] = name
+
+
+def sql_hash(sql_text: str) -> str:
+    return hashlib.sha1(sql_text.encode("utf-8")).hexdigest()[:10]
+
+
+def sql_identity(sql_text: str) -> str:
+    h = sql_hash(sql_text)
+    return _sql_names.get(h, f"adhoc_{h}")
+
+
+# ─────────────────────────────────────────────────────────────
+# 2) Rejestracja zdarzeń
+# ─────────────────────────────────────────────────────────────
+def _inc(name: str, labels: dict, value: float = 1.0) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    _counters[key] = _counters.get(key, 0.0) + value
+
+
+def _observe(name: str, labels: dict, value: float) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    buckets = _hist_buckets.setdefault(key, [0] * len(LATENCY_BUCKETS))
+    for i, le in enumerate(LATENCY_BUCKETS):
+        if value <= le:
+            buckets[i] += 1
+    _hist_sum[key] = _hist_sum.get(key, 0.0) + value
+    _hist_count[key] = _hist_count.get(key, 0) + 1
+
+
+def record_call(kind: str, sql: str, params: dict | None, latency_s: float, status: int | None,
+                rows: int | None = None, response_bytes: int | None = None, polled: bool = False) -> dict:
+    """Jedno wywołanie HTTP do Metabase (kind: dataset / csv / session)."""
+    event = {
+        "ts": datetime.now().isoformat(timespec="milliseconds"),
+        "kind": kind,
+        "sql": sql,
+        "params": {k: str(v) for k, v in (params or {}).items()},
+        "latency_ms": round(latency_s * 1000.0, 1),
+        "status": status,
+        "rows": rows,
+        "bytes": response_bytes,
+        "polled": polled,
+        "from_cache": False,
+    }
+    labels = {"kind": kind, "sql": sql}
+    with _lock:
+        _inc("metabase_requests_total", {**labels, "status": str(status)})
+        _observe("metabase_request_duration_seconds", labels, latency_s)
+        if rows is not None:
+            _inc("metabase_rows_total", labels, rows)
+        if response_bytes is not None:
+            _inc("metabase_response_bytes_total", labels, response_bytes)
+        if polled:
+            _inc("metabase_polls_total", labels)
+        _recent.append(event)
+    log.info(json.dumps(event, ensure_ascii=False, default=str))
+    return event
+
+
+def record_cache_lookup(fn_name: str, sql: str, params: dict, hit: bool) -> None:
+    labels = {"fn": fn_name, "sql": sql, "result": "hit" if hit else "miss"}
+    with _lock:
+        _inc("query_cache_lookups_total", labels)
+        if hit:
+            event = {
+                "ts": datetime.now().isoformat(timespec="milliseconds"),
+                "kind": fn_name, "sql": sql, "params": params, "latency_ms": None, "status": None,
+                "rows": None, "bytes": None, "polled": False, "from_cache": True,
+            }
+            _recent.append(event)
+    if hit:
+        log.info(json.dumps(event, ensure_ascii=False, default=str))
+
+
+def record_cache_eviction(fn_name: str, reason: str) -> None:
+    """Wpis usunięty z query_cache (reason: evicted = budżet pamięci, expired = TTL)."""
+    with _lock:
+        _inc("query_cache_evictions_total", {"fn": fn_name, "reason": reason})
+
+
+def track_cache(fn_name: str):
+    """Owija funkcję z cache (query_cache.cached / @st.cache_data); ciało funkcji woła mark_miss(), więc brak
+    znacznika = trafienie w cache.
+
+    Zakłada sygnaturę (sql_text, *params) albo (*params) — pierwszy argument będący SQL-em trafia do etykiety.
+    """
+
+    def deco(cached_fn):
+        @functools.wraps(cached_fn)
+        def wrapper(*args, **kwargs):
+            stack = _local.__dict__.setdefault("miss_stack", [])
+            stack.append(False)
+            try:
+                result = cached_fn(*args, **kwargs)
+            finally:
+                missed = stack.pop()
+            sql = sql_identity(args[0]) if args and isinstance(args[0], str) and "SELECT" in args[0] else ""
+            rest = args[1:] if sql else args
+            params = {f"arg{i}": str(a) for i, a in enumerate(rest)} | {k: str(v) for k, v in kwargs.items()}
+            record_cache_lookup(fn_name, sql, params, hit=not missed)
+            return result
+
+        wrapper.clear = cached_fn.clear
+        return wrapper
+
+    return deco
+
+
+def mark_miss() -> None:
+    stack = getattr(_local, "miss_stack", None)
+    if stack:
+        stack[-1] = True
+
+
+def recent_events() -> list[dict]:
+    with _lock:
+        return list(_recent)
+
+
+# ─────────────────────────────────────────────────────────────
+# 3) Eksport — format tekstowy Prometheus (plik / endpoint HTTP)
+# ─────────────────────────────────────────────────────────────
+_HELP = {
+    "metabase_requests_total": ("counter", "Wywołania HTTP do Metabase"),
+    "metabase_request_duration_seconds": ("histogram", "Czas wywołania Metabase (łącznie z pollingiem 202)"),
+    "metabase_rows_total": ("counter", "Wiersze zwrócone przez Metabase"),
+    "metabase_response_bytes_total": ("counter", "Bajty odpowiedzi Metabase"),
+    "metabase_polls_total": ("counter", "Wywołania zakończone pollingiem po HTTP 202"),
+    "query_cache_lookups_total": ("counter", "Odczyty cache zapytań (hit/miss)"),
+    "query_cache_evictions_total": ("counter", "Wpisy usunięte z cache zapytań (budżet pamięci / TTL)"),
+}
+
+
+def _fmt_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels:
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def render_prometheus() -> str:
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        buckets = {k: list(v) for k, v in _hist_buckets.items()}
+        sums = dict(_hist_sum)
+        counts = dict(_hist_count)
+    for metric, (mtype, help_text) in _HELP.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {mtype}")
+        if mtype == "counter":
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f"{metric}{_fmt_labels(labels)} {int(value) if value.is_integer() else value}")
+        else:
+            for (name, labels), bucket_counts in sorted(buckets.items()):
+                if name != metric:
+                    continue
+                for le, c in zip(LATENCY_BUCKETS, bucket_counts):
+                    lines.append(f"{metric}_bucket{_fmt_labels(labels + (('le', f'{le:g}'),))} {c}")
+                lines.append(f"{metric}_bucket{_fmt_labels(labels + (('le', '+Inf'),))} {counts[(name, labels)]}")
+                lines.append(f"{metric}_sum{_fmt_labels(labels)} {sums[(name, labels)]:.6f}")
+                lines.append(f"{metric}_count{_fmt_labels(labels)} {counts[(name, labels)]}")
+    return "\n".join(lines) + "\n"
+
+
+def configure(textfile: str | None = None, port: int | None = None) -> None:
+    """Plik dla node_exporter (textfile collector) i/lub endpoint /metrics — endpoint startuje raz na proces.
+
+    Zajęty port (inny proces aplikacji, druga replika na hoście) = ostrzeżenie w logu i brak endpointu,
+    nie błąd importu.
+    """
+    global _textfile, _server
+    _textfile = textfile or None
+    if port and _server is None:
+        with _lock:
+            if _server is None:
+                try:
+                    _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+                except OSError as e:
+                    log.warning("metrics: endpoint /metrics na porcie %s niedostępny: %s", port, e)
+                    return
+                threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+
+
+def flush_textfile() -> None:
+    if not _textfile:
+        return
+    directory = os.path.dirname(os.path.abspath(_textfile))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".metrics_", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp, _textfile)  # atomowo — collector nie widzi połowy pliku
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,119 @@
+# region_cube.py — kostka województwo × SKU × tydzień w pamięci (NumPy, bez Streamlit)
+#
+# Budowana raz z hurtowego pobrania na poziomie prefiksów ZIP (wiele tygodni); każdy wycinek mapy —
+# sumy województw, TOP N w regionie, rozkład SKU po regionach, zmiana WoW — to indeksowanie gęstej tablicy.
+import numpy as np
+import pandas as pd
+
+import analytics
+import products
+
+
+class RegionCube:
+    """revenue[W × R × K] (float64, braki = 0) + sumy województw totals[W × R] liczone przy budowie."""
+
+    def __init__(self, df: pd.DataFrame, zip_to_region: dict, weeks: pd.DatetimeIndex,
+                 names: pd.Series | None = None):
+        """names — wymiar produktów sku → nazwa (products.py); bez niego nazwy z kolumny product_name df."""
+        self.regions = sorted(set(zip_to_region.values()))
+        self.weeks = pd.DatetimeIndex(weeks)
+        region_pos = {r: i for i, r in enumerate(self.regions)}
+
+        df = df.dropna(subset=["sku"])
+        # prefiks → województwo tylko dla unikalnych prefiksów (~100), potem indeksowanie
+        zip_codes, zip_uniques = pd.factorize(df["zip_prefix"].astype(str).str.zfill(2))
+        zip_region = np.array([region_pos.get(zip_to_region.get(z), -1) for z in zip_uniques], dtype=np.int64)
+        r = zip_region[zip_codes] if len(zip_uniques) else np.empty(0, dtype=np.int64)
+
+        week_pos = self.weeks.get_indexer(pd.to_datetime(df["week_start"]).dt.normalize())
+        keep = (r >= 0) & (week_pos >= 0)
+        df = df[keep]
+        r, w = r[keep], week_pos[keep]
+
+        sku_codes, sku_uniques = pd.factorize(df["sku"].astype(str))
+        self.skus = np.asarray(sku_uniques, dtype=object)
+        if names is not None:
+            self.names = products.lookup(self.skus, names)  # SKU spoza wymiaru → sam SKU, jak w tabelach
+        else:
+            self.names = (pd.Series(df["product_name"].astype(str).to_numpy()).groupby(sku_codes).last()
+                          .reindex(range(len(self.skus))).fillna("").to_numpy(dtype=object))
+        self._sku_pos = {s: i for i, s in enumerate(self.skus)}
+
+        W, R, K = len(self.weeks), len(self.regions), len(self.skus)
+        flat = (w * R + r) * K + sku_codes
+        self.revenue = np.bincount(flat, weights=df["revenue"].to_numpy(dtype=float),
+                                   minlength=W * R * K).reshape(W, R, K)
+        self.totals = self.revenue.sum(axis=2)
+
+    def __len__(self) -> int:
+        return len(self.skus)
+
+    @property
+    def nbytes(self) -> int:
+        return self.revenue.nbytes + self.totals.nbytes
+
+    def week_index(self, week) -> int:
+        return int(self.weeks.get_loc(pd.Timestamp(week)))
+
+    def sku_index(self, sku) -> int | None:
+        return self._sku_pos.get(sku)
+
+    # ── wycinki ────────────────────────────────────────────────
+    def region_totals(self, w: int) -> np.ndarray:
+        return self.totals[w]
+
+    def wow(self, w: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(bieżący, poprzedni, delta) per województwo; poprzedni tydzień spoza kostki = NaN."""
+        curr = self.totals[w]
+        prev = self.totals[w - 1] if w > 0 else np.full(len(self.regions), np.nan)
+        return curr, prev, curr - prev
+
+    def top_n(self, w: int, n: int) -> tuple[np.ndarray, np.ndarray]:
+        """(indeksy SKU[R × n], przychód[R × n]) — TOP N dla wszystkich województw jednym argpartition."""
+        slab = self.revenue[w]
+        n = min(n, slab.shape[1])
+        if n == 0:
+            return np.empty((len(self.regions), 0), dtype=np.intp), np.empty((len(self.regions), 0))
+        part = np.argpartition(-slab, n - 1, axis=1)[:, :n] if n < slab.shape[1] else \
+            np.broadcast_to(np.arange(n), (len(self.regions), n))
+        vals = np.take_along_axis(slab, part, axis=1)
+        order = np.argsort(-vals, axis=1, kind="stable")
+        return np.take_along_axis(part, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+    def sku_distribution(self, sku, w: int) -> np.ndarray:
+        k = self.sku_index(sku)
+        return np.zeros(len(self.regions)) if k is None else self.revenue[w, :, k]
+
+    def top_skus(self, w: int, n: int) -> list:
+        return self.skus[analytics.top_n_index(self.revenue[w].sum(axis=0), n)].tolist()
+
+    # ── ramki w kształcie używanym przez mapę ──────────────────
+    def region_totals_frame(self, w: int) -> pd.DataFrame:
+        """region, region_total, prev_total, delta, delta_pct — województwa ze sprzedażą w którymkolwiek z 2 tyg."""
+        curr, prev, delta = self.wow(w)
+        mask = (curr > 0) | (np.nan_to_num(prev) > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta_pct = np.where(prev > 0, delta / prev * 100.0, np.nan)
+        return pd.DataFrame({
+            "region": np.asarray(self.regions, dtype=object)[mask],
+            "region_total": curr[mask],
+            "prev_total": prev[mask],
+            "delta": delta[mask],
+            "delta_pct": delta_pct[mask],
+        })
+
+    def top_products_frame(self, w: int, n: int = 10) -> pd.DataFrame:
+        """region, sku, product_name, revenue, region_total, rn — tylko niezerowe pozycje."""
+        idx, vals = self.top_n(w, n)
+        R, m = idx.shape
+        region_idx = np.repeat(np.arange(R), m)
+        flat_idx, flat_vals = idx.ravel(), vals.ravel()
+        mask = flat_vals > 0
+        return pd.DataFrame({
+            "region": np.asarray(self.regions, dtype=object)[region_idx[mask]],
+            "sku": self.skus[flat_idx[mask]],
+            "product_name": self.names[flat_idx[mask]],
+            "revenue": flat_vals[mask],
+            "region_total": self.totals[w][region_idx[mask]],
+            "rn": np.tile(np.arange(1, m + 1), R)[mask],
+        })
@@ -0,0 +1,135 @@
+# report_cache.py — trwały cache wygenerowanych raportów (PDF) na dysku, wspólny dla procesów
+#
+# Klucz = platforma + tydzień + odcisk danych (hash snapshotu i parametrów), więc raport zamkniętego tygodnia
+# jest budowany raz; zmiana danych daje nowy odcisk i nowy plik. Eviction: wiek pliku od zapisu (mtime), potem
+# rozmiar (LRU po atime — ustawiany jawnie przy odczycie, niezależnie od opcji montowania noatime/relatime).
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+_lock = threading.Lock()
+
+
+def fingerprint(*frames, **params) -> str:
+    """Odcisk danych: hash wierszy (pandas, bez indeksu) + kolumn + posortowanych parametrów.
+
+    frames: DataFrame / Series (hash_pandas_object) albo tablice NumPy (kształt, dtype, bajty).
+    """
+    h = hashlib.sha1()
+    for df in frames:
+        if isinstance(df, np.ndarray):
+            h.update(repr((df.shape, df.dtype.str)).encode("utf-8"))
+            h.update(np.ascontiguousarray(df).tobytes() if df.dtype != object else repr(df.tolist()).encode("utf-8"))
+            continue
+        if isinstance(df, pd.DataFrame):
+            h.update(repr(list(df.columns)).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    h.update(repr(sorted((k, str(v)) for k, v in params.items())).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _safe(part: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_.-]", "_", str(part))
+
+
+class ReportCache:
+    def __init__(self, directory: str, max_age_s: float = 30 * 86400, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_age_s = max_age_s
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, platform_key: str, week_start_iso: str, fp: str, ext: str = "pdf") -> str:
+        return os.path.join(self.directory, f"{_safe(platform_key)}_{_safe(week_start_iso)}_{fp}.{ext}")
+
+    def get(self, path: str) -> bytes | None:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        try:
+            created = os.path.getmtime(path)
+            if time.time() - created > self.max_age_s:  # wiek od zapisu — często czytany raport też wygasa
+                self.misses += 1
+                return None
+            os.utime(path, (time.time(), created))  # LRU: czas odczytu w atime, mtime = czas utworzenia
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    def put(self, path: str, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".report_", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)  # atomowo — inny proces nie przeczyta połowy pliku
+        self.evict()
+
+    def get_or_build(self, path: str, build) -> tuple[bytes, bool]:
+        """(bytes, czy z cache) — build() wołane tylko przy braku pliku."""
+        data = self.get(path)
+        if data is not None:
+            return data, True
+        data = build()
+        self.put(path, data)
+        return data, False
+
+    def _entries(self) -> list[tuple[str, float, float, int]]:
+        """(ścieżka, czas utworzenia, ostatni odczyt, rozmiar)."""
+        out = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return out
+        for name in names:
+            if name.startswith("."):
+                continue
+            p = os.path.join(self.directory, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            out.append((p, st.st_mtime, max(st.st_atime, st.st_mtime), st.st_size))
+        return out
+
+    def evict(self) -> int:
+        """Usuwa pliki starsze niż max_age_s, potem najdawniej używane ponad max_bytes; zwraca liczbę usuniętych."""
+        removed = 0
+        now = time.time()
+        with _lock:
+            entries = self._entries()
+            keep = []
+            for p, created, used, size in entries:
+                if now - created > self.max_age_s:
+                    removed += self._remove(p)
+                else:
+                    keep.append((p, used, size))
+            total = sum(size for _, _, size in keep)
+            for p, _, size in sorted(keep, key=lambda e: e[1]):
+                if total <= self.max_bytes:
+                    break
+                removed += self._remove(p)
+                total -= size
+        return removed
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {"files": len(entries), "bytes": sum(e[3] for e in entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,220 @@
+# shared_cache.py — wspólny backend cache dla wielu replik (Redis albo katalog współdzielony z blokadami plików)
+#
+#   shared_cache_url = "redis://host:6379/0"        # Redis (pakiet `redis`, opcjonalny)
+#   shared_cache_url = "file:///mnt/shared/cache"   # katalog na wspólnym wolumenie (NFS/EFS) — lokalny zamiennik
+#
+# Wartości: ramki jako Arrow IPC (kompresja zstd), tekst (token sesji) jako UTF-8 — jeden bajt typu na początku.
+# lock(key) serializuje pobranie tego samego klucza między replikami: pierwsza pobiera z Metabase, reszta czeka
+# i czyta gotowy wynik, więc obciążenie Metabase nie rośnie z liczbą węzłów.
+#
+# Uwaga: token sesji Metabase leży w backendzie jawnym tekstem (ważny do wylogowania/wygaśnięcia) — katalog
+# tylko dla użytkownika aplikacji (tworzony z 0700, pliki 0600), Redis z hasłem/ACL i najlepiej TLS (rediss://).
+# Ramki wymagają pyarrow; bez niego from_url wyłącza wspólny cache (jeden błąd w logu), zamiast dzielić sam token.
+import contextlib
+import hashlib
+import importlib.util
+import io
+import logging
+import os
+import re
+import struct
+import tempfile
+import time
+from urllib.parse import urlparse
+
+import pandas as pd
+
+log = logging.getLogger("seller_dashboard.shared_cache")
+
+LOCK_TIMEOUT_S = 180  # dłużej niż najwolniejsze zapytanie CSV; po tym czasie replika pobiera sama
+_TAG_ARROW, _TAG_TEXT = b"A", b"T"
+_pyarrow_reported = False
+
+
+# ─────────────────────────────────────────────────────────────
+# 1) Serializacja
+# ─────────────────────────────────────────────────────────────
+def serialize(value) -> bytes | None:
+    """DataFrame → Arrow IPC (zstd), str → UTF-8; None = typ nieobsługiwany / błąd konwersji (nie współdzielimy)."""
+    if isinstance(value, str):
+        return _TAG_TEXT + value.encode("utf-8")
+    if isinstance(value, pd.DataFrame):
+        try:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(value, preserve_index=False)
+            sink = io.BytesIO()
+            with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression="zstd")) as w:
+                w.write_table(table)
+            return _TAG_ARROW + sink.getvalue()
+        except Exception as e:  # np. kolumna object z mieszanymi typami
+            log.warning("shared_cache: pomijam serializację ramki: %s", e)
+    return None
+
+
+def deserialize(data: bytes):
+    tag, body = data[:1], data[1:]
+    if tag == _TAG_TEXT:
+        return body.decode("utf-8")
+    if tag == _TAG_ARROW:
+        import pyarrow as pa
+        return pa.ipc.open_stream(body).read_all().to_pandas()
+    raise ValueError(f"nieznany typ wpisu: {tag!r}")
+
+
+def key_name(*parts) -> str:
+    """Klucz backendu: czytelny prefiks funkcji + skrót argumentów (SQL bywa długi)."""
+    fn, rest = str(parts[0]), parts[1:]
+    return f"{fn}:{hashlib.sha1(repr(rest).encode('utf-8')).hexdigest()[:24]}" if rest else fn
+
+
+# ─────────────────────────────────────────────────────────────
+# 2) Backend: katalog współdzielony (fcntl.flock)
+# ─────────────────────────────────────────────────────────────
+class DirectoryBackend:
+    """Plik na klucz: 8 bajtów czasu wygaśnięcia + wartość; zapis atomowy, blokady przez flock na pliku .lock."""
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._writes = 0
+
+    def _path(self, key: str, suffix: str = ".bin") -> str:
+        return os.path.join(self.directory, re.sub(r"[^0-9A-Za-z_.-]", "_", key) + suffix)
+
+    def get(self, key: str) -> tuple[bytes, float] | None:
+        """(wartość, czas wygaśnięcia epoch) albo None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < 8:
+            return None
+        (expires,) = struct.unpack(">d", data[:8])
+        if time.time() > expires:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            return None
+        return data[8:], expires
+
+    def set(self, key: str, value: bytes, ttl_s: float) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".shared_", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(struct.pack(">d", time.time() + ttl_s))
+            f.write(value)
+        os.replace(tmp, self._path(key))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, key: str) -> None:
+        with contextlib.suppress(OSError):
+            os.remove(self._path(key))
+
+    def delete_prefix(self, prefix: str) -> None:
+        safe = re.sub(r"[^0-9A-Za-z_.-]", "_", prefix)
+        for name in os.listdir(self.directory):
+            if name.startswith(safe) and name.endswith(".bin"):
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(self.directory, name))
+
+    def prune(self) -> None:
+        """Usuwa wygasłe wpisy (czytany tylko nagłówek)."""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".bin"):
+                continue
+            path = os.path.join(self.directory, name)
+            with contextlib.suppress(OSError, struct.error):
+                with open(path, "rb") as f:
+                    (expires,) = struct.unpack(">d", f.read(8))
+                if now > expires:
+                    os.remove(path)
+
+    @contextlib.contextmanager
+    def lock(self, key: str):
+        try:
+            import fcntl
+        except ImportError:  # Windows — bez blokad między procesami
+            yield
+            return
+        with open(self._path(key, ".lock"), "a+b") as f:
+            deadline = time.monotonic() + LOCK_TIMEOUT_S
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        log.warning("shared_cache: timeout blokady %s — pobieram bez blokady", key)
+                        yield
+                        return
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ─────────────────────────────────────────────────────────────
+# 3) Backend: Redis (opcjonalny pakiet `redis`)
+# ─────────────────────────────────────────────────────────────
+class RedisBackend:
+    def __init__(self, url: str, namespace: str = "seller_dashboard:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ns = namespace
+
+    def get(self, key: str) -> tuple[bytes, float] | None:
+        pipe = self.client.pipeline()
+        pipe.get(self.ns + key)
+        pipe.pttl(self.ns + key)
+        data, pttl = pipe.execute()
+        if data is None or pttl < 0:
+            return None
+        return data, time.time() + pttl / 1000
+
+    def set(self, key: str, value: bytes, ttl_s: float) -> None:
+        self.client.set(self.ns + key, value, ex=max(1, int(ttl_s)))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.ns + key)
+
+    def delete_prefix(self, prefix: str) -> None:
+        for k in self.client.scan_iter(match=f"{self.ns}{prefix}*"):
+            self.client.delete(k)
+
+    @contextlib.contextmanager
+    def lock(self, key: str):
+        lock = self.client.lock(f"{self.ns}lock:{key}", timeout=LOCK_TIMEOUT_S, blocking_timeout=LOCK_TIMEOUT_S)
+        acquired = lock.acquire()
+        try:
+            yield
+        finally:
+            if acquired:
+                with contextlib.suppress(Exception):
+                    lock.release()
+
+
+def from_url(url: str | None):
+    """redis://… → RedisBackend, file:///ścieżka albo ścieżka → DirectoryBackend, brak → None (wyłączone)."""
+    global _pyarrow_reported
+    if not url:
+        return None
+    if importlib.util.find_spec("pyarrow") is None:
+        if not _pyarrow_reported:  # from_url wołane przy każdym rerunie — błąd w logu raz na proces
+            _pyarrow_reported = True
+            log.error("shared_cache: brak pakietu pyarrow (requirements.txt) — ramki nie mogą być współdzielone, "
+                      "wspólny cache WYŁĄCZONY dla %s", url)
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme in ("redis", "rediss", "unix"):
+        try:
+            return RedisBackend(url)
+        except ImportError:
+            log.warning("shared_cache: brak pakietu redis — wspólny cache wyłączony")
+            return None
+    return DirectoryBackend(parsed.path if parsed.scheme == "file" else url)
@@ -0,0 +1,135 @@
+# sku_search.py — indeks wyszukiwania SKU / nazw produktów dla pickera trendu (bez Streamlit)
+import bisect
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+import products
+
+# Punktacja trafień — wyżej = lepiej; remisy rozstrzyga sprzedaż w horyzoncie trendu
+SCORE_SKU_EXACT = 100
+SCORE_SKU_PREFIX = 80
+SCORE_TOKENS_PREFIX = 60
+SCORE_SKU_SUBSTRING = 40
+SCORE_NAME_SUBSTRING = 20
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    """Małe litery bez polskich znaków ("Łóżeczko" → "lozeczko")."""
+    text = str(text).lower().replace("ł", "l")
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def _blob(keys: list[str]) -> tuple[str, np.ndarray]:
+    """Wszystkie klucze w jednym napisie ("\n" jako separator) + offsety początków."""
+    lengths = np.fromiter((len(k) + 1 for k in keys), dtype=np.int64, count=len(keys))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(keys) else np.empty(0, dtype=np.int64)
+    return "\n".join(keys), starts
+
+
+def _substring_hits(blob: str, starts: np.ndarray, q: str) -> np.ndarray:
+    """Pozycje kluczy zawierających q — skan w C (re) po jednym napisie zamiast pętli po wierszach."""
+    offsets = np.fromiter((m.start() for m in re.finditer(re.escape(q), blob)), dtype=np.int64)
+    return np.unique(np.searchsorted(starts, offsets, side="right") - 1)
+
+
+class SkuSearchIndex:
+    """Budowany raz na zbiór trendu; zapytanie = prefiks SKU (bisect), prefiksy tokenów (indeks odwrócony)
+    i podciąg (jeden skan po złączonych kluczach)."""
+
+    def __init__(self, df_trend: pd.DataFrame, names: pd.Series | None = None):
+        """names — wymiar produktów sku → nazwa (products.py); bez niego nazwy z kolumny product_name."""
+        grouped = (df_trend.dropna(subset=["sku"])
+                   .assign(sku=lambda d: d["sku"].astype(str))
+                   .groupby("sku", sort=False))
+        if names is not None:
+            agg = grouped.agg(revenue=("curr_rev", "sum"))
+            agg["product_name"] = products.lookup(agg.index, names)  # SKU spoza wymiaru → sam SKU
+        else:
+            agg = grouped.agg(product_name=("product_name", "last"), revenue=("curr_rev", "sum"))
+        agg = agg.sort_values("revenue", ascending=False)
+
+        self.skus = agg.index.to_numpy(dtype=object)
+        self.names = agg["product_name"].fillna("").astype(str).to_numpy(dtype=object)
+        self.revenue = agg["revenue"].to_numpy(dtype=float)
+        self._pos = {s: i for i, s in enumerate(self.skus)}
+
+        sku_norm = [normalize(s) for s in self.skus]
+        name_norm = [normalize(n) for n in self.names]
+        self._sku_blob, self._sku_starts = _blob(sku_norm)
+        self._name_blob, self._name_starts = _blob(name_norm)
+
+        # Prefiks SKU: posortowane klucze + pozycje
+        order = np.argsort(np.asarray(sku_norm, dtype=str), kind="stable")
+        self._sku_sorted = [sku_norm[i] for i in order]
+        self._sku_sorted_pos = order
+
+        # Indeks odwrócony token → pozycje; posortowana lista tokenów pod wyszukiwanie prefiksowe
+        postings: dict[str, list[int]] = {}
+        for i, (s, n) in enumerate(zip(self.skus, self.names)):
+            for tok in set(tokenize(s) + tokenize(n)):
+                postings.setdefault(tok, []).append(i)
+        self._tokens = sorted(postings)
+        self._postings = {t: np.asarray(p, dtype=np.intp) for t, p in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.skus)
+
+    def __contains__(self, sku) -> bool:
+        return sku in self._pos
+
+    def label(self, sku) -> str:
+        i = self._pos.get(sku)
+        return str(sku) if i is None or self.names[i] in ("", str(sku)) else f"{sku} — {self.names[i]}"
+
+    def top(self, n: int) -> list:
+        return self.skus[:n].tolist()
+
+    def _prefix_range(self, keys: list[str], prefix: str) -> tuple[int, int]:
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + "\uffff")
+        return lo, hi
+
+    def _token_prefix_hits(self, tok: str) -> np.ndarray:
+        lo, hi = self._prefix_range(self._tokens, tok)
+        if lo == hi:
+            return np.empty(0, dtype=np.intp)
+        if hi - lo == 1:
+            return self._postings[self._tokens[lo]]
+        return np.unique(np.concatenate([self._postings[t] for t in self._tokens[lo:hi]]))
+
+    def search(self, query: str, limit: int = 200, offset: int = 0) -> tuple[int, list]:
+        """(liczba wszystkich trafień, strona SKU) — ranking: punktacja, potem sprzedaż."""
+        q = normalize(query).strip()
+        if not q:
+            return len(self.skus), self.skus[offset:offset + limit].tolist()
+
+        score = np.zeros(len(self.skus), dtype=np.int16)
+
+        score[_substring_hits(self._name_blob, self._name_starts, q)] = SCORE_NAME_SUBSTRING
+        score[_substring_hits(self._sku_blob, self._sku_starts, q)] = SCORE_SKU_SUBSTRING
+
+        tokens = _TOKEN_RE.findall(q)
+        if tokens:
+            hits = self._token_prefix_hits(tokens[0])
+            for tok in tokens[1:]:
+                hits = np.intersect1d(hits, self._token_prefix_hits(tok), assume_unique=True)
+            score[hits] = np.maximum(score[hits], SCORE_TOKENS_PREFIX)
+
+        lo, hi = self._prefix_range(self._sku_sorted, q)
+        pref = self._sku_sorted_pos[lo:hi]
+        score[pref] = np.maximum(score[pref], SCORE_SKU_PREFIX)
+        score[pref[[k == q for k in self._sku_sorted[lo:hi]]]] = SCORE_SKU_EXACT
+
+        matched = np.flatnonzero(score)
+        # pozycje są już posortowane wg sprzedaży malejąco → stabilne sortowanie po punktach wystarcza
+        ranked = matched[np.argsort(-score[matched], kind="stable")]
+        return len(ranked), self.skus[ranked[offset:offset + limit]].tolist()